@@ -70,9 +70,9 @@ def clean_all_templates():
     # 4. 清理雲端資料庫（如果可用）
     try:
         import streamlit as st
-        from core.turso_database import TursoDatabase
+        from core.resources import get_turso_database
         
-        turso_db = TursoDatabase()
+        turso_db = get_turso_database()
         if turso_db.is_cloud_mode():
             # 獲取所有比對範本
             templates = turso_db.get_comparison_templates()
@@ -0,0 +1,150 @@
+import os
+import re
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from core.template_engine import get_template_index, prepare_values, render_to_bytes, render_text
+from core.zip_packager import ZipPackager
+from core.output_store import get_output_store
+
+# --- 批次生成設定 ---
+INVALID_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\r\n\t]')
+
+
+def load_batch_rows(source) -> List[Dict[str, str]]:
+    """
+    讀取批次資料表（Excel 或 CSV），第一列為欄位名稱，其後每一列為一組欄位值。
+    source 可為檔案路徑或上傳的檔案物件；完全空白的列會被略過。
+    """
+    import pandas as pd
+
+    name = getattr(source, "name", source)
+    ext = os.path.splitext(str(name))[1].lower()
+    if ext == ".csv":
+        df = pd.read_csv(source, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    elif ext in (".xlsx", ".xls"):
+        df = pd.read_excel(source, dtype=str, keep_default_na=False)
+    else:
+        raise ValueError(f"不支援的資料表格式: {ext}")
+
+    columns = [str(column).strip() for column in df.columns]
+    rows = []
+    for record in df.itertuples(index=False, name=None):
+        row = {column: str(value).strip() for column, value in zip(columns, record)}
+        if any(row.values()):
+            rows.append(row)
+    return rows
+
+
+def sanitize_filename(name: str) -> str:
+    """移除檔名中不合法的字元"""
+    cleaned = INVALID_FILENAME_CHARS.sub("_", name).strip(" .")
+    return cleaned or "document"
+
+
+def build_output_name(pattern: str, values: Dict[str, str], template_path: str, with_template_name: bool) -> str:
+    """依檔名格式（例如 {{客戶名稱}}_{{日期}}）產生輸出檔名，不含副檔名"""
+    base = sanitize_filename(render_text(pattern, values)) if pattern else ""
+    template_base = os.path.splitext(os.path.basename(template_path))[0]
+    if not base:
+        return template_base
+    return f"{base}_{template_base}" if with_template_name else base
+
+
+def _render_job(job: Dict) -> bytes:
+    """子程序執行的單一渲染工作（必須是模組層級函式才能被 pickle）"""
+    return render_to_bytes(job["template_path"], job["index"], job["values"])
+
+
+def plan_batch_jobs(template_paths: List[str], rows: List[Dict[str, str]], field_definitions: List[Dict],
+                    filename_pattern: str) -> List[Dict]:
+    """
+    展開「資料列 × 範本檔案」的渲染工作。
+    空白儲存格使用欄位定義的預設值；範本索引在主程序先編譯好再交給子程序。
+    """
+    defaults = {field['name']: field.get('default_value') or '' for field in field_definitions or []}
+    indexes = {path: get_template_index(path) for path in template_paths}
+    with_template_name = len(template_paths) > 1
+
+    jobs = []
+    for row_number, row in enumerate(rows, start=1):
+        values = dict(defaults)
+        values.update({key: value for key, value in row.items() if value != ''})
+        values = prepare_values(values)
+        for template_path in template_paths:
+            name = build_output_name(filename_pattern, values, template_path, with_template_name)
+            jobs.append({
+                "row": row_number,
+                "template_path": template_path,
+                "index": indexes[template_path],
+                "values": values,
+                "member_name": name + os.path.splitext(template_path)[1].lower(),
+            })
+    return jobs
+
+
+def generate_batch(template_paths: List[str], rows: List[Dict[str, str]], field_definitions: List[Dict] = None,
+                   filename_pattern: str = "", max_workers: Optional[int] = None,
+                   progress_callback: Optional[Callable[[int, int, str], None]] = None) -> Dict:
+    """
+    批次（合併列印）生成文件：每一列資料 × 每一個範本檔案各產生一份文件，
+    以多個 CPU 核心平行渲染，完成的文件立即寫入單一 ZIP 壓縮檔，
+    並透過 progress_callback(已完成, 總數, 檔名) 回報進度。
+    """
+    jobs = plan_batch_jobs(template_paths, rows, field_definitions, filename_pattern)
+    total = len(jobs)
+    output_id, archive_path = get_output_store().new_entry(f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+    result = {"output_id": output_id, "archive_path": archive_path, "files": [], "errors": [], "total": total}
+
+    workers = min(max_workers or os.cpu_count() or 1, max(total, 1))
+    done = 0
+
+    with ZipPackager(archive_path) as packager:
+
+        def record(job, data=None, error=None):
+            nonlocal done
+            done += 1
+            if error is None:
+                result["files"].append(packager.add_bytes(job["member_name"], data))
+            else:
+                result["errors"].append({
+                    "row": job["row"],
+                    "template": os.path.basename(job["template_path"]),
+                    "error": str(error),
+                })
+            if progress_callback:
+                progress_callback(done, total, job["member_name"])
+
+        if workers <= 1:
+            for job in jobs:
+                try:
+                    record(job, _render_job(job))
+                except Exception as e:
+                    record(job, error=e)
+            return result
+
+        # 使用 spawn 避免在多執行緒的 Streamlit 伺服器中 fork；
+        # 同時進行中的工作數量有上限，讓記憶體用量維持固定
+        context = multiprocessing.get_context("spawn")
+        max_in_flight = workers * 2
+        pending_jobs = iter(jobs)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            in_flight = {}
+            for job in itertools.islice(pending_jobs, max_in_flight):
+                in_flight[executor.submit(_render_job, job)] = job
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = in_flight.pop(future)
+                    try:
+                        record(job, future.result())
+                    except Exception as e:
+                        record(job, error=e)
+                    next_job = next(pending_jobs, None)
+                    if next_job is not None:
+                        in_flight[executor.submit(_render_job, next_job)] = next_job
+
+    return result
@@ -1,73 +1,241 @@
 import os
 import json
+import queue
+import atexit
 import sqlite3
+import threading
+from contextlib import contextmanager
 from typing import List, Dict
 from pathlib import Path
 
+from core.template_inventory import extract_inventory
+from core.migrations import AddColumn, LOCAL, TURSO, drop_change_log_statements, migrate_sqlite, run_once
+
 # --- 本地 SQLite 資料庫設定 ---
 ROOT_DIR = Path(__file__).parent.parent
 DB_PATH = ROOT_DIR / "data" / "templates.db"
 
+# --- 連線池設定 ---
+POOL_SIZE = 8                       # 閒置連線保留數量
+BUSY_TIMEOUT_MS = 5000              # 遇到鎖定時等待的毫秒數
+MMAP_SIZE = 64 * 1024 * 1024        # 記憶體映射讀取大小
+CACHED_STATEMENTS = 256             # 每條連線快取的預先編譯語句數量
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",   # 讀寫可同時進行
+    "PRAGMA synchronous = NORMAL;", # WAL 模式下仍可保證一致性，寫入較快
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};",
+    f"PRAGMA mmap_size = {MMAP_SIZE};",
+    "PRAGMA foreign_keys = ON;",
+)
+
+class ConnectionPool:
+    """
+    本地 SQLite 連線池。
+    連線建立時只設定一次 PRAGMA，用完歸還重複使用；超過保留數量的連線直接關閉。
+    """
+
+    def __init__(self, db_path, size: int = POOL_SIZE):
+        self.db_path = Path(db_path)
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._closed = False
+        os.makedirs(self.db_path.parent, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn: sqlite3.Connection):
+        with self._lock:
+            if not self._closed:
+                try:
+                    self._idle.put_nowait(conn)
+                    return
+                except queue.Full:
+                    pass
+        conn.close()
+
+    def close(self):
+        """關閉所有閒置連線；使用中的連線會在歸還時關閉"""
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def _get_pool() -> ConnectionPool:
+    key = str(DB_PATH)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(DB_PATH)
+        return pool
+
+@contextmanager
 def get_db_connection():
-    """建立並返回本地 SQLite 資料庫連線，啟用外鍵約束"""
-    os.makedirs(DB_PATH.parent, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+    """
+    從連線池取得本地 SQLite 連線（WAL、busy_timeout、外鍵約束已啟用）。
+    離開 with 區塊時自動 commit（發生例外則 rollback），並將連線歸還連線池。
+    """
+    pool = _get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+def close_db_connections():
+    """關閉所有連線池中的連線（程式結束或需要釋放資料庫檔案時使用）"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+atexit.register(close_db_connections)
+
+INSERT_FIELD_SQL = """
+    INSERT INTO field_definitions (group_id, name, default_value, description, dropdown_options, sort_order)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+UPDATE_FIELD_SQL = """
+    UPDATE field_definitions
+    SET name = ?, default_value = ?, description = ?, dropdown_options = ?, sort_order = ?
+    WHERE id = ?
+"""
+
+def _template_inventory(file_path: str, file_info: Dict = None):
+    """取得要寫入資料庫的 (佔位符 JSON, 內容雜湊)；無法解析時回傳 (None, None)"""
+    if file_info and file_info.get('placeholders') is not None:
+        return json.dumps(file_info['placeholders'], ensure_ascii=False), file_info.get('content_hash')
+    try:
+        inventory = extract_inventory(file_path)
+        return json.dumps(inventory['placeholders'], ensure_ascii=False), inventory['content_hash']
+    except Exception:
+        return None, None
+
+def _file_row(row) -> Dict:
+    """將 template_files 資料列轉為 dict，並把佔位符 JSON 解析回 list"""
+    file_info = dict(row)
+    if 'placeholders' in file_info:
+        file_info['placeholders'] = json.loads(file_info['placeholders']) if file_info['placeholders'] else None
+    return file_info
+
+# --- 資料庫結構遷移（本地 templates.db 與 Turso 共用） ---
+# 本地副本同步的表格，依外鍵關係排列（父表在前）
+REPLICATED_TABLES = ("template_groups", "comparison_templates", "template_files", "field_definitions")
+
+TEMPLATE_MIGRATIONS = [
+    {
+        'version': 1,
+        'description': "建立範本群組、範本檔案、欄位定義與比對範本表格",
+        'statements': [
+            """
+            CREATE TABLE IF NOT EXISTS template_groups (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                source_excel_path TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS template_files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                filepath TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                file_size INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (group_id) REFERENCES template_groups (id) ON DELETE CASCADE
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS field_definitions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                default_value TEXT,
+                description TEXT,
+                dropdown_options TEXT, -- 儲存為 JSON 字串
+                sort_order INTEGER,
+                FOREIGN KEY (group_id) REFERENCES template_groups (id) ON DELETE CASCADE
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS comparison_templates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                filename TEXT NOT NULL,
+                filepath TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """,
+        ],
+    },
+    {
+        'version': 2,
+        'description': "範本檔案記錄佔位符清單（JSON）與內容雜湊",
+        'statements': [
+            AddColumn("template_files", "placeholders", "TEXT"),
+            AddColumn("template_files", "content_hash", "TEXT"),
+        ],
+    },
+    {
+        'version': 3,
+        'description': "常用查詢欄位的索引",
+        'statements': [
+            "CREATE INDEX IF NOT EXISTS idx_template_files_group ON template_files (group_id);",
+            "CREATE INDEX IF NOT EXISTS idx_field_definitions_group_order ON field_definitions (group_id, sort_order);",
+        ],
+    },
+    {
+        # 變更記錄改由本地副本啟用時自行建立（見 turso_replica），保留版本號以維持版本順序
+        'version': 4,
+        'description': "（已停用）雲端變更記錄",
+        'targets': (TURSO,),
+        'statements': [],
+    },
+    {
+        'version': 5,
+        'description': "移除 v4 在所有部署上建立的變更記錄觸發器與記錄表（未啟用本地副本時沒有讀取者，只會無限成長）",
+        'targets': (TURSO,),
+        'statements': drop_change_log_statements(REPLICATED_TABLES),
+    },
+]
 
 def init_database():
-    """初始化本地 SQLite 資料庫和表格"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        # 建立範本群組表格
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS template_groups (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            source_excel_path TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """)
-        # 建立範本檔案表格
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS template_files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            group_id INTEGER NOT NULL,
-            filename TEXT NOT NULL,
-            filepath TEXT NOT NULL,
-            file_type TEXT NOT NULL,
-            file_size INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (group_id) REFERENCES template_groups (id) ON DELETE CASCADE
-        );
-        """)
-        # 建立欄位定義表格
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS field_definitions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            group_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            default_value TEXT,
-            description TEXT,
-            dropdown_options TEXT, -- 儲存為 JSON 字串
-            sort_order INTEGER,
-            FOREIGN KEY (group_id) REFERENCES template_groups (id) ON DELETE CASCADE
-        );
-        """)
-        # 建立比對範本表格
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS comparison_templates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            filename TEXT NOT NULL,
-            filepath TEXT NOT NULL,
-            file_type TEXT NOT NULL,
-            file_size INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """)
-        conn.commit()
+    """初始化本地 SQLite 資料庫和表格（依版本套用尚未執行的遷移，每個行程只檢查一次）"""
+    def apply():
+        with get_db_connection() as conn:
+            migrate_sqlite(conn, TEMPLATE_MIGRATIONS)
+
+    run_once((LOCAL, str(DB_PATH)), apply)
 
 def create_template_group(name: str, source_excel_path: str, field_definitions: List[Dict], template_files: List[str]):
     """一次性創建範本群組、欄位定義和範本檔案紀錄"""
@@ -78,24 +246,22 @@ def create_template_group(name: str, source_excel_path: str, field_definitions:
             cursor.execute("INSERT INTO template_groups (name, source_excel_path) VALUES (?, ?)", (name, source_excel_path))
             group_id = cursor.lastrowid
             # 2. 插入欄位定義
-            for i, field in enumerate(field_definitions):
-                dropdown_json = json.dumps(field.get('dropdown_options', []))
-                cursor.execute(
-                    """
-                    INSERT INTO field_definitions (group_id, name, default_value, description, dropdown_options, sort_order)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (group_id, field['name'], field.get('default_value', ''), field.get('description', ''), dropdown_json, i)
-                )
+            cursor.executemany(
+                INSERT_FIELD_SQL,
+                [(group_id, *field_row_values(field), i) for i, field in enumerate(field_definitions)]
+            )
             # 3. 插入範本檔案
+            file_rows = []
             for file_path in template_files:
                 filename = os.path.basename(file_path)
                 file_type = os.path.splitext(filename)[1].lower().replace('.', '')
                 file_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
-                cursor.execute(
-                    "INSERT INTO template_files (group_id, filename, filepath, file_type, file_size) VALUES (?, ?, ?, ?, ?)",
-                    (group_id, filename, file_path, file_type, file_size)
-                )
+                placeholders, content_hash = _template_inventory(file_path)
+                file_rows.append((group_id, filename, file_path, file_type, file_size, placeholders, content_hash))
+            cursor.executemany(
+                "INSERT INTO template_files (group_id, filename, filepath, file_type, file_size, placeholders, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                file_rows
+            )
             conn.commit()
             return group_id
         except sqlite3.IntegrityError:
@@ -121,12 +287,64 @@ def get_all_template_groups() -> List[Dict]:
         groups = [dict(row) for row in cursor.fetchall()]
         return groups
 
+GROUP_SUMMARY_SQL = """
+    SELECT
+        tg.id,
+        tg.name,
+        tg.source_excel_path,
+        tg.created_at,
+        COALESCE(tf.file_count, 0) AS file_count,
+        COALESCE(tf.total_size, 0) AS total_size
+    FROM template_groups tg
+    LEFT JOIN (
+        SELECT group_id, COUNT(*) AS file_count, SUM(file_size) AS total_size
+        FROM template_files
+        GROUP BY group_id
+    ) tf ON tf.group_id = tg.id
+    ORDER BY tg.created_at DESC;
+"""
+ALL_FIELDS_SQL = """
+    SELECT group_id, name, default_value, description, dropdown_options
+    FROM field_definitions
+    ORDER BY group_id, sort_order;
+"""
+
+def attach_group_fields(groups: List[Dict], field_rows) -> List[Dict]:
+    """將 (group_id, name, default_value, description, dropdown_options) 資料列依群組放入 groups[i]['fields']"""
+    by_group = {group['id']: group for group in groups}
+    for group in groups:
+        group['fields'] = []
+    for group_id, name, default_value, description, dropdown_options in field_rows:
+        group = by_group.get(group_id)
+        if group is not None:
+            group['fields'].append({
+                'name': name,
+                'default_value': default_value,
+                'description': description,
+                'dropdown_options': json.loads(dropdown_options) if dropdown_options else [],
+            })
+    return groups
+
+def get_template_groups_summary(include_fields: bool = False) -> List[Dict]:
+    """
+    一次取得所有範本群組及其檔案數量、檔案總大小（file_count、total_size），
+    include_fields 為 True 時一併附上各群組的欄位定義，避免逐一查詢每個群組。
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(GROUP_SUMMARY_SQL)
+        groups = [dict(row) for row in cursor.fetchall()]
+        if include_fields:
+            cursor.execute(ALL_FIELDS_SQL)
+            attach_group_fields(groups, (tuple(row) for row in cursor.fetchall()))
+        return groups
+
 def get_template_files(group_id: int) -> List[Dict]:
     """根據群組ID獲取所有範本檔案"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT id, filename, filepath, file_type, file_size FROM template_files WHERE group_id = ?", (group_id,))
-        files = [dict(row) for row in cursor.fetchall()]
+        cursor.execute("SELECT id, filename, filepath, file_type, file_size, placeholders, content_hash FROM template_files WHERE group_id = ?", (group_id,))
+        files = [_file_row(row) for row in cursor.fetchall()]
         return files
 
 def get_field_definitions(group_id: int) -> List[Dict]:
@@ -142,23 +360,56 @@ def get_field_definitions(group_id: int) -> List[Dict]:
             fields.append(field)
         return fields
 
+def field_row_values(field: Dict) -> tuple:
+    """欄位定義寫入資料庫的 (name, default_value, description, dropdown_options JSON)"""
+    return (
+        field['name'],
+        field.get('default_value', ''),
+        field.get('description', ''),
+        json.dumps(field.get('dropdown_options', [])),
+    )
+
+def diff_field_definitions(existing_rows: List[Dict], fields: List[Dict]) -> Dict[str, list]:
+    """
+    比較資料庫中的欄位定義與新的欄位清單，只產生有變動的操作。
+    existing_rows 需包含 id、name、default_value、description、dropdown_options（JSON 字串）、sort_order；
+    依欄位名稱配對（同名欄位依出現順序配對），回傳：
+    insert: [(name, default_value, description, dropdown_json, sort_order)]
+    update: [(name, default_value, description, dropdown_json, sort_order, id)]
+    delete: [id]
+    """
+    remaining = {}
+    for row in sorted(existing_rows, key=lambda r: (r['sort_order'] is None, r['sort_order'], r['id'])):
+        remaining.setdefault(row['name'], []).append(row)
+
+    inserts, updates = [], []
+    for i, field in enumerate(fields):
+        values = field_row_values(field)
+        candidates = remaining.get(field['name'])
+        if not candidates:
+            inserts.append((*values, i))
+            continue
+        row = candidates.pop(0)
+        current = (row['name'], row['default_value'] or '', row['description'] or '', row['dropdown_options'] or '[]')
+        if current != (values[0], values[1] or '', values[2] or '', values[3]) or row['sort_order'] != i:
+            updates.append((*values, i, row['id']))
+
+    deletes = [row['id'] for rows in remaining.values() for row in rows]
+    return {'insert': inserts, 'update': updates, 'delete': deletes}
+
 def update_field_definitions(group_id: int, fields: List[Dict]) -> bool:
-    """更新指定群組的欄位定義"""
+    """更新指定群組的欄位定義（只寫入新增、修改、刪除或順序變動的欄位）"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
         try:
-            # 刪除舊的定義
-            cursor.execute("DELETE FROM field_definitions WHERE group_id = ?", (group_id,))
-            # 插入新的定義
-            for i, field in enumerate(fields):
-                dropdown_json = json.dumps(field.get('dropdown_options', []))
-                cursor.execute(
-                    """
-                    INSERT INTO field_definitions (group_id, name, default_value, description, dropdown_options, sort_order)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (group_id, field['name'], field.get('default_value', ''), field.get('description', ''), dropdown_json, i)
-                )
+            cursor.execute(
+                "SELECT id, name, default_value, description, dropdown_options, sort_order FROM field_definitions WHERE group_id = ?",
+                (group_id,)
+            )
+            changes = diff_field_definitions([dict(row) for row in cursor.fetchall()], fields)
+            cursor.executemany("DELETE FROM field_definitions WHERE id = ?", [(row_id,) for row_id in changes['delete']])
+            cursor.executemany(UPDATE_FIELD_SQL, changes['update'])
+            cursor.executemany(INSERT_FIELD_SQL, [(group_id, *row) for row in changes['insert']])
             conn.commit()
             return True
         except Exception:
@@ -262,9 +513,10 @@ def add_template_file(group_id: int, file_info: Dict) -> bool:
     with get_db_connection() as conn:
         cursor = conn.cursor()
         try:
+            placeholders, content_hash = _template_inventory(file_info['filepath'], file_info)
             cursor.execute(
-                "INSERT INTO template_files (group_id, filename, filepath, file_type, file_size) VALUES (?, ?, ?, ?, ?)",
-                (group_id, file_info['filename'], file_info['filepath'], file_info['file_type'], file_info.get('file_size', 0))
+                "INSERT INTO template_files (group_id, filename, filepath, file_type, file_size, placeholders, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (group_id, file_info['filename'], file_info['filepath'], file_info['file_type'], file_info.get('file_size', 0), placeholders, content_hash)
             )
             conn.commit()
             return True
@@ -0,0 +1,142 @@
+import asyncio
+import random
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from libsql_client import LibsqlError, ResultSet, Row, Statement
+
+# --- 離線測試用的模擬 Turso client ---
+# URL 格式：fake:///資料庫路徑?latency_ms=50&jitter_ms=20&failure_rate=0.1&seed=1
+# 每次 execute / batch 視為一次網路往返：先等待 latency + 隨機 jitter，再依 failure_rate 隨機失敗。
+FAKE_SCHEME = "fake"
+
+
+class RoundTripStats:
+    """統計往返次數、語句數、模擬失敗次數與累計等待時間（同一個資料庫的所有 client 共用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.round_trips = 0
+            self.statements = 0
+            self.failures = 0
+            self.latency = 0.0
+
+    def record(self, statements: int, latency: float, failed: bool):
+        with self._lock:
+            self.round_trips += 1
+            self.statements += statements
+            self.latency += latency
+            if failed:
+                self.failures += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'round_trips': self.round_trips,
+                'statements': self.statements,
+                'failures': self.failures,
+                'latency': self.latency,
+            }
+
+
+_stats: Dict[str, RoundTripStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_fake_stats(path: str) -> RoundTripStats:
+    """取得指定資料庫檔案的往返統計"""
+    with _stats_lock:
+        return _stats.setdefault(str(path), RoundTripStats())
+
+
+class FakeLibsqlClient:
+    """
+    以本地 SQLite 檔案實作 libsql client 的 execute / batch / close，
+    回傳與 libsql_client 相同的 ResultSet 與 LibsqlError，可在沒有 Turso 的環境下執行與量測雲端程式路徑。
+    模擬失敗時拋出 ConnectionError（連線層級錯誤），與真實網路中斷的處理方式相同。
+    """
+
+    def __init__(self, path: str, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.path = str(path)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.stats = get_fake_stats(self.path)
+        self._random = random.Random(seed)
+        self._closed = False
+        self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=5)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def _round_trip(self, statements: int):
+        """模擬一次網路往返的延遲與失敗"""
+        if self._closed:
+            raise LibsqlError("The client was closed", "CLIENT_CLOSED")
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        failed = self.failure_rate > 0 and self._random.random() < self.failure_rate
+        self.stats.record(statements, delay, failed)
+        if failed:
+            raise ConnectionError("模擬的網路錯誤")
+
+    def _execute_stmt(self, stmt, args=None) -> ResultSet:
+        stmt = Statement.convert(stmt, args)
+        sql_args = stmt.args if stmt.args is not None else ()
+        if isinstance(sql_args, dict):
+            sql_args = {key.lstrip(":@$"): value for key, value in sql_args.items()}
+        try:
+            cursor = self._db.execute(stmt.sql, sql_args)
+            sql_rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            raise LibsqlError(str(e), getattr(e, "sqlite_errorname", "SQLITE")) from e
+        columns = tuple(desc[0] for desc in cursor.description or ())
+        column_idxs = {column: idx for idx, column in enumerate(columns)}
+        rows = [Row(column_idxs, sql_row) for sql_row in sql_rows]
+        return ResultSet(columns, rows, cursor.rowcount, cursor.lastrowid)
+
+    async def execute(self, stmt, args=None) -> ResultSet:
+        await self._round_trip(1)
+        return self._execute_stmt(stmt, args)
+
+    async def batch(self, stmts: List) -> List[ResultSet]:
+        """與 libsql 相同，批次在單一交易中執行，任何一句失敗則全部回滾"""
+        await self._round_trip(len(stmts))
+        self._db.execute("BEGIN")
+        try:
+            results = [self._execute_stmt(stmt) for stmt in stmts]
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        return results
+
+    async def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._db.close()
+
+
+def create_fake_client(url: str, auth_token: Optional[str] = None, **overrides) -> FakeLibsqlClient:
+    """由 fake:// URL 建立模擬 client；參數可由查詢字串或 overrides 指定"""
+    parsed = urlparse(url)
+    if parsed.scheme != FAKE_SCHEME:
+        raise LibsqlError(f"Unsupported URL scheme {parsed.scheme!r}", "URL_SCHEME_NOT_SUPPORTED")
+    query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+    options = {
+        'latency': float(query.get('latency_ms', 0)) / 1000,
+        'jitter': float(query.get('jitter_ms', 0)) / 1000,
+        'failure_rate': float(query.get('failure_rate', 0)),
+        'seed': int(query['seed']) if 'seed' in query else None,
+    }
+    options.update(overrides)
+    return FakeLibsqlClient(parsed.path, **options)
@@ -0,0 +1,145 @@
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+from core.template_engine import compute_file_hash
+
+# --- 欄位定義 Excel 解析設定 ---
+# 第一欄為欄位名稱，第二欄為預設值，第三欄為說明；第一列為標題列
+FIELD_COLUMNS = 3
+DROPDOWN_TRIGGERS = ("這遠可以做成下拉式選單", "這邊可以做成下拉式選單")
+NUMBERED_OPTION_PATTERN = re.compile(r'\d+\.|\d+\s')
+PARSE_CACHE_MAX_ENTRIES = 32   # 依內容雜湊保留的解析結果數量上限（LRU）
+
+_parse_cache = OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+
+def _cell_text(value) -> str:
+    """將儲存格值轉為去除空白的字串，空儲存格回傳空字串"""
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def extract_dropdown_options(description: str) -> List[str]:
+    """從說明中提取下拉選單選項（說明需包含觸發詞）"""
+    if not any(trigger in description for trigger in DROPDOWN_TRIGGERS):
+        return []
+
+    clean_desc = description
+    for trigger in DROPDOWN_TRIGGERS:
+        clean_desc = clean_desc.replace(trigger, "")
+    clean_desc = clean_desc.strip()
+
+    # 先按換行符分割，無效時再以「1. xxx」或「1 xxx」的編號分割
+    options = [opt.strip() for opt in clean_desc.split('\n') if opt.strip()]
+    if len(options) <= 1:
+        options = [opt.strip() for opt in NUMBERED_OPTION_PATTERN.split(clean_desc) if opt.strip()]
+    return options
+
+
+def _iter_rows(excel_path):
+    """逐列讀取第一個工作表的前三欄；.xlsx 使用 openpyxl 唯讀串流，其他格式退回 pandas"""
+    ext = os.path.splitext(str(excel_path))[1].lower()
+    if ext in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(excel_path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            for row in sheet.iter_rows(max_col=FIELD_COLUMNS, values_only=True):
+                yield row
+        finally:
+            workbook.close()
+    else:
+        import pandas as pd
+
+        df = pd.read_excel(excel_path, header=None, dtype=object).iloc[:, :FIELD_COLUMNS]
+        df = df.where(df.notna(), None)
+        yield from df.itertuples(index=False, name=None)
+
+
+def _new_diagnostics(errors: List[str] = None) -> Dict:
+    """建立解析診斷資訊：讀取列數、略過的列號、重複欄位名稱與錯誤訊息"""
+    return {
+        'rows_read': 0,
+        'skipped_rows': [],
+        'duplicate_names': [],
+        'errors': list(errors or []),
+        'cached': False,
+        'elapsed': 0.0,
+    }
+
+
+def _parse_rows(excel_path) -> Dict:
+    fields = []
+    diagnostics = _new_diagnostics()
+    seen = set()
+    for row_number, row in enumerate(_iter_rows(excel_path), start=1):
+        diagnostics['rows_read'] += 1
+        # 跳過第一列（標題列）
+        if row_number == 1:
+            continue
+
+        cells = list(row) + [None] * (FIELD_COLUMNS - len(row))
+        field_name = _cell_text(cells[0])
+        if not field_name or field_name == 'nan':
+            if any(_cell_text(cell) for cell in cells[1:]):
+                diagnostics['skipped_rows'].append(row_number)
+            continue
+        if field_name in seen:
+            diagnostics['duplicate_names'].append(field_name)
+        seen.add(field_name)
+
+        description = _cell_text(cells[2])
+        fields.append({
+            'name': field_name,
+            'default_value': _cell_text(cells[1]),
+            'description': description,
+            'dropdown_options': extract_dropdown_options(description),
+        })
+
+    if diagnostics['rows_read'] == 0:
+        diagnostics['errors'].append("Excel 檔案是空的")
+    elif not fields:
+        diagnostics['errors'].append("未找到任何有效的欄位定義")
+    return {'fields': fields, 'diagnostics': diagnostics}
+
+
+def parse_field_definitions(excel_path) -> Dict:
+    """
+    解析欄位定義 Excel，不依賴 Streamlit，可在批次子程序中使用。
+    回傳 {'fields': [...], 'diagnostics': {...}}；結果依檔案內容雜湊快取，
+    同一份檔案重新解析時直接回傳（diagnostics['cached'] 為 True）。
+    """
+    if not os.path.exists(excel_path):
+        return {'fields': [], 'diagnostics': _new_diagnostics([f"Excel 檔案不存在：{excel_path}"])}
+
+    content_hash = compute_file_hash(excel_path)
+    with _parse_cache_lock:
+        cached = _parse_cache.get(content_hash)
+        if cached is not None:
+            _parse_cache.move_to_end(content_hash)
+    if cached is not None:
+        result = copy.deepcopy(cached)
+        result['diagnostics'].update(cached=True, elapsed=0.0)
+        return result
+
+    started = time.perf_counter()
+    try:
+        result = _parse_rows(excel_path)
+    except Exception as e:
+        return {'fields': [], 'diagnostics': _new_diagnostics([f"無法讀取 Excel 檔案：{str(e)}"])}
+    result['diagnostics'].update(content_hash=content_hash, elapsed=time.perf_counter() - started)
+
+    with _parse_cache_lock:
+        _parse_cache[content_hash] = copy.deepcopy(result)
+        _parse_cache.move_to_end(content_hash)
+        while len(_parse_cache) > PARSE_CACHE_MAX_ENTRIES:
+            _parse_cache.popitem(last=False)
+    return result
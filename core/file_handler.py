@@ -1,10 +1,11 @@
+import io
 import os
-import pandas as pd
 from datetime import datetime
 import streamlit as st
-from docx import Document
-from openpyxl import load_workbook
-import re
+from core.template_engine import compute_file_hash, get_template_index, prepare_values, render_to_bytes
+from core.output_store import get_output_store
+from core.field_parser import parse_field_definitions
+from core.render_cache import get_render_cache, make_cache_key
 
 def get_file_type(filename):
     """根據副檔名獲取文件類型"""
@@ -26,129 +27,80 @@ def save_uploaded_file(uploaded_file, directory):
 def parse_excel_fields(excel_path):
     """
     解析Excel欄位，並支援從第三欄的說明中提取下拉選單選項。
-    跳過第一行（標題行）。
+    跳過第一行（標題行）。解析本身由 core.field_parser 完成，這裡只負責顯示訊息。
     """
-    try:
-        # 檢查檔案是否存在
-        if not os.path.exists(excel_path):
-            st.error(f"Excel 檔案不存在：{excel_path}")
-            return []
-        
-        # 嘗試讀取 Excel 檔案
-        try:
-            df = pd.read_excel(excel_path, header=None)
-        except Exception as e:
-            st.error(f"無法讀取 Excel 檔案：{str(e)}")
-            st.info("請確認檔案格式是否為有效的 Excel 檔案 (.xlsx)")
-            return []
-        
-        if df.empty:
-            st.error("Excel 檔案是空的")
-            return []
+    result = parse_field_definitions(excel_path)
+    field_definitions = result['fields']
+    diagnostics = result['diagnostics']
+
+    for error in diagnostics['errors']:
+        st.error(error)
+    if not field_definitions:
+        st.info("請確認 Excel 檔案格式：第一欄為欄位名稱，第二欄為預設值，第三欄為說明")
+        return []
+
+    if diagnostics['cached']:
+        st.info("檔案內容未變更，使用先前的解析結果")
+    else:
+        st.info(f"成功讀取 Excel 檔案，共 {diagnostics['rows_read']} 行")
+    if diagnostics['skipped_rows']:
+        st.warning(f"以下列缺少欄位名稱，已略過：第 {', '.join(map(str, diagnostics['skipped_rows']))} 列")
+    if diagnostics['duplicate_names']:
+        st.warning(f"欄位名稱重複：{', '.join(dict.fromkeys(diagnostics['duplicate_names']))}")
+
+    st.success(f"成功解析 {len(field_definitions)} 個欄位")
+    return field_definitions
+
+
+def _render_cached(template_path, field_values):
+    """
+    渲染文件內容（bytes），以範本內容雜湊 + 欄位值查詢渲染結果快取；
+    命中時直接回傳快取內容，不重新開啟範本。
+    """
+    values = prepare_values(field_values)
+    index = get_template_index(template_path)
+    key = make_cache_key(compute_file_hash(template_path), values, index['fields'])
+    cache = get_render_cache()
+    data = cache.get(key)
+    if data is None:
+        data = render_to_bytes(template_path, index, values)
+        cache.put(key, data)
+    return data
 
-        # 顯示調試資訊
-        st.info(f"成功讀取 Excel 檔案，共 {len(df)} 行，{len(df.columns)} 欄")
-        
-        field_definitions = []
-        for index, row in df.iterrows():
-            # 跳過第一行（標題行）
-            if index == 0:
-                continue
-                
-            # 檢查第一欄（欄位名稱）
-            field_name = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else None
-            if not field_name or field_name == 'nan':
-                continue
 
-            # 檢查第二欄（預設值）
-            field_value = str(row.iloc[1]).strip() if len(row) > 1 and pd.notna(row.iloc[1]) else ""
-            
-            # 檢查第三欄（說明）
-            description = str(row.iloc[2]).strip() if len(row) > 2 and pd.notna(row.iloc[2]) else ""
-            
-            # --- 下拉選單邏輯 ---
-            dropdown_options = []
-            if "這遠可以做成下拉式選單" in description or "這邊可以做成下拉式選單" in description:
-                # 使用正則表達式或字串分割來提取選項
-                # 假設選項格式為 "1.選項一 2.選項二" 或 "選項一\n選項二"
-                # 清理觸發詞
-                clean_desc = description.replace("這遠可以做成下拉式選單", "").replace("這邊可以做成下拉式選單", "").strip()
-                
-                # 按換行符分割
-                options = [opt.strip() for opt in clean_desc.split('\n') if opt.strip()]
-                
-                # 如果換行符無效，嘗試用數字編號分割
-                if len(options) <= 1:
-                    # 使用正則表達式尋找 "1. xxx" 或 "1 xxx" 的模式
-                    options = re.split(r'\d+\.|\d+\s', clean_desc)
-                    options = [opt.strip() for opt in options if opt.strip()]
+def render_document(template_path, field_values):
+    """在記憶體中生成文件，回傳 BytesIO（互動式下載使用，不寫入磁碟）"""
+    file_type = get_file_type(os.path.basename(template_path))
+    if file_type not in ('docx', 'xlsx'):
+        st.error(f"不支援的檔案類型: {file_type}")
+        return None
 
-                if options:
-                    dropdown_options = options
-            
-            field_definitions.append({
-                'name': field_name,
-                'default_value': field_value,
-                'description': description,
-                'dropdown_options': dropdown_options # 新增欄位
-            })
-        
-        if not field_definitions:
-            st.error("未找到任何有效的欄位定義")
-            st.info("請確認 Excel 檔案格式：第一欄為欄位名稱，第二欄為預設值，第三欄為說明")
-            return []
-        
-        st.success(f"成功解析 {len(field_definitions)} 個欄位")
-        return field_definitions
-        
+    try:
+        return io.BytesIO(_render_cached(template_path, field_values))
     except Exception as e:
-        st.error(f"解析Excel欄位時發生錯誤: {e}")
-        st.info("請檢查 Excel 檔案格式是否正確")
-        return []
+        st.error(f"生成文件時發生錯誤: {e}")
+        return None
 
 
 def generate_document(template_path, field_values):
-    """根據文件類型生成文件"""
+    """根據文件類型生成文件，並保存到輸出暫存區（以唯一 ID 區隔，定期清理）"""
     file_type = get_file_type(os.path.basename(template_path))
+    if file_type not in ('docx', 'xlsx'):
+        st.error(f"不支援的檔案類型: {file_type}")
+        return None
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_dir = "generated_files"
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 創建獨一無二的檔名
     base_name = os.path.splitext(os.path.basename(template_path))[0]
     output_filename = f"{base_name}_{timestamp}.{file_type}"
-    output_path = os.path.join(output_dir, output_filename)
 
+    store = get_output_store()
+    output_id, output_path = store.new_entry(output_filename)
     try:
-        if file_type == 'docx':
-            doc = Document(template_path)
-            # 替換段落和表格中的佔位符
-            for para in doc.paragraphs:
-                for key, value in field_values.items():
-                    para.text = para.text.replace(f"{{{{{key}}}}}", str(value))
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for para in cell.paragraphs:
-                            for key, value in field_values.items():
-                                para.text = para.text.replace(f"{{{{{key}}}}}", str(value))
-            doc.save(output_path)
-        
-        elif file_type == 'xlsx':
-            workbook = load_workbook(template_path)
-            for sheet in workbook.worksheets:
-                for row in sheet.iter_rows():
-                    for cell in row:
-                        if cell.value and isinstance(cell.value, str):
-                            for key, value in field_values.items():
-                                cell.value = cell.value.replace(f"{{{{{key}}}}}", str(value))
-            workbook.save(output_path)
-        
-        else:
-            st.error(f"不支援的檔案類型: {file_type}")
-            return None
-            
+        data = _render_cached(template_path, field_values)
+        with open(output_path, "wb") as f:
+            f.write(data)
         return output_path
     except Exception as e:
+        store.discard(output_id)
         st.error(f"生成文件時發生錯誤: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,137 @@
+import threading
+from typing import Callable, Dict, List
+
+# --- 資料庫結構版本管理 ---
+# 每個遷移為 {'version': int, 'description': str, 'statements': [...], 'targets': (...)}；
+# statements 可為 SQL 字串或 AddColumn，targets 指定要套用的資料庫（'local' 本地 SQLite、'turso' 雲端）。
+# 本地 SQLite 以 PRAGMA user_version 記錄版本，Turso 以 schema_version 表格記錄。
+LOCAL = "local"
+TURSO = "turso"
+SCHEMA_VERSION_TABLE = "schema_version"
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+
+class AddColumn:
+    """新增欄位；欄位已存在時略過（舊資料庫可能已由先前的版本手動補上）"""
+
+    def __init__(self, table: str, column: str, definition: str):
+        self.table = table
+        self.column = column
+        self.definition = definition
+
+    @property
+    def sql(self) -> str:
+        return f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.definition}"
+
+    def __repr__(self):
+        return f"AddColumn({self.table}.{self.column})"
+
+
+def change_log_statements(tables, log_table: str = "_sync_changes") -> List[str]:
+    """
+    建立變更記錄表與觸發器：每次 INSERT/UPDATE/DELETE 都在 log_table 留下一筆
+    (seq, table_name, row_id, op)，供本地副本依 seq 遞增拉取變更。
+    另在 {log_table}_meta 記錄此變更記錄的識別碼（log_id），記錄表被刪除後重建時識別碼不同，
+    本地副本據此得知 seq 已重新起算。
+    """
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {log_table} ("
+        "seq INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT NOT NULL, "
+        "row_id INTEGER NOT NULL, op TEXT NOT NULL)",
+        f"CREATE TABLE IF NOT EXISTS {log_table}_meta (key TEXT PRIMARY KEY, value TEXT)",
+        f"INSERT OR IGNORE INTO {log_table}_meta (key, value) VALUES ('log_id', lower(hex(randomblob(16))))",
+    ]
+    for table in tables:
+        for op, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS {log_table}_{table}_{op.lower()} AFTER {op} ON {table} "
+                f"BEGIN INSERT INTO {log_table} (table_name, row_id, op) VALUES ('{table}', {ref}.id, '{op.lower()}'); END"
+            )
+    return statements
+
+
+def drop_change_log_statements(tables, log_table: str = "_sync_changes") -> List[str]:
+    """移除 change_log_statements 建立的觸發器、記錄表與識別碼"""
+    statements = [
+        f"DROP TRIGGER IF EXISTS {log_table}_{table}_{op}"
+        for table in tables for op in ("insert", "update", "delete")
+    ]
+    return statements + [f"DROP TABLE IF EXISTS {log_table}", f"DROP TABLE IF EXISTS {log_table}_meta"]
+
+
+def pending_migrations(migrations: List[Dict], current_version: int, target: str) -> List[Dict]:
+    """回傳版本高於目前版本、且適用於此資料庫的遷移（依版本排序）"""
+    return sorted(
+        (m for m in migrations if m['version'] > current_version and target in m.get('targets', (LOCAL, TURSO))),
+        key=lambda m: m['version']
+    )
+
+
+def latest_version(migrations: List[Dict]) -> int:
+    return max((m['version'] for m in migrations), default=0)
+
+
+def migrate_sqlite(conn, migrations: List[Dict], target: str = LOCAL) -> int:
+    """在本地 SQLite 連線上套用尚未執行的遷移，每個版本一個交易；回傳套用後的版本"""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for migration in pending_migrations(migrations, current, target):
+        # sqlite3 模組不會在 DDL 前自動開始交易，需明確 BEGIN，失敗時才能整個版本一起復原
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        try:
+            for statement in migration['statements']:
+                if isinstance(statement, AddColumn):
+                    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({statement.table})")}
+                    if statement.column in columns:
+                        continue
+                    statement = statement.sql
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(migration['version'])}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = migration['version']
+    return current
+
+
+async def migrate_libsql(client, migrations: List[Dict], target: str = TURSO) -> int:
+    """在 Turso（libsql）上套用尚未執行的遷移，版本記錄於 schema_version 表格"""
+    await client.execute(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+        "version INTEGER PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    result = await client.execute(f"SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_VERSION_TABLE}")
+    current = result.rows[0][0]
+    for migration in pending_migrations(migrations, current, target):
+        for statement in migration['statements']:
+            if isinstance(statement, AddColumn):
+                columns = {row[1] for row in (await client.execute(f"PRAGMA table_info({statement.table})")).rows}
+                if statement.column in columns:
+                    continue
+                statement = statement.sql
+            await client.execute(statement)
+        await client.execute(f"INSERT OR IGNORE INTO {SCHEMA_VERSION_TABLE} (version) VALUES (?)", [migration['version']])
+        current = migration['version']
+    return current
+
+
+def run_once(key, apply: Callable[[], object]) -> bool:
+    """
+    每個行程對同一個資料庫（key）只執行一次遷移檢查；成功後記錄，失敗則下次再試。
+    回傳此次是否實際執行。
+    """
+    with _migrated_lock:
+        if key in _migrated:
+            return False
+        apply()
+        _migrated.add(key)
+        return True
+
+
+def reset_migration_state():
+    """清除「已遷移」記錄（資料庫檔案被替換或刪除後使用）"""
+    with _migrated_lock:
+        _migrated.clear()
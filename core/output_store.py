@@ -0,0 +1,129 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+# --- 輸出暫存區設定 ---
+OUTPUT_ROOT = "generated_files"
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024   # 輸出總量上限
+DEFAULT_TTL_SECONDS = 24 * 60 * 60      # 每份輸出保留時間
+SWEEP_INTERVAL_SECONDS = 10 * 60        # 背景清理間隔
+
+
+class OutputStore:
+    """
+    生成文件的輸出暫存區。
+    每份輸出放在 {root}/{output_id}/{檔名}，以唯一 ID 避免同名覆蓋，
+    並依存活時間（TTL）與總容量淘汰最舊的輸出。
+    """
+
+    def __init__(self, root: str = OUTPUT_ROOT, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop_event = threading.Event()
+
+    def new_entry(self, filename: str) -> Tuple[str, str]:
+        """建立新的輸出項目，回傳 (output_id, 檔案路徑)；呼叫端直接寫入該路徑"""
+        output_id = uuid.uuid4().hex
+        entry_dir = os.path.join(self.root, output_id)
+        os.makedirs(entry_dir)
+        return output_id, os.path.join(entry_dir, os.path.basename(filename))
+
+    def put(self, filename: str, data: bytes) -> str:
+        """保存一份已在記憶體中的輸出，回傳 output_id"""
+        output_id, path = self.new_entry(filename)
+        with open(path, "wb") as f:
+            f.write(data)
+        return output_id
+
+    def get_path(self, output_id: str) -> Optional[str]:
+        """依 output_id 取得輸出檔案路徑，不存在或已被清除時回傳 None"""
+        entry_dir = os.path.join(self.root, os.path.basename(output_id))
+        try:
+            names = os.listdir(entry_dir)
+        except OSError:
+            return None
+        return os.path.join(entry_dir, names[0]) if names else None
+
+    def discard(self, output_id: str):
+        """刪除一份輸出（例如生成失敗時）"""
+        path = os.path.join(self.root, os.path.basename(output_id))
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def _list_entries(self) -> List[Dict]:
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        # 舊版直接放在根目錄的輸出檔也一併納入清理
+        for entry in os.scandir(self.root):
+            try:
+                mtime = entry.stat().st_mtime
+                if entry.is_dir():
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                else:
+                    size = entry.stat().st_size
+            except OSError:
+                continue
+            entries.append({'id': entry.name, 'size': size, 'mtime': mtime})
+        return entries
+
+    def sweep(self) -> int:
+        """清除過期的輸出，並在超過容量上限時由舊到新淘汰；回傳刪除的項目數"""
+        with self._lock:
+            now = time.time()
+            entries = sorted(self._list_entries(), key=lambda e: e['mtime'])
+            removed = 0
+            total = sum(e['size'] for e in entries)
+            for entry in entries:
+                expired = now - entry['mtime'] > self.ttl_seconds
+                if not expired and total <= self.max_bytes:
+                    continue
+                self.discard(entry['id'])
+                total -= entry['size']
+                removed += 1
+            return removed
+
+    def start_sweeper(self, interval: int = SWEEP_INTERVAL_SECONDS):
+        """啟動背景清理執行緒（重複呼叫不會啟動第二個）"""
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._stop_event.clear()
+            self._sweeper = threading.Thread(target=self._sweep_loop, args=(interval,),
+                                             name="output-store-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop_event.set()
+
+    def _sweep_loop(self, interval: int):
+        while not self._stop_event.is_set():
+            try:
+                self.sweep()
+            except Exception:
+                # 清理失敗不影響主程式，下個週期再試
+                pass
+            self._stop_event.wait(interval)
+
+
+_output_store = None
+_output_store_lock = threading.Lock()
+
+
+def get_output_store() -> OutputStore:
+    """取得全域輸出暫存區，第一次使用時啟動背景清理"""
+    global _output_store
+    with _output_store_lock:
+        if _output_store is None:
+            _output_store = OutputStore()
+            _output_store.start_sweeper()
+        return _output_store
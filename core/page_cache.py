@@ -0,0 +1,151 @@
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image
+
+from core.pdf_rasterizer import RASTER_DPI, render_page
+
+# --- PDF 頁面影像金字塔設定 ---
+# 原始 PDF 是唯一保存的來源；各解析度的頁面影像在第一次需要時才產生，存入有容量上限的磁碟快取。
+PAGE_LEVELS = {
+    'thumb': 36,               # 縮圖（頁面清單）
+    'screen': 110,             # 瀏覽用
+    'annotation': RASTER_DPI,  # 標記用（與舊版 200 dpi 頁面影像相同解析度）
+}
+PAGE_CACHE_DIR = "data/pdf_page_cache"
+PAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+PAGE_IMAGE_FORMAT = "WEBP"
+PAGE_IMAGE_QUALITY = {'thumb': 70, 'screen': 80, 'annotation': 90}
+POINTS_PER_INCH = 72.0
+TEMP_SUFFIX = ".tmp"
+
+
+def pixels_to_points(coordinates, dpi: float = RASTER_DPI):
+    """將 dpi 解析度影像上的像素座標轉為 PDF 座標（point，1/72 英吋）"""
+    scale = POINTS_PER_INCH / dpi
+    return tuple(value * scale for value in coordinates)
+
+
+def points_to_pixels(coordinates, dpi: float = RASTER_DPI):
+    """將 PDF 座標（point）轉為 dpi 解析度影像上的像素座標"""
+    scale = dpi / POINTS_PER_INCH
+    return tuple(value * scale for value in coordinates)
+
+
+class PageImageCache:
+    """
+    依 (範本, 頁碼, 解析度) 快取頁面影像的磁碟快取，以 WebP 壓縮保存。
+    總容量超過上限時依最後使用時間淘汰最舊的檔案；讀取時更新檔案時間。
+    """
+
+    def __init__(self, cache_dir: str = PAGE_CACHE_DIR, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, template_id: int, page_number: int, level: str) -> Path:
+        return self.cache_dir / f"{template_id}_page_{page_number}_{level}.webp"
+
+    def _cached_entries(self):
+        """快取中的影像檔（不含寫入中的暫存檔）"""
+        return [entry for entry in os.scandir(self.cache_dir)
+                if entry.is_file() and not entry.name.endswith(TEMP_SUFFIX)]
+
+    def _scan_bytes(self) -> int:
+        return sum(entry.stat().st_size for entry in self._cached_entries())
+
+    def get_page(self, pdf_path: str, template_id: int, page_number: int, level: str = 'annotation') -> Optional[Image.Image]:
+        """取得頁面影像：快取中有就直接讀取，否則從 PDF 轉換該頁並寫入快取；PDF 不存在時回傳 None"""
+        if level not in PAGE_LEVELS:
+            raise ValueError(f"未知的頁面解析度：{level}")
+        path = self._path(template_id, page_number, level)
+        if path.exists():
+            try:
+                image = Image.open(path)
+                image.load()
+                os.utime(path)
+                with self._lock:
+                    self.hits += 1
+                return image
+            except OSError:
+                pass  # 檔案損毀或剛被淘汰，重新轉換
+
+        if not os.path.exists(pdf_path):
+            return None
+        image = render_page(pdf_path, page_number, PAGE_LEVELS[level])
+        with self._lock:
+            self.misses += 1
+        self._store(path, image, level)
+        return image
+
+    def put_page(self, template_id: int, page_number: int, level: str, image: Image.Image):
+        """放入已轉換好的頁面影像（例如保存範本時逐頁產生的縮圖）"""
+        self._store(self._path(template_id, page_number, level), image, level)
+
+    def _store(self, path: Path, image: Image.Image, level: str):
+        # 每次寫入使用各自的暫存檔再改名，同一頁同時轉換時不會互相覆寫
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=TEMP_SUFFIX, delete=False) as temp_file:
+            temp_path = temp_file.name
+            try:
+                image.save(temp_file, PAGE_IMAGE_FORMAT, quality=PAGE_IMAGE_QUALITY[level], method=4)
+            except Exception:
+                temp_file.close()
+                os.remove(temp_path)
+                raise
+        os.replace(temp_path, path)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_bytes()
+            else:
+                self._total_bytes += path.stat().st_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """刪除最久未使用的檔案，直到容量降到上限的八成（呼叫時需持有鎖）"""
+        entries = sorted(self._cached_entries(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        target = self.max_bytes * 0.8
+        for entry in entries:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self._total_bytes = total
+
+    def discard_template(self, template_id: int):
+        """刪除範本的所有快取頁面"""
+        prefix = f"{template_id}_page_"
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.startswith(prefix):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+            self._total_bytes = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'bytes': self._scan_bytes(),
+                'max_bytes': self.max_bytes,
+            }
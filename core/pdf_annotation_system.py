@@ -3,132 +3,365 @@
 
 import streamlit as st
 import os
-import json
+import shutil
 import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from PIL import Image
 from io import BytesIO
 
-try:
-    from pdf2image import convert_from_bytes
-except ImportError:
-    st.error("缺少 pdf2image 套件，請執行 pip install pdf2image")
-try:
-    import fitz
-except ImportError:
-    st.error("缺少 PyMuPDF 套件，請執行 pip install PyMuPDF")
+from core.database import BUSY_TIMEOUT_MS, CACHED_STATEMENTS, CONNECTION_PRAGMAS
+from core.migrations import AddColumn, LOCAL, migrate_sqlite, run_once
+from core.page_cache import PAGE_LEVELS, PageImageCache, pixels_to_points, points_to_pixels
+from core.pdf_rasterizer import RASTER_DPI, iter_pdf_pages, page_count
+
+# R*Tree 索引列：(id, 範本, 範本, 頁碼, 頁碼, x 範圍, y 範圍)，座標為 PDF point
+RTREE_ROW = (
+    "{row}.id, {row}.template_id, {row}.template_id, {row}.page_number, {row}.page_number, "
+    "MIN({row}.x_start, {row}.x_end), MAX({row}.x_start, {row}.x_end), "
+    "MIN({row}.y_start, {row}.y_end), MAX({row}.y_start, {row}.y_end)"
+)
+
+# --- 資料庫結構遷移（pdf_annotations.db） ---
+ANNOTATION_MIGRATIONS = [
+    {
+        'version': 1,
+        'description': "建立範本、頁面類型、標記與變數資料庫表格",
+        'targets': (LOCAL,),
+        'statements': [
+            '''
+            CREATE TABLE IF NOT EXISTS templates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL,
+                description TEXT, total_pages INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS page_types (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                template_id INTEGER,
+                page_number INTEGER,
+                page_type TEXT DEFAULT '變數頁面', -- '變數頁面' or '參考資料'
+                note TEXT DEFAULT '', -- 頁面備註說明
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (template_id) REFERENCES templates (id) ON DELETE CASCADE,
+                UNIQUE(template_id, page_number)
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS annotations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, template_id INTEGER,
+                page_number INTEGER, variable_name TEXT, variable_type TEXT,
+                x_start REAL, y_start REAL, x_end REAL, y_end REAL,
+                sample_value TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (template_id) REFERENCES templates (id) ON DELETE CASCADE
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS variable_database (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, variable_name TEXT UNIQUE NOT NULL,
+                variable_type TEXT, sample_values TEXT, usage_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+        ],
+    },
+    {
+        'version': 2,
+        'description': "舊版 page_types 補上備註與更新時間欄位",
+        'targets': (LOCAL,),
+        'statements': [
+            AddColumn("page_types", "note", "TEXT DEFAULT ''"),
+            # ALTER TABLE 不允許非常數預設值，舊資料的更新時間保持空白
+            AddColumn("page_types", "updated_at", "TIMESTAMP"),
+        ],
+    },
+    {
+        'version': 3,
+        'description': "標記依範本與頁碼查詢的索引",
+        'targets': (LOCAL,),
+        'statements': [
+            # page_types 的 UNIQUE(template_id, page_number) 已建立可用於 template_id 查詢的索引，不另外建立
+            "CREATE INDEX IF NOT EXISTS idx_annotations_template_page ON annotations (template_id, page_number)",
+        ],
+    },
+    {
+        'version': 4,
+        'description': "標記座標由 200 dpi 影像像素改為 PDF 座標（point），與頁面影像解析度無關",
+        'targets': (LOCAL,),
+        'statements': [
+            f'''
+            UPDATE annotations SET
+                x_start = x_start * {72.0 / RASTER_DPI}, y_start = y_start * {72.0 / RASTER_DPI},
+                x_end = x_end * {72.0 / RASTER_DPI}, y_end = y_end * {72.0 / RASTER_DPI}
+            ''',
+        ],
+    },
+    {
+        'version': 5,
+        'description': "標記的 R*Tree 空間索引（範本、頁碼、x、y 四個維度）與同步觸發器",
+        'targets': (LOCAL,),
+        'statements': [
+            '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS annotations_rtree USING rtree(
+                id, template_min, template_max, page_min, page_max, x_min, x_max, y_min, y_max
+            )
+            ''',
+            # 拖曳方向可能相反，索引一律以左上、右下角保存
+            f'''
+            CREATE TRIGGER IF NOT EXISTS annotations_rtree_insert AFTER INSERT ON annotations BEGIN
+                INSERT INTO annotations_rtree VALUES ({RTREE_ROW.format(row='NEW')});
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS annotations_rtree_update AFTER UPDATE ON annotations BEGIN
+                DELETE FROM annotations_rtree WHERE id = OLD.id;
+                INSERT INTO annotations_rtree VALUES ({RTREE_ROW.format(row='NEW')});
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS annotations_rtree_delete AFTER DELETE ON annotations BEGIN
+                DELETE FROM annotations_rtree WHERE id = OLD.id;
+            END
+            ''',
+            f"INSERT OR REPLACE INTO annotations_rtree SELECT {RTREE_ROW.format(row='annotations')} FROM annotations",
+        ],
+    },
+    {
+        'version': 6,
+        'description': "變數樣本值改存於正規化的 variable_samples 表格（次數、最後出現時間），並建立自動完成用索引",
+        'targets': (LOCAL,),
+        'statements': [
+            '''
+            CREATE TABLE IF NOT EXISTS variable_samples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                variable_id INTEGER NOT NULL,
+                value TEXT NOT NULL,
+                count INTEGER DEFAULT 1,
+                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (variable_id) REFERENCES variable_database (id) ON DELETE CASCADE,
+                UNIQUE(variable_id, value)
+            )
+            ''',
+            # UNIQUE(variable_id, value) 可用於單一變數內的前綴查詢；跨變數的樣本值前綴查詢另建索引
+            "CREATE INDEX IF NOT EXISTS idx_variable_samples_value ON variable_samples (value)",
+            # 舊版 JSON 陣列中的樣本值搬移到新表格（JSON 欄位保留但不再更新）
+            '''
+            INSERT OR IGNORE INTO variable_samples (variable_id, value, count, last_seen)
+            SELECT v.id, j.value, 1, COALESCE(v.updated_at, v.created_at, CURRENT_TIMESTAMP)
+            FROM variable_database v, json_each(v.sample_values) j
+            WHERE json_valid(v.sample_values) AND j.type = 'text' AND j.value != ''
+            ''',
+        ],
+    },
+]
+
+ANNOTATION_INSERT_SQL = (
+    "INSERT INTO annotations (template_id, page_number, variable_name, variable_type, "
+    "x_start, y_start, x_end, y_end, sample_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+ANNOTATION_UPDATE_SQL = (
+    "UPDATE annotations SET variable_name = ?, variable_type = ?, "
+    "x_start = ?, y_start = ?, x_end = ?, y_end = ?, sample_value = ? WHERE id = ?"
+)
+PAGE_TYPE_UPSERT_SQL = (
+    "INSERT OR REPLACE INTO page_types (template_id, page_number, page_type, note, updated_at) VALUES (?, ?, ?, ?, ?)"
+)
+DEFAULT_PAGE_TYPE = '變數頁面'
+VARIABLE_UPSERT_SQL = (
+    "INSERT INTO variable_database (variable_name, variable_type, usage_count) VALUES (?, ?, ?) "
+    "ON CONFLICT(variable_name) DO UPDATE SET usage_count = usage_count + excluded.usage_count, updated_at = CURRENT_TIMESTAMP"
+)
+VARIABLE_RELEASE_SQL = (
+    "UPDATE variable_database SET usage_count = MAX(usage_count - ?, 0), updated_at = CURRENT_TIMESTAMP "
+    "WHERE variable_name = ?"
+)
+SAMPLE_RELEASE_SQL = (
+    "UPDATE variable_samples SET count = count - ? "
+    "WHERE value = ? AND variable_id = (SELECT id FROM variable_database WHERE variable_name = ?)"
+)
+SAMPLE_UPSERT_SQL = (
+    "INSERT INTO variable_samples (variable_id, value, count, last_seen) "
+    "SELECT id, ?, ?, CURRENT_TIMESTAMP FROM variable_database WHERE variable_name = ? "
+    "ON CONFLICT(variable_id, value) DO UPDATE SET count = count + excluded.count, last_seen = excluded.last_seen"
+)
+MAX_SQL_VARIABLES = 999
+AUTOCOMPLETE_LIMIT = 10
+
+
+def _annotation_dict(row, dpi: float) -> Dict:
+    """標記資料列轉為字典：coordinates 為 dpi 解析度的像素座標，pdf_coordinates 為 PDF 座標"""
+    ann = dict(row)
+    ann['pdf_coordinates'] = (ann['x_start'], ann['y_start'], ann['x_end'], ann['y_end'])
+    ann['coordinates'] = points_to_pixels(ann['pdf_coordinates'], dpi)
+    return ann
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+    """
+    前綴範圍查詢的上界：最後一個字元的下一個碼位（SQLite 預設的 BINARY 排序與碼位順序一致）。
+    結尾的 U+10FFFF 沒有下一個碼位，先去掉再進位；全部去掉後沒有上界，回傳 None。
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    next_code = ord(prefix[-1]) + 1
+    if 0xD800 <= next_code <= 0xDFFF:
+        next_code = 0xE000   # 代理字元無法編碼為 UTF-8，跳到代理區之後
+    return prefix[:-1] + chr(next_code)
+
+
+def _prefix_condition(column: str, prefix: str) -> Tuple[str, List]:
+    """column 以 prefix 開頭的範圍條件（可使用 column 上的索引）"""
+    upper = _prefix_upper_bound(prefix)
+    if upper is None:
+        return f"{column} >= ?", [prefix]
+    return f"{column} >= ? AND {column} < ?", [prefix, upper]
+
+
+def _normalized_box(box) -> Tuple[float, float, float, float]:
+    x0, y0, x1, y1 = box
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+
+def _box_contains(box, x: float, y: float) -> bool:
+    return box[0] <= x <= box[2] and box[1] <= y <= box[3]
+
+
+def _boxes_overlap(a, b) -> bool:
+    """兩個矩形是否相交（含邊界相接）"""
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+def _box_area(box) -> float:
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def _intersection_area(a, b) -> float:
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    return width * height if width > 0 and height > 0 else 0.0
+
+
+def _box_iou(a, b) -> float:
+    intersection = _intersection_area(a, b)
+    union = _box_area(a) + _box_area(b) - intersection
+    return intersection / union if union > 0 else 0.0
 
-# Poppler path - 雲端環境自適應
-POPPLER_PATH = None  # 讓雲端環境自動尋找，本地環境可手動指定
 
 class PDFAnnotationSystem:
     def __init__(self, db_path="data/pdf_annotations.db"):
         self.db_path = db_path
         self.templates_dir = "data/pdf_templates"
         os.makedirs(self.templates_dir, exist_ok=True)
+        self.page_cache = PageImageCache()
+        self._conn = None
+        self._lock = threading.RLock()
         self.setup_database()
-    
+
+    @contextmanager
+    def _connection(self):
+        """
+        此實例共用的持久連線（WAL、外鍵約束、預先編譯語句快取），同一時間只有一個執行緒使用。
+        離開 with 區塊時 commit，發生例外則 rollback。
+        """
+        with self._lock:
+            if self._conn is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+                conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000,
+                                       check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+                conn.row_factory = sqlite3.Row
+                for pragma in CONNECTION_PRAGMAS:
+                    conn.execute(pragma)
+                self._conn = conn
+            try:
+                yield self._conn
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def close(self):
+        """關閉持久連線（下次使用時會重新建立）"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
     def setup_database(self):
+        """依版本套用尚未執行的資料庫遷移（每個行程只檢查一次）"""
+        def apply():
+            with self._connection() as conn:
+                migrate_sqlite(conn, ANNOTATION_MIGRATIONS)
+
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("PRAGMA foreign_keys = ON;")
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS templates (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL,
-                        description TEXT, total_pages INTEGER,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS page_types (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        template_id INTEGER,
-                        page_number INTEGER,
-                        page_type TEXT DEFAULT '變數頁面', -- '變數頁面' or '參考資料'
-                        note TEXT DEFAULT '', -- 頁面備註說明
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (template_id) REFERENCES templates (id) ON DELETE CASCADE,
-                        UNIQUE(template_id, page_number)
-                    )
-                ''')
-                
-                # 檢查是否需要添加note欄位（為了向後相容）
-                cursor.execute("PRAGMA table_info(page_types)")
-                columns = [column[1] for column in cursor.fetchall()]
-                if 'note' not in columns:
-                    cursor.execute("ALTER TABLE page_types ADD COLUMN note TEXT DEFAULT ''")
-                if 'updated_at' not in columns:
-                    cursor.execute("ALTER TABLE page_types ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS annotations (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, template_id INTEGER,
-                        page_number INTEGER, variable_name TEXT, variable_type TEXT,
-                        x_start REAL, y_start REAL, x_end REAL, y_end REAL,
-                        sample_value TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (template_id) REFERENCES templates (id) ON DELETE CASCADE
-                    )
-                ''')
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS variable_database (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, variable_name TEXT UNIQUE NOT NULL,
-                        variable_type TEXT, sample_values TEXT, usage_count INTEGER DEFAULT 0,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
+            run_once((LOCAL, os.path.abspath(self.db_path)), apply)
         except Exception as e:
             st.error(f"資料庫初始化錯誤：{str(e)}")
     
+    def _legacy_page_path(self, template_id, page_number: int) -> str:
+        """舊版預先保存的 200 dpi 頁面 PNG"""
+        return os.path.join(self.templates_dir, f"{template_id}_page_{page_number}.png")
+
+    def _pdf_path(self, template_id) -> str:
+        return os.path.join(self.templates_dir, f"{template_id}_original.pdf")
+
     def convert_pdf_to_images(self, pdf_file) -> List[Image.Image]:
+        """將整份 PDF 轉為影像清單（會同時保留所有頁面；大型文件請改用 save_template 逐頁處理）"""
         try:
-            pdf_file.seek(0)
-            pdf_bytes = pdf_file.read()
-            try:
-                images = convert_from_bytes(pdf_bytes, dpi=200, fmt='PNG', poppler_path=POPPLER_PATH)
-                st.info("✅ 使用 pdf2image 成功轉換 PDF。")
-                return images
-            except Exception:
-                # 雲端環境通常沒有 poppler，直接使用 PyMuPDF
-                st.info("🔄 使用 PyMuPDF 轉換 PDF...")
-                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-                images = [Image.frombytes("RGB", [p.get_pixmap(dpi=200).width, p.get_pixmap(dpi=200).height], p.get_pixmap(dpi=200).samples) for p in doc]
-                doc.close()
-                st.info("✅ PDF 轉換成功。")
-                return images
+            images = [image for _, image in iter_pdf_pages(pdf_file)]
+            st.info("✅ PDF 轉換成功。")
+            return images
         except Exception as e:
             st.error(f"所有 PDF 轉換方法均失敗：{str(e)}")
             return []
 
-    def save_template(self, name: str, description: str, pdf_file, images: List[Image.Image]) -> int:
+    def save_template(self, name: str, description: str, pdf_file, images: List[Image.Image] = None) -> int:
+        """
+        保存範本：只保存原始 PDF，各頁影像由 load_template_page 按需轉換並快取；
+        保存時從 PDF 逐頁產生縮圖，預先放入快取。
+        images 為舊版介面保留的參數，已不使用（頁面影像一律從原始 PDF 產生）。
+        """
+        template_id = None
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "INSERT INTO templates (name, description, total_pages, updated_at) VALUES (?, ?, ?, ?)",
-                    (name, description, len(images), datetime.now())
+                    (name, description, 0, datetime.now())
                 )
                 template_id = cursor.lastrowid
+            pdf_path = self._pdf_path(template_id)
             pdf_file.seek(0)
-            with open(os.path.join(self.templates_dir, f"{template_id}_original.pdf"), 'wb') as f:
-                f.write(pdf_file.read())
-            for i, image in enumerate(images):
-                image.save(os.path.join(self.templates_dir, f"{template_id}_page_{i+1}.png"), "PNG")
+            with open(pdf_path, 'wb') as f:
+                shutil.copyfileobj(pdf_file, f)
+
+            total_pages = page_count(pdf_path)
+            with self._connection() as conn:
+                conn.execute("UPDATE templates SET total_pages = ? WHERE id = ?", (total_pages, template_id))
+            # 縮圖解析度低，逐頁轉換比啟動子程序快，一律在目前程序中進行
+            for page_number, image in iter_pdf_pages(pdf_path, dpi=PAGE_LEVELS['thumb'], workers=1):
+                self.page_cache.put_page(template_id, page_number, 'thumb', image)
             return template_id
         except sqlite3.IntegrityError:
              st.error(f"範本儲存錯誤：範本名稱 '{name}' 已存在。")
              return -1
         except Exception as e:
             st.error(f"範本儲存錯誤：{str(e)}")
+            # 轉換中途失敗時移除只保存一半的範本
+            if template_id is not None:
+                self.delete_template(template_id, 0)
             return -1
 
     def get_templates_list(self) -> List[Dict]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT * FROM templates ORDER BY updated_at DESC")
                 return [dict(row) for row in cursor.fetchall()]
@@ -139,8 +372,7 @@ class PDFAnnotationSystem:
     def get_template_info(self, template_id: int) -> Dict:
         """獲取單個範本的詳細資訊"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT * FROM templates WHERE id = ?", (template_id,))
                 result = cursor.fetchone()
@@ -149,64 +381,192 @@ class PDFAnnotationSystem:
             st.error(f"取得範本資訊錯誤：{str(e)}")
             return None
     
-    def load_template_page(self, template_id: int, page_number: int) -> Image.Image:
-        image_path = os.path.join(self.templates_dir, f"{template_id}_page_{page_number}.png")
-        return Image.open(image_path) if os.path.exists(image_path) else None
+    def load_template_page(self, template_id: int, page_number: int, level: str = 'annotation') -> Image.Image:
+        """
+        取得頁面影像，level 為 'thumb'（縮圖）、'screen'（瀏覽）或 'annotation'（標記用，200 dpi）。
+        影像從原始 PDF 按需轉換並快取；沒有原始 PDF 或轉換失敗時使用舊版保存的 PNG。
+        舊版 PNG 只在同一頁已由快取成功產生標記用影像後才刪除。
+        """
+        legacy_path = self._legacy_page_path(template_id, page_number)
+        try:
+            image = self.page_cache.get_page(self._pdf_path(template_id), template_id, page_number, level)
+        except ValueError:
+            raise
+        except Exception:
+            image = None
+        if image is not None:
+            if level == 'annotation' and os.path.exists(legacy_path):
+                try:
+                    os.remove(legacy_path)
+                except OSError:
+                    pass
+            return image
+        return Image.open(legacy_path) if os.path.exists(legacy_path) else None
+
+    def save_annotation(self, template_id: int, page_number: int, variable_name: str, variable_type: str, coordinates: Tuple[float, float, float, float], sample_value: str = "", dpi: float = RASTER_DPI):
+        """coordinates 為 dpi 解析度頁面影像上的像素座標，以 PDF 座標（point）保存"""
+        return bool(self.save_annotations(template_id, [{
+            'page_number': page_number, 'variable_name': variable_name, 'variable_type': variable_type,
+            'coordinates': coordinates, 'sample_value': sample_value,
+        }], dpi=dpi))
 
-    def save_annotation(self, template_id: int, page_number: int, variable_name: str, variable_type: str, coordinates: Tuple[float, float, float, float], sample_value: str = ""):
+    def save_annotations(self, template_id: int, annotations: List[Dict], dpi: float = RASTER_DPI) -> List[int]:
+        """
+        在同一個交易中新增多筆標記，每筆為 {'page_number', 'variable_name', 'variable_type',
+        'coordinates', 'sample_value'}；變數資料庫一併批次更新。回傳新標記的 ID，失敗時回傳空清單。
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                x_start, y_start, x_end, y_end = coordinates
-                cursor.execute(
-                    "INSERT INTO annotations (template_id, page_number, variable_name, variable_type, x_start, y_start, x_end, y_end, sample_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    (template_id, page_number, variable_name, variable_type, x_start, y_start, x_end, y_end, sample_value)
-                )
-                self.update_variable_database(cursor, variable_name, variable_type, sample_value)
-            return True
+            with self._connection() as conn:
+                ids = []
+                for ann in annotations:
+                    cursor = conn.execute(ANNOTATION_INSERT_SQL, (
+                        template_id, ann['page_number'], ann['variable_name'], ann.get('variable_type'),
+                        *pixels_to_points(ann['coordinates'], dpi), ann.get('sample_value', "")
+                    ))
+                    ids.append(cursor.lastrowid)
+                self._update_variable_database(conn, annotations)
+            return ids
         except Exception as e:
             st.error(f"儲存標記錯誤：{str(e)}")
+            return []
+
+    def update_annotations(self, annotations: List[Dict], dpi: float = RASTER_DPI) -> bool:
+        """
+        在同一個交易中更新多筆標記，每筆為 {'id', 'variable_name', 'variable_type', 'coordinates', 'sample_value'}；
+        只有變數名稱或樣本值改變的標記才調整變數資料庫：舊的減一、新的加一。
+        """
+        try:
+            with self._connection() as conn:
+                ids = [ann['id'] for ann in annotations]
+                previous = {}
+                for start in range(0, len(ids), MAX_SQL_VARIABLES):
+                    chunk = ids[start:start + MAX_SQL_VARIABLES]
+                    previous.update(
+                        (row[0], (row[1], row[2] or "")) for row in conn.execute(
+                            f"SELECT id, variable_name, sample_value FROM annotations WHERE id IN ({', '.join('?' * len(chunk))})",
+                            chunk
+                        )
+                    )
+                conn.executemany(ANNOTATION_UPDATE_SQL, [
+                    (ann['variable_name'], ann.get('variable_type'), *pixels_to_points(ann['coordinates'], dpi),
+                     ann.get('sample_value', ""), ann['id'])
+                    for ann in annotations
+                ])
+                changed = [ann for ann in annotations if ann['id'] in previous
+                           and previous[ann['id']] != (ann['variable_name'], ann.get('sample_value') or "")]
+                self._update_variable_database(conn, changed)
+                self._release_variable_usage(conn, [previous[ann['id']] for ann in changed])
+            return True
+        except Exception as e:
+            st.error(f"更新標記時發生錯誤：{e}")
             return False
 
     def update_variable_database(self, cursor: sqlite3.Cursor, variable_name: str, variable_type: str, sample_value: str):
-        cursor.execute("SELECT id, sample_values, usage_count FROM variable_database WHERE variable_name = ?", (variable_name,))
-        result = cursor.fetchone()
-        if result:
-            var_id, existing_samples, usage_count = result
-            samples_list = json.loads(existing_samples) if existing_samples else []
-            if sample_value and sample_value not in samples_list:
-                samples_list.append(sample_value)
-            cursor.execute(
-                "UPDATE variable_database SET sample_values = ?, usage_count = ?, updated_at = ? WHERE id = ?",
-                (json.dumps(samples_list, ensure_ascii=False), usage_count + 1, datetime.now(), var_id)
-            )
-        else:
-            samples_list = [sample_value] if sample_value else []
-            cursor.execute(
-                "INSERT INTO variable_database (variable_name, variable_type, sample_values, usage_count) VALUES (?, ?, ?, ?)",
-                (variable_name, variable_type, json.dumps(samples_list, ensure_ascii=False), 1)
-            )
+        self._update_variable_database(cursor.connection, [
+            {'variable_name': variable_name, 'variable_type': variable_type, 'sample_value': sample_value}
+        ])
+
+    def _update_variable_database(self, conn: sqlite3.Connection, annotations: List[Dict]):
+        """
+        依標記批次更新變數資料庫：使用次數與樣本值出現次數都以 UPSERT 累加，
+        不需先讀出再寫回；同一批次中的相同變數、樣本值先合併計數。
+        """
+        usage = {}
+        samples = {}
+        for ann in annotations:
+            name = ann['variable_name']
+            usage.setdefault(name, [ann.get('variable_type'), 0])[1] += 1
+            sample_value = ann.get('sample_value')
+            if sample_value:
+                samples[(name, sample_value)] = samples.get((name, sample_value), 0) + 1
+        conn.executemany(VARIABLE_UPSERT_SQL, [(name, variable_type, count) for name, (variable_type, count) in usage.items()])
+        conn.executemany(SAMPLE_UPSERT_SQL, [(value, count, name) for (name, value), count in samples.items()])
+
+    def _release_variable_usage(self, conn: sqlite3.Connection, usages: List[Tuple[str, str]]):
+        """標記刪除或改用其他變數、樣本值時，依 [(變數名稱, 樣本值)] 減少使用次數與樣本值出現次數"""
+        usage = {}
+        samples = {}
+        for name, sample_value in usages:
+            usage[name] = usage.get(name, 0) + 1
+            if sample_value:
+                samples[(name, sample_value)] = samples.get((name, sample_value), 0) + 1
+        conn.executemany(VARIABLE_RELEASE_SQL, [(count, name) for name, count in usage.items()])
+        if samples:
+            conn.executemany(SAMPLE_RELEASE_SQL, [(count, value, name) for (name, value), count in samples.items()])
+            conn.execute("DELETE FROM variable_samples WHERE count <= 0")
 
     def get_variable_database(self) -> List[Dict]:
+        """取得所有變數，sample_values 依出現次數由多到少排列"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM variable_database ORDER BY usage_count DESC, variable_name")
-                db_list = []
-                for row in cursor.fetchall():
-                    item = dict(row)
-                    item['sample_values'] = json.loads(item['sample_values']) if item['sample_values'] else []
-                    db_list.append(item)
-                return db_list
+            with self._connection() as conn:
+                db_list = [dict(row) for row in conn.execute(
+                    "SELECT id, variable_name, variable_type, usage_count, created_at, updated_at "
+                    "FROM variable_database ORDER BY usage_count DESC, variable_name"
+                )]
+                samples = {}
+                for row in conn.execute("SELECT variable_id, value FROM variable_samples ORDER BY count DESC, last_seen DESC"):
+                    samples.setdefault(row[0], []).append(row[1])
+            for item in db_list:
+                item['sample_values'] = samples.get(item['id'], [])
+            return db_list
         except Exception as e:
             st.error(f"取得變數資料庫錯誤：{str(e)}")
             return []
 
-    def get_template_annotations(self, template_id: int, page_number: int = None) -> List[Dict]:
+    def suggest_variable_names(self, prefix: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[Dict]:
+        """以前綴範圍查詢（使用 variable_name 的唯一索引）提供變數名稱自動完成，常用的在前"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connection() as conn:
+                if prefix:
+                    condition, params = _prefix_condition("variable_name", prefix)
+                    rows = conn.execute(
+                        "SELECT variable_name, variable_type, usage_count FROM variable_database "
+                        f"WHERE {condition} ORDER BY usage_count DESC, variable_name LIMIT ?",
+                        params + [limit]
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT variable_name, variable_type, usage_count FROM variable_database "
+                        "ORDER BY usage_count DESC, variable_name LIMIT ?", (limit,)
+                    ).fetchall()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            st.error(f"查詢變數名稱時發生錯誤：{e}")
+            return []
+
+    def suggest_sample_values(self, prefix: str, variable_name: str = None, limit: int = AUTOCOMPLETE_LIMIT) -> List[Dict]:
+        """
+        樣本值自動完成：提供 variable_name 時只查詢該變數的樣本值，否則查詢所有變數；
+        依出現次數、最後出現時間排序，回傳 [{'value', 'count', 'last_seen', 'variable_name'}]。
+        """
+        try:
+            sql = (
+                "SELECT s.value, s.count, s.last_seen, v.variable_name FROM variable_samples s "
+                "JOIN variable_database v ON v.id = s.variable_id WHERE 1 = 1"
+            )
+            params = []
+            if variable_name is not None:
+                sql += " AND v.variable_name = ?"
+                params.append(variable_name)
+            if prefix:
+                condition, prefix_params = _prefix_condition("s.value", prefix)
+                sql += f" AND {condition}"
+                params += prefix_params
+            sql += " ORDER BY s.count DESC, s.last_seen DESC LIMIT ?"
+            params.append(limit)
+            with self._connection() as conn:
+                return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        except Exception as e:
+            st.error(f"查詢樣本值時發生錯誤：{e}")
+            return []
+
+    def get_template_annotations(self, template_id: int, page_number: int = None, dpi: float = RASTER_DPI) -> List[Dict]:
+        """
+        取得範本的標記；coordinates 換算為 dpi 解析度頁面影像上的像素座標，
+        pdf_coordinates 與 x_start 等欄位為 PDF 座標（point）。
+        """
+        try:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 query = "SELECT * FROM annotations WHERE template_id = ?"
                 params = [template_id]
@@ -214,26 +574,115 @@ class PDFAnnotationSystem:
                     query += " AND page_number = ?"
                     params.append(page_number)
                 cursor.execute(query, tuple(params))
-                annotations = [dict(row) for row in cursor.fetchall()]
-                for ann in annotations:
-                    ann['coordinates'] = (ann['x_start'], ann['y_start'], ann['x_end'], ann['y_end'])
-                return annotations
+                return [_annotation_dict(row, dpi) for row in cursor.fetchall()]
         except Exception as e:
             st.error(f"取得標記資訊錯誤：{str(e)}")
             return []
 
+    def _query_rtree(self, where: str, params: tuple, dpi: float) -> List[Dict]:
+        """
+        以 R*Tree 篩選候選標記。R*Tree 以 32 位元浮點數保存（範圍會略為放大），
+        因此再以 annotations 表格中的原始座標精確比對一次。
+        """
+        sql = (
+            "SELECT a.* FROM annotations_rtree r JOIN annotations a ON a.id = r.id "
+            "WHERE r.template_min <= ? AND r.template_max >= ? AND r.page_min <= ? AND r.page_max >= ? AND " + where
+        )
+        with self._connection() as conn:
+            return [_annotation_dict(row, dpi) for row in conn.execute(sql, params).fetchall()]
+
+    def hit_test(self, template_id: int, page_number: int, x: float, y: float, dpi: float = RASTER_DPI) -> List[Dict]:
+        """找出包含點 (x, y)（dpi 解析度的像素座標）的標記，面積最小（最內層）的在前"""
+        try:
+            px, py = pixels_to_points((x, y), dpi)
+            candidates = self._query_rtree(
+                "r.x_min <= ? AND r.x_max >= ? AND r.y_min <= ? AND r.y_max >= ?",
+                (template_id, template_id, page_number, page_number, px, px, py, py), dpi
+            )
+            hits = [ann for ann in candidates if _box_contains(_normalized_box(ann['pdf_coordinates']), px, py)]
+            return sorted(hits, key=lambda ann: _box_area(_normalized_box(ann['pdf_coordinates'])))
+        except Exception as e:
+            st.error(f"查詢標記時發生錯誤：{e}")
+            return []
+
+    def query_region(self, template_id: int, page_number: int, region: Tuple[float, float, float, float],
+                     dpi: float = RASTER_DPI) -> List[Dict]:
+        """找出與矩形區域 (x_start, y_start, x_end, y_end)（dpi 解析度的像素座標）重疊的標記"""
+        try:
+            x0, y0, x1, y1 = _normalized_box(pixels_to_points(region, dpi))
+            candidates = self._query_rtree(
+                "r.x_min <= ? AND r.x_max >= ? AND r.y_min <= ? AND r.y_max >= ?",
+                (template_id, template_id, page_number, page_number, x1, x0, y1, y0), dpi
+            )
+            return [ann for ann in candidates if _boxes_overlap(_normalized_box(ann['pdf_coordinates']), (x0, y0, x1, y1))]
+        except Exception as e:
+            st.error(f"查詢標記時發生錯誤：{e}")
+            return []
+
+    def find_overlapping_annotations(self, template_id: int = None, across_templates: bool = False,
+                                     min_iou: float = 0.0, dpi: float = RASTER_DPI) -> List[Dict]:
+        """
+        找出互相重疊的標記組合，回傳 [{'first', 'second', 'iou'}]，依重疊比例（IoU）由高到低排序。
+        across_templates 為 False 時比對同一範本同一頁內的標記（找重複標記）；
+        為 True 時比對不同範本同一頁碼的標記（找不同範本中位置相同的欄位）。
+        template_id 可限定其中一方所屬的範本。
+        """
+        try:
+            conditions = [
+                "b.page_min >= a.page_min", "b.page_max <= a.page_max",
+                "b.x_min <= a.x_max", "b.x_max >= a.x_min", "b.y_min <= a.y_max", "b.y_max >= a.y_min",
+            ]
+            params = []
+            if across_templates:
+                conditions.append("b.template_min != a.template_min")
+            else:
+                conditions += ["b.template_min >= a.template_min", "b.template_max <= a.template_max"]
+            if template_id is not None:
+                conditions += ["a.template_min <= ?", "a.template_max >= ?"]
+                params += [template_id, template_id]
+            if template_id is None or not across_templates:
+                # 兩方對稱時每組只列一次；限定範本的跨範本比對則只以該範本為 a 方
+                conditions.append("b.id > a.id")
+            sql = "SELECT a.id, b.id FROM annotations_rtree a, annotations_rtree b WHERE " + " AND ".join(conditions)
+
+            with self._connection() as conn:
+                pairs = conn.execute(sql, params).fetchall()
+                ids = sorted({annotation_id for pair in pairs for annotation_id in pair})
+                annotations = {}
+                for start in range(0, len(ids), MAX_SQL_VARIABLES):
+                    chunk = ids[start:start + MAX_SQL_VARIABLES]
+                    rows = conn.execute(
+                        f"SELECT * FROM annotations WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    annotations.update({row['id']: _annotation_dict(row, dpi) for row in rows})
+
+            overlaps = []
+            for first_id, second_id in pairs:
+                first, second = annotations[first_id], annotations[second_id]
+                iou = _box_iou(_normalized_box(first['pdf_coordinates']), _normalized_box(second['pdf_coordinates']))
+                if iou > 0 and iou >= min_iou:
+                    overlaps.append({'first': first, 'second': second, 'iou': iou})
+            return sorted(overlaps, key=lambda overlap: overlap['iou'], reverse=True)
+        except Exception as e:
+            st.error(f"查詢重疊標記時發生錯誤：{e}")
+            return []
+
     def delete_template(self, template_id: int, total_pages: int) -> bool:
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("PRAGMA foreign_keys = ON;")
-                cursor.execute("DELETE FROM templates WHERE id = ?", (template_id,))
+            with self._connection() as conn:
+                # 標記隨範本串聯刪除，先扣除它們在變數資料庫中的使用次數
+                usages = conn.execute(
+                    "SELECT variable_name, sample_value FROM annotations WHERE template_id = ?", (template_id,)
+                ).fetchall()
+                self._release_variable_usage(conn, [(row[0], row[1]) for row in usages])
+                conn.execute("DELETE FROM templates WHERE id = ?", (template_id,))
             
-            pdf_path = os.path.join(self.templates_dir, f"{template_id}_original.pdf")
+            pdf_path = self._pdf_path(template_id)
             if os.path.exists(pdf_path): os.remove(pdf_path)
+            self.page_cache.discard_template(template_id)
             
             for i in range(1, total_pages + 1):
-                img_path = os.path.join(self.templates_dir, f"{template_id}_page_{i}.png")
+                img_path = self._legacy_page_path(template_id, i)
                 if os.path.exists(img_path): os.remove(img_path)
             
             return True
@@ -245,57 +694,42 @@ class PDFAnnotationSystem:
     def delete_annotation(self, annotation_id: int) -> bool:
         """刪除單筆變數標記"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 # 在刪除前，先取得變數名稱，以便更新 variable_database
-                cursor.execute("SELECT variable_name FROM annotations WHERE id = ?", (annotation_id,))
+                cursor.execute("SELECT variable_name, sample_value FROM annotations WHERE id = ?", (annotation_id,))
                 result = cursor.fetchone()
                 if result:
-                    variable_name = result[0]
                     # 刪除標記
                     cursor.execute("DELETE FROM annotations WHERE id = ?", (annotation_id,))
-                    # 更新 variable_database 的 usage_count
-                    cursor.execute(
-                        "UPDATE variable_database SET usage_count = usage_count - 1 WHERE variable_name = ?",
-                        (variable_name,)
-                    )
+                    # 更新 variable_database 的 usage_count 與樣本值出現次數
+                    self._release_variable_usage(conn, [(result[0], result[1])])
             return True
         except Exception as e:
             st.error(f"刪除標記時發生錯誤：{e}")
             return False
 
     def update_annotation(self, annotation_id: int, variable_name: str, variable_type: str, 
-                         coordinates: tuple, sample_value: str = "") -> bool:
-        """更新變數標記"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                x_start, y_start, x_end, y_end = coordinates
-                cursor.execute(
-                    """UPDATE annotations 
-                       SET variable_name = ?, variable_type = ?, 
-                           x_start = ?, y_start = ?, x_end = ?, y_end = ?, 
-                           sample_value = ?
-                       WHERE id = ?""",
-                    (variable_name, variable_type, x_start, y_start, x_end, y_end, sample_value, annotation_id)
-                )
-                # 更新變數資料庫
-                self.update_variable_database(cursor, variable_name, variable_type, sample_value)
-            return True
-        except Exception as e:
-            st.error(f"更新標記時發生錯誤：{e}")
-            return False
+                         coordinates: tuple, sample_value: str = "", dpi: float = RASTER_DPI) -> bool:
+        """更新變數標記（coordinates 為 dpi 解析度頁面影像上的像素座標）"""
+        return self.update_annotations([{
+            'id': annotation_id, 'variable_name': variable_name, 'variable_type': variable_type,
+            'coordinates': coordinates, 'sample_value': sample_value,
+        }], dpi=dpi)
     
     def set_page_type(self, template_id: int, page_number: int, page_type: str, note: str = "") -> bool:
         """設定頁面類型 ('變數頁面' 或 '參考資料') 和備註"""
+        return self.set_page_types(template_id, {page_number: (page_type, note)})
+
+    def set_page_types(self, template_id: int, pages: Dict[int, Tuple[str, str]]) -> bool:
+        """在同一個交易中設定多個頁面的類型與備註，pages 為 {頁碼: (類型, 備註)}"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """INSERT OR REPLACE INTO page_types (template_id, page_number, page_type, note, updated_at)
-                       VALUES (?, ?, ?, ?, ?)""",
-                    (template_id, page_number, page_type, note, datetime.now())
-                )
+            with self._connection() as conn:
+                now = datetime.now()
+                conn.executemany(PAGE_TYPE_UPSERT_SQL, [
+                    (template_id, page_number, page_type, note, now)
+                    for page_number, (page_type, note) in pages.items()
+                ])
             return True
         except Exception as e:
             st.error(f"設定頁面類型時發生錯誤：{e}")
@@ -304,7 +738,7 @@ class PDFAnnotationSystem:
     def get_page_type(self, template_id: int, page_number: int) -> str:
         """取得頁面類型"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "SELECT page_type FROM page_types WHERE template_id = ? AND page_number = ?",
@@ -319,7 +753,7 @@ class PDFAnnotationSystem:
     def get_page_info(self, template_id: int, page_number: int) -> tuple:
         """取得頁面類型和備註"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "SELECT page_type, note FROM page_types WHERE template_id = ? AND page_number = ?",
@@ -337,7 +771,7 @@ class PDFAnnotationSystem:
     def get_template_page_types(self, template_id: int) -> dict:
         """取得範本所有頁面的類型"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "SELECT page_number, page_type FROM page_types WHERE template_id = ?",
@@ -348,16 +782,22 @@ class PDFAnnotationSystem:
             st.error(f"取得頁面類型時發生錯誤：{e}")
             return {}
     
-    def get_template_page_info(self, template_id: int) -> dict:
-        """取得範本所有頁面的詳細資訊（類型和備註）"""
+    def get_template_page_info(self, template_id: int, total_pages: int = None) -> dict:
+        """
+        以一次查詢取得範本所有頁面的詳細資訊（類型和備註）；
+        提供 total_pages 時未設定的頁面也會以預設值（變數頁面、無備註）列出，不必逐頁呼叫 get_page_info。
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "SELECT page_number, page_type, note FROM page_types WHERE template_id = ?",
                     (template_id,)
                 )
-                return {row[0]: {'type': row[1], 'note': row[2]} for row in cursor.fetchall()}
+                info = {row[0]: {'type': row[1], 'note': row[2]} for row in cursor.fetchall()}
+            for page_number in range(1, (total_pages or 0) + 1):
+                info.setdefault(page_number, {'type': DEFAULT_PAGE_TYPE, 'note': ''})
+            return info
         except Exception as e:
             st.error(f"取得頁面資訊時發生錯誤：{e}")
             return {}
\ No newline at end of file
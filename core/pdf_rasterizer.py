@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+# --- PDF 頁面點陣化設定 ---
+RASTER_DPI = 200
+PARALLEL_MIN_PAGES = 16        # 頁數達此數量才分配到多個子程序
+PAGES_PER_TASK = 4             # 每個子程序工作負責的連續頁數
+MAX_WORKERS = 4
+
+# Poppler path - 雲端環境自適應（僅 pdf2image 備用方案使用）
+POPPLER_PATH = None  # 讓雲端環境自動尋找，本地環境可手動指定
+
+
+def _open_document(source):
+    """以檔案路徑開啟（由 MuPDF 直接讀檔，不複製整份內容）或從 bytes / 檔案物件開啟"""
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(os.fspath(source))
+    if hasattr(source, 'read'):
+        source.seek(0)
+        source = source.read()
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _render_page(page, dpi: int) -> Image.Image:
+    """每頁只產生一次 pixmap"""
+    pixmap = page.get_pixmap(dpi=dpi)
+    return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def _render_range(path: str, start: int, stop: int, dpi: int) -> List[Tuple[int, Tuple[int, int], bytes]]:
+    """子程序工作：點陣化 [start, stop) 頁，回傳 (頁碼, 尺寸, RGB 資料)"""
+    rendered = []
+    with fitz.open(path) as doc:
+        for index in range(start, stop):
+            pixmap = doc[index].get_pixmap(dpi=dpi)
+            rendered.append((index + 1, (pixmap.width, pixmap.height), pixmap.samples))
+    return rendered
+
+
+def page_count(source) -> int:
+    if fitz is None:
+        from pdf2image import pdfinfo_from_path
+
+        return pdfinfo_from_path(os.fspath(source), poppler_path=POPPLER_PATH)['Pages']
+    with _open_document(source) as doc:
+        return doc.page_count
+
+
+def iter_pdf_pages(source, dpi: int = RASTER_DPI, workers: Optional[int] = None) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    依頁碼順序逐頁產生 (頁碼, PIL 影像)，每頁轉換完成即交出，不會同時保留整份文件的影像。
+    source 為檔案路徑時，頁數足夠多就依頁碼範圍分配到子程序平行轉換（workers 為 0 或 1 時不平行）；
+    bytes 或檔案物件則在目前程序中逐頁轉換。沒有 PyMuPDF 時改用 pdf2image 逐頁轉換。
+    """
+    if fitz is None:
+        yield from _iter_with_pdf2image(source, dpi)
+        return
+
+    if workers is None:
+        workers = min(MAX_WORKERS, os.cpu_count() or 1)
+    total = page_count(source) if isinstance(source, (str, os.PathLike)) and workers > 1 else 0
+    if total < PARALLEL_MIN_PAGES:
+        with _open_document(source) as doc:
+            for index, page in enumerate(doc):
+                yield index + 1, _render_page(page, dpi)
+        return
+
+    path = os.fspath(source)
+    ranges = [(start, min(start + PAGES_PER_TASK, total)) for start in range(0, total, PAGES_PER_TASK)]
+    # Streamlit 伺服器是多執行緒程式，fork 會複製其他執行緒持有的鎖與 MuPDF 狀態，子程序一律以 spawn 啟動
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # 同時進行中的工作數量有上限，記憶體用量與頁數無關
+        pending = []
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < workers * 2:
+                start, stop = ranges[next_range]
+                pending.append(executor.submit(_render_range, path, start, stop, dpi))
+                next_range += 1
+            for page_number, size, samples in pending.pop(0).result():
+                yield page_number, Image.frombytes("RGB", size, samples)
+
+
+def _iter_with_pdf2image(source, dpi: int) -> Iterator[Tuple[int, Image.Image]]:
+    """PyMuPDF 不可用時的備用方案：pdf2image 一次只轉換一頁"""
+    from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
+
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        total = pdfinfo_from_path(path, poppler_path=POPPLER_PATH)['Pages']
+        convert = lambda page: convert_from_path(path, dpi=dpi, first_page=page, last_page=page, poppler_path=POPPLER_PATH)
+    else:
+        if hasattr(source, 'read'):
+            source.seek(0)
+            source = source.read()
+        total = pdfinfo_from_bytes(source, poppler_path=POPPLER_PATH)['Pages']
+        convert = lambda page: convert_from_bytes(source, dpi=dpi, first_page=page, last_page=page, poppler_path=POPPLER_PATH)
+    for page_number in range(1, total + 1):
+        yield page_number, convert(page_number)[0].convert("RGB")
+
+
+def render_page(source, page_number: int, dpi: int = RASTER_DPI) -> Image.Image:
+    """只點陣化指定的一頁（頁碼從 1 開始）"""
+    if fitz is None:
+        from pdf2image import convert_from_path
+
+        return convert_from_path(os.fspath(source), dpi=dpi, first_page=page_number, last_page=page_number,
+                                 poppler_path=POPPLER_PATH)[0].convert("RGB")
+    with _open_document(source) as doc:
+        return _render_page(doc[page_number - 1], dpi)
@@ -0,0 +1,204 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from core.turso_client import is_connection_error
+
+# --- 雲端資料庫呼叫策略 ---
+# 每類操作的總時限（秒，含重試）與重試次數；只有可重複執行的讀取才重試，
+# 寫入逾時時可能已在雲端完成，重試會造成重複寫入。
+OPERATION_POLICIES = {
+    'read': {'deadline': 4.0, 'retries': 2},
+    'write': {'deadline': 8.0, 'retries': 0},
+    'migrate': {'deadline': 15.0, 'retries': 1},
+    'sync': {'deadline': 15.0, 'retries': 0},
+}
+BACKOFF_BASE_SECONDS = 0.2
+BACKOFF_MAX_SECONDS = 2.0
+FAILURE_THRESHOLD = 3             # 連續失敗幾次後斷路
+RESET_TIMEOUT_SECONDS = 30        # 斷路多久後允許一次試探呼叫
+
+READ_PREFIXES = ("SELECT", "WITH", "PRAGMA")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_read_only(statement) -> bool:
+    """語句（SQL 字串或 (sql, args)）是否為唯讀查詢"""
+    sql = statement if isinstance(statement, str) else statement[0]
+    words = sql.split(None, 1)
+    return bool(words) and words[0].upper() in READ_PREFIXES
+
+
+class CircuitOpenError(RuntimeError):
+    """斷路器開啟中，呼叫未送出"""
+
+
+class CircuitBreaker:
+    """
+    連續失敗達門檻後斷路，期間的呼叫立即失敗（不再等待逾時）；
+    經過 reset_timeout 後放行一次試探呼叫，成功則恢復，失敗則重新計時。
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def allow(self) -> bool:
+        """是否允許送出呼叫；半開狀態下同時只放行一個試探呼叫"""
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._probing = False
+
+    def reset(self):
+        self.record_success()
+
+
+class RemotePolicy:
+    """
+    為雲端呼叫套用時限、重試與斷路器，並依操作名稱統計呼叫次數、失敗、重試、
+    斷路略過次數與延遲。SQL 層級的錯誤（語法、約束等 LibsqlError）代表連線正常，不重試也不計入斷路；
+    伺服器錯誤、WebSocket 中斷與 client 已關閉（見 turso_client.CONNECTION_ERROR_CODES）則與逾時、網路錯誤相同處理。
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, policies: Dict = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.breaker = breaker or CircuitBreaker()
+        self.policies = policies or OPERATION_POLICIES
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _record(self, operation: str, **counts):
+        with self._lock:
+            stats = self._stats.setdefault(operation, {
+                'calls': 0, 'attempts': 0, 'failures': 0, 'retries': 0, 'short_circuits': 0,
+                'total_latency': 0.0, 'max_latency': 0.0,
+            })
+            for key, value in counts.items():
+                if key == 'latency':
+                    stats['attempts'] += 1
+                    stats['total_latency'] += value
+                    stats['max_latency'] = max(stats['max_latency'], value)
+                else:
+                    stats[key] += value
+
+    def call(self, operation: str, attempt: Callable[[float], object], kind: str = 'read'):
+        """
+        執行 attempt(timeout)，timeout 為本次嘗試可用的剩餘時間。
+        失敗時依操作類別以加入隨機抖動的指數退避重試，直到次數或總時限用完；
+        斷路中直接拋出 CircuitOpenError。
+        """
+        policy = self.policies[kind]
+        deadline = time.monotonic() + policy['deadline']
+        self._record(operation, calls=1)
+        for attempt_number in range(policy['retries'] + 1):
+            if not self.breaker.allow():
+                self._record(operation, short_circuits=1)
+                raise CircuitOpenError("雲端資料庫暫時無法連線")
+            started = time.monotonic()
+            recorded = False
+            try:
+                result = attempt(max(deadline - started, 0.001))
+            except Exception as e:
+                self._record(operation, failures=1, latency=time.monotonic() - started)
+                if not is_connection_error(e):
+                    self.breaker.record_success()
+                    recorded = True
+                    raise
+                self.breaker.record_failure()
+                recorded = True
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt_number))
+                if attempt_number == policy['retries'] or time.monotonic() + delay >= deadline:
+                    raise
+                self._record(operation, retries=1)
+                self._sleep(delay)
+                continue
+            else:
+                self.breaker.record_success()
+                recorded = True
+            finally:
+                # 被中斷（KeyboardInterrupt、取消等）時也要結束半開試探，否則斷路器會一直維持開啟
+                if not recorded:
+                    self.breaker.record_failure()
+            self._record(operation, latency=time.monotonic() - started)
+            return result
+
+    def stats(self) -> Dict:
+        """各操作的統計（含平均延遲）與斷路器狀態"""
+        with self._lock:
+            operations = {}
+            for operation, stats in self._stats.items():
+                average = stats['total_latency'] / stats['attempts'] if stats['attempts'] else 0.0
+                operations[operation] = dict(stats, avg_latency=average)
+        return {'state': self.breaker.state, 'operations': operations}
+
+
+class GuardedRemote:
+    """以 RemotePolicy 包裝具有 run(func, timeout) 的連線管理器（供本地副本的背景同步使用）"""
+
+    def __init__(self, remote, policy: RemotePolicy, operation: str, kind: str = 'sync'):
+        self.remote = remote
+        self.policy = policy
+        self.operation = operation
+        self.kind = kind
+
+    def run(self, func, timeout: Optional[float] = None):
+        return self.policy.call(self.operation, lambda remaining: self.remote.run(func, timeout=remaining), self.kind)
+
+
+_policies: Dict[str, RemotePolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_remote_policy(url: str) -> RemotePolicy:
+    """取得指定資料庫的共用呼叫策略；同一個端點的所有操作共用一個斷路器"""
+    with _policies_lock:
+        policy = _policies.get(url)
+        if policy is None:
+            policy = _policies[url] = RemotePolicy()
+        return policy
+
+
+def reset_remote_policies():
+    with _policies_lock:
+        _policies.clear()
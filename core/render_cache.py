@@ -0,0 +1,95 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# --- 渲染結果快取設定 ---
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024   # 快取總容量上限
+
+
+def make_cache_key(template_hash: str, values: Dict[str, str], fields: Optional[Iterable[str]] = None) -> str:
+    """
+    以範本內容雜湊與正規化後的欄位值組成快取鍵。
+    若提供 fields（範本實際使用的佔位符），只納入這些欄位，多餘的欄位值不影響結果。
+    """
+    if fields is not None:
+        values = {name: values[name] for name in fields if name in values}
+    canonical = json.dumps({str(k): str(v) for k, v in values.items()},
+                           sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    digest = hashlib.sha256()
+    digest.update(template_hash.encode("ascii"))
+    digest.update(b"\0")
+    digest.update(canonical.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """以內容定址的渲染結果快取，依總位元組數做 LRU 淘汰，並統計命中率"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        size = len(data)
+        if size > self.max_bytes:
+            # 單份超過上限的結果不快取，避免把其他項目全部擠出
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= len(old)
+            self._entries[key] = data
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict:
+        """回傳命中、未命中、淘汰次數與目前容量，供調整快取大小參考"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache:
+    """取得全域渲染結果快取"""
+    global _render_cache
+    with _render_cache_lock:
+        if _render_cache is None:
+            _render_cache = RenderCache()
+        return _render_cache
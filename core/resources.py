@@ -0,0 +1,50 @@
+import threading
+import time
+
+from core.migrations import reset_migration_state
+
+# --- 行程共用的後端資源 ---
+# TursoDatabase 與 GitHubStorage 在整個行程中各只建立一次：設定（st.secrets / 環境變數）只解析一次，
+# 雲端表格的遷移檢查也只在第一次取得時執行，不再於每次重新執行頁面時重複。
+SCHEMA_RETRY_SECONDS = 60   # 雲端表格遷移失敗後，至少間隔多久才再試
+
+_resources = {}
+_resources_lock = threading.RLock()
+
+
+def get_turso_database():
+    """
+    取得共用的 TursoDatabase；雲端模式下第一次取得時建立或遷移表格。
+    失敗時等 SCHEMA_RETRY_SECONDS 且斷路器未開啟才再試，期間直接回傳實例；錯誤訊息只顯示一次。
+    """
+    with _resources_lock:
+        turso_db = _resources.get('turso')
+        if turso_db is None:
+            from core.turso_database import TursoDatabase
+            turso_db = _resources['turso'] = TursoDatabase()
+        if turso_db.is_cloud_mode() and not _resources.get('turso_schema_ready'):
+            now = time.monotonic()
+            if now >= _resources.get('turso_schema_retry_at', 0.0) and turso_db.remote_stats()['state'] != "open":
+                ready = bool(turso_db.create_tables(silent=_resources.get('turso_schema_error_shown', False)))
+                _resources['turso_schema_ready'] = ready
+                if not ready:
+                    _resources['turso_schema_error_shown'] = True
+                    _resources['turso_schema_retry_at'] = now + SCHEMA_RETRY_SECONDS
+        return turso_db
+
+
+def get_github_storage():
+    """取得共用的 GitHubStorage"""
+    with _resources_lock:
+        storage = _resources.get('github')
+        if storage is None:
+            from core.github_storage import GitHubStorage
+            storage = _resources['github'] = GitHubStorage()
+        return storage
+
+
+def reset_resources():
+    """捨棄已建立的資源，下次取得時重新讀取設定並重新檢查資料庫結構（測試或設定變更後使用）"""
+    with _resources_lock:
+        _resources.clear()
+    reset_migration_state()
@@ -0,0 +1,352 @@
+import io
+import os
+import re
+import copy
+import json
+import struct
+import bisect
+import hashlib
+import threading
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional
+from lxml import etree
+
+# --- 範本索引設定 ---
+ROOT_DIR = Path(__file__).parent.parent
+INDEX_DIR = ROOT_DIR / "data" / "template_index"
+INDEX_VERSION = 2
+
+# 佔位符格式：{{欄位名稱}}
+PLACEHOLDER_PATTERN = re.compile(r"\{\{([^{}]+)\}\}")
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W_P = f"{{{W_NS}}}p"
+W_T = f"{{{W_NS}}}t"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+S_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+S_SI = f"{{{S_NS}}}si"
+S_IS = f"{{{S_NS}}}is"
+S_T = f"{{{S_NS}}}t"
+S_RPH = f"{{{S_NS}}}rPh"
+
+# 可能含有文字內容的 Word 部件（本文、頁首、頁尾、註腳；文字方塊位於這些部件內）
+DOCX_TEXT_PART = re.compile(r"^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$")
+# 可能含有字串的 Excel 部件：共用字串表與含 inline string 的工作表
+XLSX_SHARED_STRINGS = "xl/sharedStrings.xml"
+XLSX_WORKSHEET_PART = re.compile(r"^xl/worksheets/[^/]+\.xml$")
+
+_index_cache: Dict[str, Dict] = {}
+_hash_cache: Dict[tuple, str] = {}
+_cache_lock = threading.Lock()
+
+
+def compute_file_hash(path) -> str:
+    """計算檔案內容的 SHA-256，並依路徑、大小與修改時間快取結果"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _cache_lock:
+        cached = _hash_cache.get(key)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    with _cache_lock:
+        _hash_cache[key] = content_hash
+    return content_hash
+
+
+def find_placeholders(text: str) -> List[str]:
+    """回傳文字中出現的佔位符名稱（保留出現順序、去除重複）"""
+    if not text or "{{" not in text:
+        return []
+    return list(dict.fromkeys(PLACEHOLDER_PATTERN.findall(text)))
+
+
+def prepare_values(field_values: Dict) -> Dict[str, str]:
+    """將欄位值統一轉為字串，供單次掃描替換使用"""
+    return {str(key): str(value) for key, value in field_values.items()}
+
+
+def render_text(text: str, values: Dict[str, str]) -> str:
+    """
+    單次掃描替換文字中的所有佔位符。
+    以預先編譯的正規表達式比對 {{name}}，再查字典取值；未提供值的佔位符保持原樣。
+    """
+    if not text or "{{" not in text:
+        return text
+    return PLACEHOLDER_PATTERN.sub(lambda m: values.get(m.group(1), m.group(0)), text)
+
+
+def _owning_paragraph(node):
+    """找出節點所屬的最內層段落（文字方塊內的段落不算外層段落的內容）"""
+    parent = node.getparent()
+    while parent is not None and parent.tag != W_P:
+        parent = parent.getparent()
+    return parent
+
+
+def paragraph_text_nodes(p) -> List:
+    """取得屬於此段落本身的 <w:t> 節點"""
+    return [t for t in p.iter(W_T) if _owning_paragraph(t) is p]
+
+
+def string_item_text_nodes(item) -> List:
+    """取得共用字串 <si> 或 inline string <is> 的 <t> 節點（排除注音 rPh）"""
+    return [t for t in item.iter(S_T) if t.getparent().tag != S_RPH]
+
+
+def _docx_part_spec(name: str):
+    """回傳 docx 部件的 (容器標籤, 取文字節點函式)，不需處理時回傳 None"""
+    if DOCX_TEXT_PART.match(name):
+        return W_P, paragraph_text_nodes
+    return None
+
+
+def _xlsx_part_spec(name: str):
+    """回傳 xlsx 部件的 (容器標籤, 取文字節點函式)，不需處理時回傳 None"""
+    if name == XLSX_SHARED_STRINGS:
+        return S_SI, string_item_text_nodes
+    if XLSX_WORKSHEET_PART.match(name):
+        return S_IS, string_item_text_nodes
+    return None
+
+
+PART_SPECS = {
+    "docx": _docx_part_spec,
+    "xlsx": _xlsx_part_spec,
+}
+
+
+def _compile_zip_parts(template_path, part_spec) -> Dict[str, Dict[str, List[str]]]:
+    """掃描 zip 內的文字部件，記錄含佔位符的容器元素序號（段落、共用字串或 inline string）"""
+    locations = {}
+    with zipfile.ZipFile(template_path) as zf:
+        for name in zf.namelist():
+            spec = part_spec(name)
+            if spec is None:
+                continue
+            data = zf.read(name)
+            if b"{{" not in data:
+                continue
+            container_tag, text_nodes = spec
+            root = etree.fromstring(data)
+            part_locations = {}
+            for ordinal, container in enumerate(root.iter(container_tag)):
+                text = "".join(t.text or "" for t in text_nodes(container))
+                fields = find_placeholders(text)
+                if fields:
+                    part_locations[str(ordinal)] = fields
+            if part_locations:
+                locations[name] = part_locations
+    return locations
+
+
+def compile_template(template_path) -> Dict:
+    """
+    將範本編譯為佔位符位置索引：「zip 部件 → 容器元素序號 → 欄位」。
+    docx 的容器為段落 <w:p>；xlsx 的容器為共用字串 <si> 與 inline string <is>。
+    """
+    ext = os.path.splitext(template_path)[1].lower()
+    file_type = ext.lstrip(".")
+    if file_type not in PART_SPECS:
+        raise ValueError(f"不支援的檔案類型: {ext}")
+    locations = _compile_zip_parts(template_path, PART_SPECS[file_type])
+
+    fields = []
+    for part_locations in locations.values():
+        for location_fields in part_locations.values():
+            fields.extend(location_fields)
+
+    return {
+        "version": INDEX_VERSION,
+        "hash": compute_file_hash(template_path),
+        "file_type": file_type,
+        "fields": list(dict.fromkeys(fields)),
+        "locations": locations,
+    }
+
+
+def _load_index_from_disk(content_hash: str) -> Optional[Dict]:
+    index_path = INDEX_DIR / f"{content_hash}.json"
+    if not index_path.exists():
+        return None
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get("version") == INDEX_VERSION else None
+
+
+def _save_index_to_disk(index: Dict):
+    try:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        index_path = INDEX_DIR / f"{index['hash']}.json"
+        tmp_path = index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # 索引只是快取，寫入失敗時下次重新編譯即可
+        pass
+
+
+def get_template_index(template_path) -> Dict:
+    """取得範本的佔位符索引（記憶體 → 磁碟 → 重新編譯），以內容雜湊為鍵"""
+    content_hash = compute_file_hash(template_path)
+    with _cache_lock:
+        index = _index_cache.get(content_hash)
+    if index is not None:
+        return index
+
+    index = _load_index_from_disk(content_hash)
+    if index is None:
+        index = compile_template(template_path)
+        _save_index_to_disk(index)
+
+    with _cache_lock:
+        _index_cache[content_hash] = index
+    return index
+
+
+# --- 直接改寫 zip 內 XML 的渲染器 ---
+
+def substitute_text_nodes(nodes: List, values: Dict[str, str]) -> List:
+    """
+    在一組連續的文字節點上執行單次替換，允許佔位符跨越多個節點（例如被拆成多個 <w:r>）。
+    替換值寫入佔位符起始所在的節點，其餘節點只保留未被佔位符佔用的文字，原有格式不變。
+    回傳內容有變動的節點。
+    """
+    texts = [node.text or "" for node in nodes]
+    full = "".join(texts)
+    if "{{" not in full:
+        return []
+    matches = [m for m in PLACEHOLDER_PATTERN.finditer(full) if m.group(1) in values]
+    if not matches:
+        return []
+
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text)
+    new_texts = [""] * len(nodes)
+
+    def copy_range(begin, end):
+        for i, start in enumerate(starts):
+            lo, hi = max(begin, start), min(end, start + len(texts[i]))
+            if lo < hi:
+                new_texts[i] += full[lo:hi]
+
+    cursor = 0
+    for m in matches:
+        copy_range(cursor, m.start())
+        owner = bisect.bisect_right(starts, m.start()) - 1
+        new_texts[owner] += values[m.group(1)]
+        cursor = m.end()
+    copy_range(cursor, len(full))
+
+    changed = []
+    for node, old, new in zip(nodes, texts, new_texts):
+        if new != old:
+            node.text = new
+            changed.append(node)
+    return changed
+
+
+def copy_zip_member_raw(zin: zipfile.ZipFile, info: zipfile.ZipInfo, zout: zipfile.ZipFile):
+    """將 zip 成員的壓縮資料逐位元組複製到輸出檔，不解壓縮也不重新壓縮"""
+    if info.flag_bits & 0x1:
+        # 加密成員無法直接搬移，改走一般讀寫
+        zout.writestr(info, zin.read(info.filename))
+        return
+
+    src = zin.fp
+    src.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, src.read(zipfile.sizeFileHeader))
+    src.seek(header[10] + header[11], os.SEEK_CUR)  # 跳過檔名與 extra 欄位
+
+    out_info = copy.copy(info)
+    out_info.flag_bits &= ~0x08  # 大小已知，不需要 data descriptor
+    with zout._lock:
+        out_info.header_offset = zout.fp.tell()
+        zout.fp.write(out_info.FileHeader())
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = src.read(min(remaining, COPY_CHUNK_SIZE))
+            if not chunk:
+                raise zipfile.BadZipFile(f"成員資料不完整：{info.filename}")
+            zout.fp.write(chunk)
+            remaining -= len(chunk)
+        zout.filelist.append(out_info)
+        zout.NameToInfo[out_info.filename] = out_info
+        zout.start_dir = zout.fp.tell()
+        zout._didModify = True
+
+
+def _render_part(data: bytes, ordinals, values: Dict[str, str], container_tag, text_nodes) -> bytes:
+    """只改寫索引中記錄的容器元素，保留原有格式"""
+    root = etree.fromstring(data)
+    targets = {int(ordinal) for ordinal in ordinals}
+    for ordinal, container in enumerate(root.iter(container_tag)):
+        if ordinal not in targets:
+            continue
+        for node in substitute_text_nodes(text_nodes(container), values):
+            node.set(XML_SPACE, "preserve")
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def _render_zip(template_path, index: Dict, values: Dict[str, str], output, part_spec):
+    locations = index["locations"]
+    with zipfile.ZipFile(template_path) as zin, zipfile.ZipFile(output, "w") as zout:
+        for info in zin.infolist():
+            part_locations = locations.get(info.filename)
+            spec = part_spec(info.filename) if part_locations else None
+            if spec is not None:
+                data = _render_part(zin.read(info.filename), part_locations, values, *spec)
+                zout.writestr(info, data, compress_type=zipfile.ZIP_DEFLATED)
+            else:
+                copy_zip_member_raw(zin, info, zout)
+
+
+def render_docx(template_path, index: Dict, values: Dict[str, str], output):
+    """
+    以 zip 方式渲染 docx：只解析並改寫含佔位符的 XML 部件（本文、頁首、頁尾、文字方塊），
+    其餘成員（圖片、字型、樣式等）以壓縮後的原始位元組直接複製。
+    output 可為檔案路徑或可寫入的二進位檔案物件。
+    """
+    _render_zip(template_path, index, values, output, _docx_part_spec)
+
+
+def render_xlsx(template_path, index: Dict, values: Dict[str, str], output):
+    """
+    以 zip 方式渲染 xlsx：只改寫 xl/sharedStrings.xml 與含 inline string 佔位符的工作表，
+    樣式、圖表、公式等其他成員原封不動複製，處理時間只與佔位符字串數量有關。
+    """
+    _render_zip(template_path, index, values, output, _xlsx_part_spec)
+
+
+def render_template(template_path, index: Dict, values: Dict[str, str], output):
+    """依索引記錄的檔案類型渲染範本"""
+    if index["file_type"] == "docx":
+        render_docx(template_path, index, values, output)
+    elif index["file_type"] == "xlsx":
+        render_xlsx(template_path, index, values, output)
+    else:
+        raise ValueError(f"不支援的檔案類型: {index['file_type']}")
+
+
+def render_to_bytes(template_path, index: Dict, values: Dict[str, str]) -> bytes:
+    """將範本渲染到記憶體並回傳檔案內容"""
+    buffer = io.BytesIO()
+    render_template(template_path, index, values, buffer)
+    return buffer.getvalue()
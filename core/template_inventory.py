@@ -0,0 +1,73 @@
+import os
+from typing import Dict, Iterable, List, Optional
+
+from core.template_engine import get_template_index
+
+
+def extract_inventory(template_path) -> Dict:
+    """上傳時擷取範本使用的佔位符清單與內容雜湊，存入 template_files 資料列"""
+    index = get_template_index(template_path)
+    return {'placeholders': list(index['fields']), 'content_hash': index['hash']}
+
+
+def file_placeholders(file_info: Dict) -> Optional[List[str]]:
+    """
+    取得範本檔案的佔位符清單：優先使用資料庫中記錄的清單，
+    舊資料沒有記錄時才從範本索引取得；檔案不存在則回傳 None。
+    """
+    placeholders = file_info.get('placeholders')
+    if placeholders is not None:
+        return placeholders
+    path = file_info.get('filepath')
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return list(get_template_index(path)['fields'])
+    except Exception:
+        return None
+
+
+def build_coverage_matrix(field_definitions: List[Dict], template_files: List[Dict]) -> Dict:
+    """
+    建立「欄位 × 範本」對照表。
+    回傳 fields（欄位順序）、templates（檔名）、matrix（欄位 → 各範本是否使用）、
+    undefined（範本中出現但未定義的佔位符）、unused（沒有任何範本使用的欄位）與
+    unknown（無法取得佔位符清單的範本）。
+    """
+    defined = [field['name'] for field in field_definitions]
+    defined_set = set(defined)
+    inventories = {}
+    unknown = []
+    for file_info in template_files:
+        placeholders = file_placeholders(file_info)
+        if placeholders is None:
+            unknown.append(file_info['filename'])
+        else:
+            inventories[file_info['filename']] = set(placeholders)
+
+    templates = list(inventories)
+    matrix = {name: {template: name in inventories[template] for template in templates} for name in defined}
+    undefined = {}
+    for template, placeholders in inventories.items():
+        missing = [name for name in sorted(placeholders) if name not in defined_set]
+        if missing:
+            undefined[template] = missing
+    return {
+        'fields': defined,
+        'templates': templates,
+        'matrix': matrix,
+        'undefined': undefined,
+        'unused': [name for name in defined if not any(matrix[name].values())],
+        'unknown': unknown,
+    }
+
+
+def templates_using_fields(template_files: List[Dict], field_names: Iterable[str]) -> List[Dict]:
+    """只保留至少使用其中一個欄位的範本；無法取得佔位符清單的範本一律保留"""
+    field_names = set(field_names)
+    selected = []
+    for file_info in template_files:
+        placeholders = file_placeholders(file_info)
+        if placeholders is None or field_names.intersection(placeholders):
+            selected.append(file_info)
+    return selected
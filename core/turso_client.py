@@ -0,0 +1,176 @@
+import asyncio
+import atexit
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from libsql_client import LibsqlError, create_client
+
+# --- Turso 長期連線設定 ---
+DEFAULT_TIMEOUT_SECONDS = 10          # 單次操作的等待上限
+HEALTH_CHECK_INTERVAL_SECONDS = 60    # 閒置超過此時間的連線，使用前先確認仍可用
+SHUTDOWN_TIMEOUT_SECONDS = 5
+
+# 代表連線本身出問題（HTTP 5xx、WebSocket 中斷、client 已關閉）而非 SQL 錯誤的 LibsqlError 代碼
+CONNECTION_ERROR_CODES = frozenset({"SERVER_ERROR", "HRANA_WEBSOCKET_ERROR", "CLIENT_CLOSED"})
+
+_client_factory: Optional[Callable] = None
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """例外是否為連線層級的錯誤：非 LibsqlError 的例外（逾時、網路錯誤），或代碼屬於 CONNECTION_ERROR_CODES 的 LibsqlError"""
+    if isinstance(error, LibsqlError):
+        return error.code in CONNECTION_ERROR_CODES
+    return isinstance(error, Exception)
+
+
+def is_constraint_error(error: BaseException) -> bool:
+    """例外是否為約束違反（主鍵、唯一、外鍵等）"""
+    if not isinstance(error, LibsqlError):
+        return False
+    return (error.code or "").startswith("SQLITE_CONSTRAINT") or "constraint failed" in str(error).lower()
+
+
+def connect_client(url: str, auth_token: Optional[str] = None):
+    """
+    預設的 client 工廠：fake:// URL 使用以本地 SQLite 模擬的 client（離線測試與效能量測），
+    其餘交給 libsql_client.create_client。
+    """
+    if url.startswith("fake:"):
+        from core.fake_libsql import create_fake_client
+        return create_fake_client(url, auth_token=auth_token)
+    return create_client(url=url, auth_token=auth_token)
+
+
+def set_client_factory(factory: Optional[Callable] = None):
+    """
+    替換建立 client 的函式 factory(url=..., auth_token=...)，None 恢復預設。
+    只影響之後建立的連線管理器；已建立的需先以 shutdown_client_managers() 關閉。
+    """
+    global _client_factory
+    _client_factory = factory
+
+
+class TursoClientManager:
+    """
+    在專屬的背景事件迴圈執行緒上維護一個長期使用的 libsql client，
+    同步程式碼以 run() 提交協程（run_coroutine_threadsafe）並等待結果，
+    不必每次查詢都重新建立連線、事件迴圈與執行緒。
+    """
+
+    def __init__(self, url: str, auth_token: Optional[str], connect: Callable = connect_client):
+        self.url = url
+        self.auth_token = auth_token
+        self._connect = connect
+        self._client = None
+        self._last_used = 0.0
+        self._client_lock = None   # asyncio.Lock，在事件迴圈中建立
+        self._closed = False
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="turso-client-loop", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._client_lock = asyncio.Lock()
+        self._started.set()
+        self._loop.run_forever()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def _reset_client(self):
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    async def _get_client(self):
+        """取得可用的 client：尚未建立或已關閉則重新連線，閒置過久則先做健康檢查"""
+        async with self._client_lock:
+            if self._client is not None and self._client.closed:
+                self._client = None
+            if self._client is not None and time.monotonic() - self._last_used > HEALTH_CHECK_INTERVAL_SECONDS:
+                try:
+                    await self._client.execute("SELECT 1")
+                except Exception:
+                    await self._reset_client()
+            if self._client is None:
+                self._client = self._connect(url=self.url, auth_token=self.auth_token)
+            return self._client
+
+    async def _call(self, func: Callable[[Any], Awaitable]):
+        client = await self._get_client()
+        try:
+            result = await func(client)
+        except Exception as e:
+            # 連線層級的錯誤：丟棄 client，下次呼叫時重新連線；SQL 層級的錯誤（語法、約束等）保留連線
+            if is_connection_error(e):
+                await self._reset_client()
+            raise
+        self._last_used = time.monotonic()
+        return result
+
+    def run(self, func: Callable[[Any], Awaitable], timeout: float = DEFAULT_TIMEOUT_SECONDS):
+        """在背景事件迴圈中執行 func(client) 並等待結果；逾時或失敗時拋出例外"""
+        if self.closed:
+            raise RuntimeError("Turso 連線已關閉")
+        future = asyncio.run_coroutine_threadsafe(self._call(func), self._loop)
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+    def health_check(self, timeout: float = DEFAULT_TIMEOUT_SECONDS) -> bool:
+        """確認目前的連線可用；失敗時丟棄連線，下次使用會重新建立"""
+        try:
+            self.run(lambda client: client.execute("SELECT 1"), timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        """關閉 client 並停止背景事件迴圈"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            asyncio.run_coroutine_threadsafe(self._reset_client(), self._loop).result(SHUTDOWN_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(SHUTDOWN_TIMEOUT_SECONDS)
+        if not self._loop.is_running():
+            self._loop.close()
+
+
+_managers: Dict[Tuple[str, Optional[str]], TursoClientManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_client_manager(url: str, auth_token: Optional[str]) -> TursoClientManager:
+    """取得（必要時建立）指定資料庫的共用連線管理器，所有工作階段共用同一個"""
+    key = (url, auth_token)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None or manager.closed:
+            manager = _managers[key] = TursoClientManager(url, auth_token, connect=_client_factory or connect_client)
+        return manager
+
+
+def shutdown_client_managers():
+    """關閉所有共用連線（程式結束時自動執行）"""
+    with _managers_lock:
+        managers = list(_managers.values())
+        _managers.clear()
+    for manager in managers:
+        manager.close()
+
+
+atexit.register(shutdown_client_managers)
@@ -4,23 +4,72 @@ from typing import List, Dict, Optional
 import tempfile
 import shutil
 from pathlib import Path
-import asyncio
 import json
-from libsql_client import create_client
+
+from core.template_inventory import extract_inventory
+from core.database import (
+    diff_field_definitions, field_row_values, attach_group_fields, get_db_connection, init_database,
+    UPDATE_FIELD_SQL, TEMPLATE_MIGRATIONS, GROUP_SUMMARY_SQL, ALL_FIELDS_SQL
+)
+from core.migrations import TURSO, migrate_libsql, run_once
+from core.remote_policy import CircuitOpenError, get_remote_policy, is_read_only
+from core.turso_client import get_client_manager, is_connection_error
+
+FIELD_INSERT = "INSERT INTO field_definitions (group_id, name, default_value, description, dropdown_options, sort_order)"
+FILE_COLUMNS = ("id", "group_id", "filename", "filepath", "file_type", "file_size", "created_at", "placeholders", "content_hash")
+FILE_INSERT = "INSERT INTO template_files (group_id, filename, filepath, file_type, file_size, placeholders, content_hash)"
+MAX_SQL_VARIABLES = 999  # SQLite 單一語句可綁定的參數上限
+
+def _insert_statements(insert: str, rows: List[list], group_name: str = None) -> List[tuple]:
+    """
+    產生分批的多列 INSERT 語句 [(sql, args)]，每批不超過 SQLite 的參數數量上限。
+    提供 group_name 時 rows 不含 group_id，改以群組名稱查出 ID，
+    讓同一個批次中剛建立、尚不知道 ID 的群組也能寫入關聯資料。
+    """
+    if not rows:
+        return []
+    width = len(rows[0])
+    chunk_size = max(1, (MAX_SQL_VARIABLES - 1) // width)
+    placeholder = "(" + ", ".join("?" * width) + ")"
+    statements = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        values = ", ".join([placeholder] * len(chunk))
+        args = [value for row in chunk for value in row]
+        if group_name is None:
+            statements.append((f"{insert} VALUES {values}", args))
+        else:
+            statements.append((
+                f"{insert} SELECT g.id, v.* FROM template_groups g, (VALUES {values}) v WHERE g.name = ?",
+                args + [group_name]
+            ))
+    return statements
+
+def _inventory_columns(file_info: Dict):
+    """取得要寫入 template_files 的 (佔位符 JSON, 內容雜湊)；沒有記錄時從範本擷取"""
+    if file_info.get('placeholders') is None:
+        try:
+            file_info = dict(file_info, **extract_inventory(file_info['filepath']))
+        except Exception:
+            return None, None
+    return json.dumps(file_info['placeholders'], ensure_ascii=False), file_info.get('content_hash')
 
 class TursoDatabase:
     """Turso 雲端資料庫管理類"""
     
     def __init__(self):
-        self.client = None
         self._init_turso()
     
     def _init_turso(self):
-        """初始化 Turso 連接"""
+        """初始化 Turso 連接設定（實際連線由共用的連線管理器在第一次使用時建立）"""
         try:
-            # 從 Streamlit secrets 獲取配置
-            turso_url = st.secrets.get("turso", {}).get("url")
-            turso_token = st.secrets.get("turso", {}).get("token")
+            # 從 Streamlit secrets 獲取配置；沒有 secrets.toml 時讀取會拋出例外，改用環境變數
+            try:
+                turso_config = dict(st.secrets.get("turso", {}))
+            except Exception:
+                turso_config = {}
+            turso_url = turso_config.get("url")
+            turso_token = turso_config.get("token")
             
             # 如果無法從 secrets 獲取，嘗試從環境變數獲取
             if not turso_url:
@@ -29,17 +78,17 @@ class TursoDatabase:
                 turso_token = os.environ.get("TURSO_TOKEN")
             
             if turso_url and turso_token:
-                # 延遲創建客戶端，避免在初始化時就觸發異步問題
                 self.turso_url = turso_url
                 self.turso_token = turso_token
-                self.client = None  # 暫時設為 None，在需要時才創建
-                # 移除初始化時的消息顯示，避免在啟動時就顯示
-            else:
-                # 移除初始化時的消息顯示，避免在啟動時就顯示
-                self.client = None
-        except Exception as e:
+
+            # 本地副本（讀取走本地、寫入背景推送）預設關閉，以 TURSO_REPLICA=1 或 secrets 的 turso.replica 啟用
+            use_replica = turso_config.get("replica")
+            if use_replica is None:
+                use_replica = os.environ.get("TURSO_REPLICA", "0") not in ("0", "false", "False", "")
+            self.use_replica = bool(use_replica)
+        except Exception:
             # 移除初始化時的消息顯示，避免在啟動時就顯示
-            self.client = None
+            pass
     
     def is_cloud_mode(self) -> bool:
         """檢查是否為雲端模式"""
@@ -68,111 +117,154 @@ class TursoDatabase:
             st.warning("⚠️ 未配置 Turso，將使用本地 SQLite")
             st.info("💡 如需使用雲端資料庫，請在 Streamlit Cloud 中配置 Turso secrets")
     
-    def _ensure_client(self):
-        """確保客戶端已創建"""
-        if self.client is None and self.is_cloud_mode():
-            try:
-                import concurrent.futures
-                import asyncio
-                
-                async def create_client_async():
-                    return create_client(
-                        url=self.turso_url,
-                        auth_token=self.turso_token
-                    )
-                
-                def create_client_safe():
-                    return asyncio.run(create_client_async())
-                
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(create_client_safe)
-                    self.client = future.result(timeout=10)
-                
-                return True
-            except Exception as e:
-                st.warning(f"⚠️ Turso 客戶端創建失敗：{str(e)}")
-                return False
-        return self.client is not None
-    
-    def _execute_async(self, async_func):
-        """執行異步操作的通用方法"""
+    def _execute_async(self, async_func, operation: str = "execute", kind: str = "write", fallback=None):
+        """
+        在共用的背景事件迴圈上執行 async_func(client)，回傳結果；
+        連線由所有工作階段共用，不會每次重新建立。
+        呼叫套用 remote_policy 的時限、重試（僅讀取）與斷路器：斷路中或連線失敗時不再等待逾時，
+        讀取改由 fallback()（本地資料庫）回應；寫入無法保存，提示後回傳 None。其他失敗時顯示錯誤並回傳 None。
+        """
+        manager = get_client_manager(self.turso_url, self.turso_token)
         try:
-            import concurrent.futures
-            import asyncio
-            
-            def run_async():
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    return loop.run_until_complete(async_func())
-                finally:
-                    loop.close()
-            
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(run_async)
-                return future.result(timeout=10)
+            return get_remote_policy(self.turso_url).call(
+                operation, lambda timeout: manager.run(async_func, timeout=timeout), kind
+            )
+        except CircuitOpenError:
+            if fallback is not None:
+                return fallback()
+            st.warning("⚠️ 雲端暫時無法連線，變更未儲存，請稍後再試")
+            return None
         except Exception as e:
+            if fallback is not None and is_connection_error(e):
+                st.warning("⚠️ 雲端讀取失敗，暫時顯示本地資料庫內容")
+                return fallback()
             st.error(f"異步操作失敗：{str(e)}")
             return None
 
-    def create_tables(self):
-        """創建必要的表格"""
+    @staticmethod
+    def _local_read(statements: List) -> List:
+        """在本地 SQLite 資料庫（與雲端相同結構）執行唯讀語句，回傳與 ResultSet 相容的結果"""
+        from core.turso_replica import LocalResult
+
+        init_database()
+        results = []
+        with get_db_connection() as conn:
+            for statement in statements:
+                sql, args = (statement, []) if isinstance(statement, str) else (statement[0], statement[1] or [])
+                cursor = conn.execute(sql, list(args))
+                columns = [c[0] for c in cursor.description] if cursor.description else []
+                results.append(LocalResult(columns, [tuple(row) for row in cursor.fetchall()]))
+        return results
+    
+    def _replica(self):
+        """取得共用的本地副本；未啟用或無法建立時回傳 None，改為直接存取雲端"""
+        if not getattr(self, 'use_replica', False):
+            return None
+        try:
+            from core.turso_replica import get_replica
+            return get_replica(self.turso_url, self.turso_token)
+        except Exception:
+            return None
+
+    def remote_stats(self) -> Dict:
+        """雲端呼叫的斷路器狀態與各操作的延遲、失敗統計"""
+        if not self.is_cloud_mode():
+            return {'state': None, 'operations': {}}
+        return get_remote_policy(self.turso_url).stats()
+
+    def replica_status(self) -> Optional[Dict]:
+        """本地副本的同步狀態（待推送、衝突筆數等）；未使用副本時回傳 None"""
+        replica = self._replica()
+        return replica.status() if replica else None
+
+    def replica_conflicts(self, limit: int = 5) -> List[Dict]:
+        """最近被雲端資料取代而捨棄的本地變更；未使用副本時回傳空列表"""
+        replica = self._replica()
+        return replica.conflicts(limit) if replica else []
+
+    def clear_replica_conflicts(self):
+        replica = self._replica()
+        if replica is not None:
+            replica.clear_conflicts()
+
+    def resolve_id(self, table: str, row_id):
+        """
+        使用本地副本時，新增資料列先取得本地暫時 ID，背景推送後改為雲端配發的 ID；
+        傳入暫時 ID 時回傳目前有效的 ID。未使用副本時原樣回傳。
+        """
+        replica = self._replica()
+        return replica.resolve_id(table, row_id) if replica else row_id
+
+    def is_pending_id(self, table: str, row_id) -> bool:
+        """ID 是否為尚未推送到雲端的本地暫時 ID"""
+        replica = self._replica()
+        return replica.is_pending_id(table, row_id) if replica else False
+
+    def _query(self, sql: str, args: list = None, operation: str = "query", id_args: Dict[int, str] = None):
+        """執行查詢並回傳資料列，失敗時回傳 None；id_args 為 {參數位置: 表格}，使用本地副本時把暫時 ID 換成目前的 ID"""
+        replica = self._replica()
+        if replica is not None:
+            try:
+                return replica.query(sql, args, id_args)
+            except Exception as e:
+                st.error(f"本地副本查詢失敗：{str(e)}")
+                return None
+
+        async def fetch(client):
+            return (await client.execute(sql, args or [])).rows
+        return self._execute_async(fetch, operation, kind="read",
+                                   fallback=lambda: self._local_read([(sql, args)])[0].rows)
+    
+    def _write(self, sql: str, args: list = None, operation: str = "write"):
+        """執行寫入並回傳 ResultSet（含 last_insert_rowid），失敗時回傳 None"""
+        if self._replica() is not None:
+            results = self._batch([(sql, args or [])], operation)
+            return results[0] if results else None
+
+        async def write(client):
+            return await client.execute(sql, args or [])
+        return self._execute_async(write, operation, kind="write")
+    
+    def _batch(self, statements: List[tuple], operation: str = "batch"):
+        """
+        以單一批次送出多個語句 [(sql, args)]，只需一次往返；
+        批次在同一個交易中執行，任何一句失敗則全部回滾。回傳各語句的 ResultSet，失敗時回傳 None。
+        使用本地副本時在本地交易中執行，寫入由背景執行緒推送到雲端。
+        """
+        replica = self._replica()
+        if replica is not None:
+            try:
+                return replica.execute_batch(statements)
+            except Exception as e:
+                st.error(f"本地副本寫入失敗：{str(e)}")
+                return None
+
+        async def run_batch(client):
+            return await client.batch(statements)
+        if all(is_read_only(statement) for statement in statements):
+            return self._execute_async(run_batch, operation, "read", fallback=lambda: self._local_read(statements))
+        return self._execute_async(run_batch, operation, "write")
+
+    def create_tables(self, silent: bool = False):
+        """創建必要的表格（依版本套用尚未執行的遷移，每個行程只檢查一次）；silent 為 True 時失敗不顯示訊息"""
         if not self.is_cloud_mode():
             return
         
         try:
-            # 創建所有必要的表格
-            tables_sql = [
-                """CREATE TABLE IF NOT EXISTS comparison_templates (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE,
-                    filename TEXT NOT NULL,
-                    filepath TEXT NOT NULL,
-                    file_type TEXT NOT NULL,
-                    file_size INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );""",
-                """CREATE TABLE IF NOT EXISTS template_groups (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE,
-                    source_excel_path TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );""",
-                """CREATE TABLE IF NOT EXISTS template_files (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER NOT NULL,
-                    filename TEXT NOT NULL,
-                    filepath TEXT NOT NULL,
-                    file_type TEXT NOT NULL,
-                    file_size INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (group_id) REFERENCES template_groups (id) ON DELETE CASCADE
-                );""",
-                """CREATE TABLE IF NOT EXISTS field_definitions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    default_value TEXT,
-                    description TEXT,
-                    dropdown_options TEXT,
-                    sort_order INTEGER,
-                    FOREIGN KEY (group_id) REFERENCES template_groups (id) ON DELETE CASCADE
-                );"""
-            ]
+            async def async_migrate(client):
+                return await migrate_libsql(client, TEMPLATE_MIGRATIONS)
             
-            async def async_create():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
+            def apply():
+                manager = get_client_manager(self.turso_url, self.turso_token)
+                get_remote_policy(self.turso_url).call(
+                    "create_tables", lambda timeout: manager.run(async_migrate, timeout=timeout), "migrate"
                 )
-                for sql in tables_sql:
-                    await client.execute(sql)
-                await client.close()
             
-            self._execute_async(async_create)
+            run_once((TURSO, self.turso_url), apply)
             return True
         except Exception as e:
-            st.error(f"創建表格失敗: {str(e)}")
+            if not silent:
+                st.error(f"創建表格失敗: {str(e)}")
             return False
     
     def get_comparison_templates(self) -> List[Dict]:
@@ -181,16 +273,7 @@ class TursoDatabase:
             return []
         
         try:
-            async def async_get():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                result = await client.execute("SELECT * FROM comparison_templates ORDER BY created_at DESC")
-                await client.close()
-                return result.rows
-            
-            rows = self._execute_async(async_get)
+            rows = self._query("SELECT * FROM comparison_templates ORDER BY created_at DESC", operation="get_comparison_templates")
             if rows is None:
                 return []
             
@@ -222,18 +305,9 @@ class TursoDatabase:
             VALUES (?, ?, ?, ?, ?)
             """
             
-            async def async_save():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                result = await client.execute(sql, [name, filename, filepath, file_type, file_size])
-                await client.close()
+            result = self._write(sql, [name, filename, filepath, file_type, file_size], operation="save_comparison_template")
+            if result is not None:
                 return result.last_insert_rowid
-            
-            template_id = self._execute_async(async_save)
-            if template_id is not None:
-                return template_id
             else:
                 return -1
         except Exception as e:
@@ -246,18 +320,10 @@ class TursoDatabase:
             return False
         
         try:
+            template_id = self.resolve_id("comparison_templates", template_id)
             sql = "DELETE FROM comparison_templates WHERE id = ?"
             
-            async def async_delete():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                await client.execute(sql, [template_id])
-                await client.close()
-                return True
-            
-            result = self._execute_async(async_delete)
+            result = self._write(sql, [template_id], operation="delete_comparison_template")
             return result is not None
         except Exception as e:
             st.error(f"刪除範本錯誤：{str(e)}")
@@ -270,45 +336,19 @@ class TursoDatabase:
             return -1
         
         try:
-            async def async_create_group():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                
-                # 1. 插入範本群組
-                result = await client.execute(
-                    "INSERT INTO template_groups (name, source_excel_path) VALUES (?, ?)",
-                    [name, source_excel_path]
-                )
-                group_id = result.last_insert_rowid
-                
-                # 2. 插入欄位定義
-                for i, field in enumerate(field_definitions):
-                    dropdown_json = json.dumps(field.get('dropdown_options', []))
-                    await client.execute(
-                        """
-                        INSERT INTO field_definitions (group_id, name, default_value, description, dropdown_options, sort_order)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                        [group_id, field['name'], field.get('default_value', ''), field.get('description', ''), dropdown_json, i]
-                    )
-                
-                # 3. 插入範本檔案
-                for file_info in template_files:
-                    await client.execute(
-                        """
-                        INSERT INTO template_files (group_id, filename, filepath, file_type, file_size)
-                        VALUES (?, ?, ?, ?, ?)
-                        """,
-                        [group_id, file_info['filename'], file_info['filepath'], file_info['file_type'], file_info['file_size']]
-                    )
-                
-                await client.close()
-                return group_id
+            # 群組、欄位定義與範本檔案在同一個批次（交易）中寫入，一次往返且不會留下只寫一半的群組；
+            # 群組 ID 在批次中以群組名稱（UNIQUE）查出
+            field_rows = [[*field_row_values(field), i] for i, field in enumerate(field_definitions)]
+            file_rows = [
+                [file_info['filename'], file_info['filepath'], file_info['file_type'], file_info['file_size'], *_inventory_columns(file_info)]
+                for file_info in template_files
+            ]
+            statements = [("INSERT INTO template_groups (name, source_excel_path) VALUES (?, ?)", [name, source_excel_path])]
+            statements += _insert_statements(FIELD_INSERT, field_rows, group_name=name)
+            statements += _insert_statements(FILE_INSERT, file_rows, group_name=name)
             
-            group_id = self._execute_async(async_create_group)
-            return group_id if group_id is not None else -1
+            results = self._batch(statements, operation="create_template_group_cloud")
+            return results[0].last_insert_rowid if results is not None else -1
         except Exception as e:
             st.error(f"創建範本群組錯誤：{str(e)}")
             return -1
@@ -319,16 +359,7 @@ class TursoDatabase:
             return []
         
         try:
-            async def async_get_groups():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                result = await client.execute("SELECT * FROM template_groups ORDER BY created_at DESC")
-                await client.close()
-                return result.rows
-            
-            rows = self._execute_async(async_get_groups)
+            rows = self._query("SELECT * FROM template_groups ORDER BY created_at DESC", operation="get_all_template_groups_cloud")
             if rows is None:
                 return []
             
@@ -346,36 +377,55 @@ class TursoDatabase:
             st.error(f"獲取範本群組錯誤：{str(e)}")
             return []
 
+    def get_template_groups_summary_cloud(self, include_fields: bool = False) -> List[Dict]:
+        """
+        一次取得所有範本群組及其檔案數量、檔案總大小（file_count、total_size），
+        include_fields 為 True 時一併附上欄位定義；所有查詢以單一批次送出，只需一次往返。
+        """
+        if not self.is_cloud_mode():
+            return []
+        
+        try:
+            statements = [GROUP_SUMMARY_SQL] + ([ALL_FIELDS_SQL] if include_fields else [])
+            results = self._batch(statements, operation="get_template_groups_summary_cloud")
+            if results is None:
+                return []
+            
+            groups = [
+                {
+                    'id': row[0],
+                    'name': row[1],
+                    'source_excel_path': row[2],
+                    'created_at': row[3],
+                    'file_count': row[4],
+                    'total_size': row[5]
+                }
+                for row in results[0].rows
+            ]
+            if include_fields:
+                attach_group_fields(groups, (tuple(row) for row in results[1].rows))
+            return groups
+        except Exception as e:
+            st.error(f"獲取範本群組錯誤：{str(e)}")
+            return []
+
     def get_template_files_cloud(self, group_id: int) -> List[Dict]:
         """獲取範本群組的檔案"""
         if not self.is_cloud_mode():
             return []
         
         try:
-            async def async_get_files():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                result = await client.execute("SELECT * FROM template_files WHERE group_id = ? ORDER BY created_at DESC", [group_id])
-                await client.close()
-                return result.rows
-            
-            rows = self._execute_async(async_get_files)
+            rows = self._query(
+                f"SELECT {', '.join(FILE_COLUMNS)} FROM template_files WHERE group_id = ? ORDER BY created_at DESC",
+                [group_id], operation="get_template_files_cloud", id_args={0: "template_groups"}
+            )
             if rows is None:
                 return []
             
             files = []
             for row in rows:
-                file_info = {
-                    'id': row[0],
-                    'group_id': row[1],
-                    'filename': row[2],
-                    'filepath': row[3],
-                    'file_type': row[4],
-                    'file_size': row[5],
-                    'created_at': row[6]
-                }
+                file_info = dict(zip(FILE_COLUMNS, row))
+                file_info['placeholders'] = json.loads(file_info['placeholders']) if file_info['placeholders'] else None
                 files.append(file_info)
             return files
         except Exception as e:
@@ -388,52 +438,74 @@ class TursoDatabase:
             return []
         
         try:
-            async def async_get_fields():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                result = await client.execute(
-                    "SELECT * FROM field_definitions WHERE group_id = ? ORDER BY sort_order",
-                    [group_id]
-                )
-                fields = []
-                for row in result.rows:
-                    field = {
-                        'id': row[0],
-                        'group_id': row[1],
-                        'name': row[2],
-                        'default_value': row[3],
-                        'description': row[4],
-                        'dropdown_options': json.loads(row[5]) if row[5] else [],
-                        'sort_order': row[6]
-                    }
-                    fields.append(field)
-                await client.close()
-                return fields
+            rows = self._query(
+                "SELECT * FROM field_definitions WHERE group_id = ? ORDER BY sort_order", [group_id],
+                operation="get_field_definitions_cloud", id_args={0: "template_groups"}
+            )
+            if rows is None:
+                return []
             
-            fields = self._execute_async(async_get_fields)
-            return fields if fields is not None else []
+            fields = []
+            for row in rows:
+                field = {
+                    'id': row[0],
+                    'group_id': row[1],
+                    'name': row[2],
+                    'default_value': row[3],
+                    'description': row[4],
+                    'dropdown_options': json.loads(row[5]) if row[5] else [],
+                    'sort_order': row[6]
+                }
+                fields.append(field)
+            return fields
         except Exception as e:
             st.error(f"獲取欄位定義錯誤：{str(e)}")
             return []
 
-    def delete_template_file_cloud(self, file_id: int) -> bool:
-        """刪除雲端範本檔案"""
+    def update_field_definitions_cloud(self, group_id: int, fields: List[Dict]) -> bool:
+        """更新雲端範本群組的欄位定義（只寫入新增、修改、刪除或順序變動的欄位）"""
         if not self.is_cloud_mode():
             return False
         
         try:
-            async def async_delete_file():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                await client.execute("DELETE FROM template_files WHERE id = ?", [file_id])
-                await client.close()
+            group_id = self.resolve_id("template_groups", group_id)
+            rows = self._query(
+                "SELECT id, name, default_value, description, dropdown_options, sort_order FROM field_definitions WHERE group_id = ?",
+                [group_id], operation="update_field_definitions_cloud"
+            )
+            if rows is None:
+                return False
+            existing = [
+                {'id': row[0], 'name': row[1], 'default_value': row[2], 'description': row[3],
+                 'dropdown_options': row[4], 'sort_order': row[5]}
+                for row in rows
+            ]
+            changes = diff_field_definitions(existing, fields)
+            
+            # 所有變動在同一個批次（交易）中寫入
+            statements = []
+            deleted = changes['delete']
+            for start in range(0, len(deleted), MAX_SQL_VARIABLES):
+                chunk = deleted[start:start + MAX_SQL_VARIABLES]
+                statements.append((f"DELETE FROM field_definitions WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+            statements += [(UPDATE_FIELD_SQL, list(row)) for row in changes['update']]
+            statements += _insert_statements(FIELD_INSERT, [[group_id, *row] for row in changes['insert']])
+            if not statements:
                 return True
             
-            result = self._execute_async(async_delete_file)
+            return self._batch(statements, operation="update_field_definitions_cloud") is not None
+        except Exception as e:
+            st.error(f"更新欄位定義錯誤：{str(e)}")
+            return False
+
+    def delete_template_file_cloud(self, file_id: int) -> bool:
+        """刪除雲端範本檔案"""
+        if not self.is_cloud_mode():
+            return False
+        
+        try:
+            file_id = self.resolve_id("template_files", file_id)
+            result = self._write("DELETE FROM template_files WHERE id = ?", [file_id], operation="delete_template_file_cloud")
             return result is not None
         except Exception as e:
             st.error(f"刪除範本檔案錯誤：{str(e)}")
@@ -445,22 +517,15 @@ class TursoDatabase:
             return False
         
         try:
-            async def async_add_file():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                await client.execute(
-                    """
-                    INSERT INTO template_files (group_id, filename, filepath, file_type, file_size)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    [group_id, file_info['filename'], file_info['filepath'], file_info['file_type'], file_info['file_size']]
-                )
-                await client.close()
-                return True
-            
-            result = self._execute_async(async_add_file)
+            group_id = self.resolve_id("template_groups", group_id)
+            placeholders, content_hash = _inventory_columns(file_info)
+            result = self._write(
+                """
+                INSERT INTO template_files (group_id, filename, filepath, file_type, file_size, placeholders, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [group_id, file_info['filename'], file_info['filepath'], file_info['file_type'], file_info['file_size'], placeholders, content_hash], operation="add_template_file_cloud"
+            )
             return result is not None
         except Exception as e:
             st.error(f"添加範本檔案錯誤：{str(e)}")
@@ -472,20 +537,13 @@ class TursoDatabase:
             return False
         
         try:
-            async def async_delete_group():
-                client = create_client(
-                    url=self.turso_url,
-                    auth_token=self.turso_token
-                )
-                # 先刪除相關的檔案和欄位定義
-                await client.execute("DELETE FROM template_files WHERE group_id = ?", [group_id])
-                await client.execute("DELETE FROM field_definitions WHERE group_id = ?", [group_id])
-                # 最後刪除群組
-                await client.execute("DELETE FROM template_groups WHERE id = ?", [group_id])
-                await client.close()
-                return True
-            
-            result = self._execute_async(async_delete_group)
+            group_id = self.resolve_id("template_groups", group_id)
+            # 先刪除相關的檔案和欄位定義，最後刪除群組；三句在同一個批次（交易）中執行
+            result = self._batch([
+                ("DELETE FROM template_files WHERE group_id = ?", [group_id]),
+                ("DELETE FROM field_definitions WHERE group_id = ?", [group_id]),
+                ("DELETE FROM template_groups WHERE id = ?", [group_id]),
+            ], operation="delete_template_group_cloud")
             return result is not None
         except Exception as e:
             st.error(f"刪除範本群組錯誤：{str(e)}")
@@ -0,0 +1,646 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.database import REPLICATED_TABLES, TEMPLATE_MIGRATIONS
+from core.migrations import change_log_statements, migrate_libsql, migrate_sqlite
+from core.remote_policy import is_read_only
+from core.turso_client import is_constraint_error
+
+# --- 雲端模式本地副本設定 ---
+ROOT_DIR = Path(__file__).parent.parent
+REPLICA_PATH = ROOT_DIR / "data" / "turso_replica.db"
+SYNC_INTERVAL_SECONDS = 5          # 背景同步間隔（有寫入時立即同步）
+MAX_BACKOFF_SECONDS = 60           # 連線失敗時的最長重試間隔
+PULL_BATCH_SIZE = 500              # 每次拉取的變更筆數上限
+MAX_SQL_VARIABLES = 999
+# 本地新增的資料列從此編號開始配發 ID，與雲端配發的 ID 不重疊；推送時由雲端配發正式 ID 後改寫本地 ID
+LOCAL_ID_OFFSET = 1 << 40
+# 推送時以唯一欄位在雲端批次中查出父表 ID（父表與子表在同一筆變更中新增時，父表尚無雲端 ID）
+NATURAL_KEYS = {"template_groups": "name", "comparison_templates": "name"}
+
+REMOTE_CHANGES_TABLE = "_sync_changes"
+LOCAL_SCHEMA = [
+    # 本地寫入時由觸發器記錄被改動的資料列，寫入完成後轉入待推送日誌
+    "CREATE TABLE IF NOT EXISTS _local_changes (table_name TEXT NOT NULL, row_id INTEGER NOT NULL, op TEXT NOT NULL)",
+    """
+    CREATE TABLE IF NOT EXISTS _replica_journal (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        changes TEXT NOT NULL,            -- JSON: [[table, row_id, op], ...]
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS _replica_conflicts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        changes TEXT NOT NULL,
+        reason TEXT,
+        resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 自己推送的變更在雲端變更記錄中的 seq 範圍，拉取時據此分辨他人的變更
+    "CREATE TABLE IF NOT EXISTS _replica_own_ranges (start_seq INTEGER NOT NULL, end_seq INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS _replica_state (key TEXT PRIMARY KEY, value TEXT)",
+    # 本地暫時 ID 與推送後雲端配發的 ID 對照，呼叫端持有的暫時 ID 仍可查到資料列
+    """
+    CREATE TABLE IF NOT EXISTS _replica_id_map (
+        table_name TEXT NOT NULL,
+        local_id INTEGER NOT NULL,
+        remote_id INTEGER NOT NULL,
+        PRIMARY KEY (table_name, local_id)
+    )
+    """,
+]
+
+
+def _local_trigger_statements(tables: Iterable[str]) -> List[str]:
+    statements = []
+    for table in tables:
+        for op, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS _local_{table}_{op.lower()} AFTER {op} ON {table} "
+                f"BEGIN INSERT INTO _local_changes (table_name, row_id, op) VALUES ('{table}', {ref}.id, '{op.lower()}'); END"
+            )
+    return statements
+
+
+def _merge_ops(changes: Iterable[Tuple[str, int, str]]) -> Dict[Tuple[str, int], str]:
+    """合併同一資料列的多次變更：新增後修改仍為新增、新增後刪除則抵銷"""
+    merged = {}
+    for table, row_id, op in changes:
+        key = (table, row_id)
+        previous = merged.get(key)
+        if previous == "insert" and op == "update":
+            continue
+        if previous == "insert" and op == "delete":
+            del merged[key]
+            continue
+        merged[key] = op
+    return merged
+
+
+class LocalResult:
+    """與 libsql ResultSet 相容的本地查詢結果"""
+
+    def __init__(self, columns=(), rows=(), last_insert_rowid=None, rows_affected=0):
+        self.columns = tuple(columns)
+        self.rows = list(rows)
+        self.last_insert_rowid = last_insert_rowid
+        self.rows_affected = rows_affected
+
+
+class TursoReplica:
+    """
+    Turso 表格的本地 SQLite 副本。
+    讀取一律由本地副本回應；寫入先在本地交易中完成並記入待推送日誌，再由背景執行緒推送到雲端。
+    雲端以觸發器把每次變更記入 _sync_changes（遞增 seq），本地依 seq 增量拉取；
+    第一次使用時先推送離線期間的本地寫入，再拉取完整快照。
+    本地新增的資料列使用 LOCAL_ID_OFFSET 以上的暫時 ID，推送時由雲端配發 ID 並改寫本地資料與待推送日誌。
+    本地尚未推送的資料列若在雲端被他人修改、或名稱與雲端資料重複，視為衝突並以雲端為準（記錄於 _replica_conflicts）。
+    remote 需提供 run(func(client))（TursoClientManager 或測試用的替代品）。
+    """
+
+    def __init__(self, remote, path=REPLICA_PATH, tables: Tuple[str, ...] = REPLICATED_TABLES):
+        self.remote = remote
+        self.path = Path(path)
+        self.tables = tables
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._remote_schema_ready = False
+        self.last_error = None
+        self.last_sync = None
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("PRAGMA synchronous = NORMAL;")
+        self._conn.execute("PRAGMA foreign_keys = ON;")
+        self._columns = {}
+        self._parents = {}       # 子表 -> {外鍵欄位: 父表}
+        self._children = {}      # 父表 -> [(子表, 外鍵欄位)]
+        with self._lock:
+            migrate_sqlite(self._conn, TEMPLATE_MIGRATIONS)
+            for statement in LOCAL_SCHEMA + _local_trigger_statements(self.tables):
+                self._conn.execute(statement)
+            for table in self.tables:
+                self._columns[table] = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+                for fk in self._conn.execute(f"PRAGMA foreign_key_list({table})"):
+                    self._parents.setdefault(table, {})[fk[3]] = fk[2]
+                    self._children.setdefault(fk[2], []).append((table, fk[3]))
+                self._reserve_local_ids(table)
+
+    def _reserve_local_ids(self, table: str):
+        """讓 AUTOINCREMENT 從 LOCAL_ID_OFFSET 之後配發，本地新增的 ID 不會與雲端的 ID 相同"""
+        row = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        if row is None:
+            self._conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, LOCAL_ID_OFFSET))
+        elif row[0] < LOCAL_ID_OFFSET:
+            self._conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (LOCAL_ID_OFFSET, table))
+
+    # --- 本地狀態 ---
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM _replica_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO _replica_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def last_seq(self) -> Optional[int]:
+        with self._lock:
+            value = self._get_state("last_seq")
+        return int(value) if value is not None else None
+
+    def status(self) -> Dict:
+        """回傳同步狀態：待推送筆數、衝突筆數、最後拉取的 seq、最後同步時間與錯誤"""
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM _replica_journal").fetchone()[0]
+            conflicts = self._conn.execute("SELECT COUNT(*) FROM _replica_conflicts").fetchone()[0]
+        return {
+            'pending': pending,
+            'conflicts': conflicts,
+            'last_seq': self.last_seq,
+            'last_sync': self.last_sync,
+            'last_error': self.last_error,
+        }
+
+    def conflicts(self, limit: int = 5) -> List[Dict]:
+        """最近的衝突紀錄（被雲端資料取代而捨棄的本地變更）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, changes, reason, resolved_at FROM _replica_conflicts ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [{'id': row[0], 'changes': json.loads(row[1]), 'reason': row[2], 'resolved_at': row[3]} for row in rows]
+
+    def clear_conflicts(self):
+        """使用者確認後清除衝突紀錄"""
+        with self._lock:
+            self._conn.execute("DELETE FROM _replica_conflicts")
+
+    # --- 讀寫介面（供 TursoDatabase 使用） ---
+
+    def _resolve_id(self, table: str, row_id):
+        if not isinstance(row_id, int) or row_id < LOCAL_ID_OFFSET:
+            return row_id
+        row = self._conn.execute(
+            "SELECT remote_id FROM _replica_id_map WHERE table_name = ? AND local_id = ?", (table, row_id)
+        ).fetchone()
+        return row[0] if row else row_id
+
+    def resolve_id(self, table: str, row_id):
+        """本地暫時 ID 已推送時回傳雲端配發的 ID，否則原樣回傳"""
+        with self._lock:
+            return self._resolve_id(table, row_id)
+
+    def is_pending_id(self, table: str, row_id) -> bool:
+        """是否為尚未推送到雲端的本地暫時 ID"""
+        return isinstance(row_id, int) and self.resolve_id(table, row_id) >= LOCAL_ID_OFFSET
+
+    def query(self, sql: str, args=None, id_args: Dict[int, str] = None) -> List[tuple]:
+        """
+        id_args 為 {參數位置: 表格}：這些參數若是已推送的本地暫時 ID，查詢前換成雲端 ID
+        （與查詢在同一個鎖內進行，不會在兩者之間被背景同步改寫）
+        """
+        args = list(args or [])
+        with self._lock:
+            for index, table in (id_args or {}).items():
+                args[index] = self._resolve_id(table, args[index])
+            return [tuple(row) for row in self._conn.execute(sql, args)]
+
+    def execute_batch(self, statements: List) -> List[LocalResult]:
+        """
+        在本地交易中執行一組語句 [(sql, args)]。
+        全部為讀取時直接回傳結果；含寫入時，被改動的資料列記入待推送日誌並喚醒背景同步。
+        """
+        statements = [(s, []) if isinstance(s, str) else (s[0], list(s[1] or [])) for s in statements]
+        writes = not all(is_read_only(statement) for statement in statements)
+        results = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE" if writes else "BEGIN")
+            try:
+                for sql, args in statements:
+                    cursor = self._conn.execute(sql, args)
+                    columns = [c[0] for c in cursor.description] if cursor.description else []
+                    results.append(LocalResult(columns, [tuple(r) for r in cursor.fetchall()],
+                                               cursor.lastrowid, cursor.rowcount))
+                if writes:
+                    changes = self._conn.execute("SELECT table_name, row_id, op FROM _local_changes").fetchall()
+                    self._conn.execute("DELETE FROM _local_changes")
+                    if changes:
+                        self._conn.execute("INSERT INTO _replica_journal (changes) VALUES (?)",
+                                           (json.dumps([list(c) for c in changes]),))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if writes:
+            self._wake.set()
+        return results
+
+    # --- 套用雲端資料 ---
+
+    def _apply_remote_rows(self, table: str, columns: List[str], rows: List[tuple]):
+        """
+        以雲端資料覆寫本地資料列（UPSERT，不觸發外鍵串聯刪除）；UNIQUE 名稱衝突時以雲端為準，
+        被取代的本地資料列若尚未推送，該筆本地變更記為衝突。
+        """
+        if not rows:
+            return
+        columns = [c for c in columns if c in self._columns[table]]
+        key = NATURAL_KEYS.get(table)
+        if key in columns:
+            key_index, id_index = columns.index(key), columns.index('id')
+            displaced = set()
+            for row in rows:
+                displaced.update(
+                    (table, local[0]) for local in self._conn.execute(
+                        f"SELECT id FROM {table} WHERE {key} = ? AND id != ?", (row[key_index], row[id_index])
+                    )
+                )
+                self._conn.execute(f"DELETE FROM {table} WHERE {key} = ? AND id != ?", (row[key_index], row[id_index]))
+            if displaced:
+                for seq, ops in self._pending_entries():
+                    if displaced.intersection(ops):
+                        self._record_conflict(seq, ops, "名稱與雲端資料重複")
+        assignments = ", ".join(f"{c} = excluded.{c}" for c in columns if c != 'id')
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+               f"ON CONFLICT(id) DO UPDATE SET {assignments}")
+        self._conn.executemany(sql, [tuple(row[:len(columns)]) for row in rows])
+
+    def _delete_local_rows(self, table: str, row_ids: Iterable[int]):
+        self._conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(row_id,) for row_id in row_ids])
+
+    async def _fetch_rows(self, client, keys: Iterable[Tuple[str, int]]) -> Dict[str, Tuple[List[str], List[tuple]]]:
+        """從雲端取得指定資料列的目前內容（依表格分批查詢）"""
+        by_table = {}
+        for table, row_id in keys:
+            by_table.setdefault(table, set()).add(row_id)
+        statements, owners = [], []
+        for table in self.tables:
+            ids = sorted(by_table.get(table, ()))
+            for start in range(0, len(ids), MAX_SQL_VARIABLES):
+                chunk = ids[start:start + MAX_SQL_VARIABLES]
+                statements.append((f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+                owners.append(table)
+        fetched = {table: ([], []) for table in by_table}
+        if not statements:
+            return fetched
+        for table, result in zip(owners, await client.batch(statements)):
+            fetched[table] = (list(result.columns), fetched[table][1] + [tuple(row) for row in result.rows])
+        return fetched
+
+    def _apply_fetched(self, keys: Iterable[Tuple[str, int]], fetched: Dict):
+        """套用雲端最新內容：雲端存在的資料列覆寫本地，已不存在的刪除（父表先寫入、子表先刪除）"""
+        keys = set(keys)
+        for table in self.tables:
+            columns, rows = fetched.get(table, ([], []))
+            self._apply_remote_rows(table, columns, rows)
+        for table in reversed(self.tables):
+            columns, rows = fetched.get(table, ([], []))
+            present = {row[columns.index('id')] for row in rows} if rows else set()
+            self._delete_local_rows(table, [row_id for t, row_id in keys if t == table and row_id not in present])
+
+    # --- 同步 ---
+
+    def _ensure_remote_schema(self):
+        """
+        套用雲端遷移並建立變更記錄（只有啟用本地副本時才需要）。
+        變更記錄的識別碼與上次同步時不同（記錄表曾被刪除重建，seq 重新起算）時，
+        捨棄本地的 seq 進度，下次同步先推送待推送變更再重新拉取快照。
+        """
+        if self._remote_schema_ready:
+            return
+
+        async def install(client):
+            await migrate_libsql(client, TEMPLATE_MIGRATIONS)
+            await client.batch(change_log_statements(self.tables, REMOTE_CHANGES_TABLE))
+            result = await client.execute(f"SELECT value FROM {REMOTE_CHANGES_TABLE}_meta WHERE key = 'log_id'")
+            return result.rows[0][0]
+
+        log_id = self.remote.run(install)
+        with self._lock:
+            if self._get_state("log_id") != log_id:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute("DELETE FROM _replica_state WHERE key = 'last_seq'")
+                self._conn.execute("DELETE FROM _replica_own_ranges")
+                self._set_state("log_id", log_id)
+                self._conn.execute("COMMIT")
+        self._remote_schema_ready = True
+
+    def _snapshot(self):
+        """
+        拉取雲端完整快照，取代本地副本內容（僅在尚無同步紀錄時使用）。
+        仍有待推送的本地變更時不執行，避免覆蓋尚未推送的資料列（sync_once 會先推送）。
+        """
+        with self._lock:
+            if self._conn.execute("SELECT COUNT(*) FROM _replica_journal").fetchone()[0]:
+                raise RuntimeError("本地副本仍有待推送的變更，暫不拉取快照")
+
+        async def fetch(client):
+            statements = [f"SELECT COALESCE(MAX(seq), 0) FROM {REMOTE_CHANGES_TABLE}"]
+            statements += [f"SELECT * FROM {table}" for table in self.tables]
+            return await client.batch(statements)
+
+        results = self.remote.run(fetch)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT COUNT(*) FROM _replica_journal").fetchone()[0]:
+                    raise RuntimeError("本地副本仍有待推送的變更，暫不拉取快照")
+                for table in reversed(self.tables):
+                    self._conn.execute(f"DELETE FROM {table}")
+                for table, result in zip(self.tables, results[1:]):
+                    self._apply_remote_rows(table, list(result.columns), [tuple(r) for r in result.rows])
+                self._conn.execute("DELETE FROM _local_changes")
+                self._conn.execute("DELETE FROM _replica_own_ranges")
+                self._set_state("last_seq", results[0].rows[0][0])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _own_ranges(self) -> List[Tuple[int, int]]:
+        return [tuple(r) for r in self._conn.execute("SELECT start_seq, end_seq FROM _replica_own_ranges")]
+
+    def _pending_entries(self) -> List[Tuple[int, Dict[Tuple[str, int], str]]]:
+        rows = self._conn.execute("SELECT seq, changes FROM _replica_journal ORDER BY seq").fetchall()
+        return [(seq, _merge_ops(tuple(c) for c in json.loads(changes))) for seq, changes in rows]
+
+    def _record_conflict(self, seq: int, ops: Dict, reason: str):
+        self._conn.execute("INSERT INTO _replica_conflicts (changes, reason) VALUES (?, ?)",
+                           (json.dumps([[t, i, op] for (t, i), op in ops.items()]), reason))
+        self._conn.execute("DELETE FROM _replica_journal WHERE seq = ?", (seq,))
+
+    def pull(self) -> int:
+        """增量拉取雲端變更並套用到本地；與尚未推送的本地變更衝突時以雲端為準。回傳套用的變更數"""
+        last_seq = self.last_seq
+        if last_seq is None:
+            self._snapshot()
+            return 0
+
+        async def fetch(client):
+            result = await client.execute(
+                f"SELECT seq, table_name, row_id FROM {REMOTE_CHANGES_TABLE} WHERE seq > ? ORDER BY seq LIMIT ?",
+                [last_seq, PULL_BATCH_SIZE]
+            )
+            changes = [tuple(row) for row in result.rows]
+            with self._lock:
+                own = self._own_ranges()
+                pending = self._pending_entries()
+            foreign = {(table, row_id) for seq, table, row_id in changes
+                       if not any(start < seq <= end for start, end in own)}
+            # 與本地未推送變更重疊的資料列：雲端為準，該筆本地變更涉及的資料列全部重新取得
+            conflicted = [(seq, ops) for seq, ops in pending if foreign.intersection(ops)]
+            keys = set(foreign)
+            for _, ops in conflicted:
+                keys.update(ops)
+            return changes, conflicted, keys, await self._fetch_rows(client, keys)
+
+        changes, conflicted, keys, fetched = self.remote.run(fetch)
+        if not changes:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for seq, ops in conflicted:
+                    self._record_conflict(seq, ops, "雲端資料已被其他使用者修改")
+                self._apply_fetched(keys, fetched)
+                self._conn.execute("DELETE FROM _local_changes")
+                new_seq = changes[-1][0]
+                self._set_state("last_seq", new_seq)
+                self._conn.execute("DELETE FROM _replica_own_ranges WHERE end_seq <= ?", (new_seq,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(changes)
+
+    def _value_expressions(self, table: str, columns: List[str], values: List) -> Tuple[List[str], List]:
+        """
+        產生各欄位的 SQL 值運算式與參數：指向尚未取得雲端 ID 的父表資料列時，
+        改以父表的唯一欄位在雲端查出 ID（父表在同一批次中先寫入）。
+        """
+        expressions, args = [], []
+        for column, value in zip(columns, values):
+            parent = self._parents.get(table, {}).get(column)
+            key = NATURAL_KEYS.get(parent)
+            if key and isinstance(value, int) and value >= LOCAL_ID_OFFSET:
+                row = self._conn.execute(f"SELECT {key} FROM {parent} WHERE id = ?", (value,)).fetchone()
+                if row is not None:
+                    expressions.append(f"(SELECT id FROM {parent} WHERE {key} = ?)")
+                    args.append(row[0])
+                    continue
+            expressions.append("?")
+            args.append(value)
+        return expressions, args
+
+    def _push_statements(self, ops: Dict[Tuple[str, int], str]) -> Tuple[List[tuple], List[Tuple[int, str, int]]]:
+        """
+        依本地目前內容產生推送語句：子表先刪除、父表先寫入。
+        新增的資料列不帶 ID，由雲端配發；同時回傳 [(語句位置, 表格, 本地 ID)] 供推送後改寫本地 ID。
+        """
+        statements, inserted = [], []
+        for table in reversed(self.tables):
+            for (t, row_id), op in ops.items():
+                if t == table and op == "delete":
+                    statements.append((f"DELETE FROM {table} WHERE id = ?", [row_id]))
+        for table in self.tables:
+            columns = [c for c in self._columns[table] if c != 'id']
+            for (t, row_id), op in ops.items():
+                if t != table or op == "delete":
+                    continue
+                row = self._conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE id = ?", (row_id,)).fetchone()
+                if row is None:
+                    continue
+                expressions, args = self._value_expressions(table, columns, list(row))
+                if op == "insert":
+                    inserted.append((len(statements), table, row_id))
+                    statements.append((f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(expressions)})", args))
+                else:
+                    assignments = ", ".join(f"{c} = {e}" for c, e in zip(columns, expressions))
+                    statements.append((f"UPDATE {table} SET {assignments} WHERE id = ?", args + [row_id]))
+        return statements, inserted
+
+    def _remap_ids(self, mapping: Dict[Tuple[str, int], int]):
+        """把本地暫時 ID 改為雲端配發的 ID：資料列、子表外鍵與待推送日誌一併改寫（呼叫時需在交易中）"""
+        mapping = {key: remote_id for key, remote_id in mapping.items() if key[1] != remote_id}
+        if not mapping:
+            return
+        # 父表與子表的 ID 在同一個交易中改寫，外鍵檢查延到提交時
+        self._conn.execute("PRAGMA defer_foreign_keys = ON")
+        for (table, local_id), remote_id in mapping.items():
+            self._conn.execute(f"UPDATE {table} SET id = ? WHERE id = ?", (remote_id, local_id))
+            self._conn.execute("INSERT OR REPLACE INTO _replica_id_map (table_name, local_id, remote_id) VALUES (?, ?, ?)",
+                               (table, local_id, remote_id))
+            for child, column in self._children.get(table, ()):
+                self._conn.execute(f"UPDATE {child} SET {column} = ? WHERE {column} = ?", (remote_id, local_id))
+        for seq, changes in self._conn.execute("SELECT seq, changes FROM _replica_journal").fetchall():
+            entries = json.loads(changes)
+            remapped = [[t, mapping.get((t, i), i), op] for t, i, op in entries]
+            if remapped != entries:
+                self._conn.execute("UPDATE _replica_journal SET changes = ? WHERE seq = ?", (json.dumps(remapped), seq))
+        self._conn.execute("DELETE FROM _local_changes")
+
+    def push(self) -> int:
+        """依序推送待推送日誌；每筆在雲端以單一批次（交易）寫入。回傳成功推送的筆數"""
+        pushed = 0
+        while True:
+            with self._lock:
+                pending = self._pending_entries()
+                if not pending:
+                    return pushed
+                seq, ops = pending[0]
+                statements, inserted = self._push_statements(ops)
+            if not statements:
+                with self._lock:
+                    self._conn.execute("DELETE FROM _replica_journal WHERE seq = ?", (seq,))
+                continue
+
+            max_seq = f"SELECT COALESCE(MAX(seq), 0) FROM {REMOTE_CHANGES_TABLE}"
+
+            async def send(client):
+                return await client.batch([max_seq] + statements + [max_seq])
+
+            try:
+                results = self.remote.run(send)
+            except Exception as e:
+                if not is_constraint_error(e):
+                    # 連線或伺服器錯誤（含 5xx、WebSocket 中斷）：保留日誌，下次同步重試
+                    with self._lock:
+                        self._conn.execute("UPDATE _replica_journal SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                                           (str(e), seq))
+                    raise
+                # 雲端拒絕（約束違反，例如名稱已被使用）：雲端為準，捨棄本地變更並重新取得相關資料列
+                fetched = self.remote.run(lambda client: self._fetch_rows(client, ops))
+                with self._lock:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        self._record_conflict(seq, ops, str(e))
+                        self._apply_fetched(ops, fetched)
+                        self._conn.execute("DELETE FROM _local_changes")
+                        self._conn.execute("COMMIT")
+                    except Exception:
+                        self._conn.execute("ROLLBACK")
+                        raise
+                continue
+
+            start_seq, end_seq = results[0].rows[0][0], results[-1].rows[0][0]
+            mapping = {(table, row_id): results[index + 1].last_insert_rowid for index, table, row_id in inserted}
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.execute("DELETE FROM _replica_journal WHERE seq = ?", (seq,))
+                    self._remap_ids(mapping)
+                    if end_seq > start_seq:
+                        self._conn.execute("INSERT INTO _replica_own_ranges (start_seq, end_seq) VALUES (?, ?)",
+                                           (start_seq, end_seq))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            pushed += 1
+
+    def sync_once(self) -> Dict:
+        """執行一次同步：先拉取（偵測衝突），再推送本地變更；尚未取得快照時先推送離線期間的寫入"""
+        with self._sync_lock:
+            try:
+                self._ensure_remote_schema()
+                pushed = self.push() if self.last_seq is None else 0
+                pulled = self.pull()
+                pushed += self.push()
+                self.last_error = None
+                self.last_sync = time.time()
+                return {'pulled': pulled, 'pushed': pushed}
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+
+    # --- 背景同步 ---
+
+    def start(self, interval: float = SYNC_INTERVAL_SECONDS):
+        """啟動背景同步執行緒（重複呼叫不會啟動第二個）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sync_loop, args=(interval,), name="turso-replica-sync", daemon=True)
+        self._thread.start()
+
+    def _sync_loop(self, interval: float):
+        delay = interval
+        while not self._stop.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.sync_once()
+                delay = interval
+            except Exception:
+                # 網路中斷時繼續使用本地副本，逐步拉長重試間隔
+                delay = min(delay * 2, MAX_BACKOFF_SECONDS)
+
+    def stop(self, flush: bool = True):
+        """停止背景同步；flush 為 True 時先嘗試推送剩餘的本地變更"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(SYNC_INTERVAL_SECONDS)
+        if flush:
+            try:
+                self.sync_once()
+            except Exception:
+                pass
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._conn.close()
+
+
+_replicas: Dict[Tuple[str, Optional[str]], TursoReplica] = {}
+_replicas_lock = threading.Lock()
+
+
+def get_replica(url: str, auth_token: Optional[str], remote=None, path=REPLICA_PATH) -> TursoReplica:
+    """
+    取得指定雲端資料庫的共用本地副本。第一次建立時先同步一次（失敗則沿用既有的本地內容），
+    之後由背景執行緒持續同步。
+    """
+    key = (url, auth_token)
+    with _replicas_lock:
+        replica = _replicas.get(key)
+        if replica is None:
+            if remote is None:
+                from core.remote_policy import GuardedRemote, get_remote_policy
+                from core.turso_client import get_client_manager
+                # 背景同步與前景操作共用同一個斷路器：雲端故障時停止同步、改由本地副本服務
+                remote = GuardedRemote(get_client_manager(url, auth_token), get_remote_policy(url), "replica_sync")
+            replica = _replicas[key] = TursoReplica(remote, path)
+            try:
+                replica.sync_once()
+            except Exception:
+                pass
+            replica.start()
+        return replica
+
+
+def shutdown_replicas():
+    """停止所有本地副本的背景同步並推送剩餘變更（程式結束時自動執行）"""
+    with _replicas_lock:
+        replicas = list(_replicas.values())
+        _replicas.clear()
+    for replica in replicas:
+        replica.close()
+
+
+atexit.register(shutdown_replicas)
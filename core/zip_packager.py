@@ -0,0 +1,52 @@
+import os
+import zipfile
+from datetime import datetime
+
+# 本身已是壓縮格式的檔案直接存放（STORED），避免重複壓縮浪費 CPU
+STORED_EXTENSIONS = {'.docx', '.xlsx', '.pptx', '.zip', '.png', '.jpg', '.jpeg', '.gif', '.webp'}
+
+
+def compress_type_for(name: str) -> int:
+    """依副檔名決定 ZIP 成員的壓縮方式"""
+    ext = os.path.splitext(name)[1].lower()
+    return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+class ZipPackager:
+    """將生成的文件邊產生邊寫入單一 ZIP 壓縮檔，不在磁碟上產生個別的中間檔案"""
+
+    def __init__(self, output):
+        self._zip = zipfile.ZipFile(output, 'w', allowZip64=True)
+        self._names = set()
+        self.member_count = 0
+
+    def _unique_name(self, name: str) -> str:
+        base, ext = os.path.splitext(name)
+        candidate = name
+        counter = 2
+        while candidate in self._names:
+            candidate = f"{base}_{counter}{ext}"
+            counter += 1
+        self._names.add(candidate)
+        return candidate
+
+    def _new_info(self, name: str) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(self._unique_name(name), date_time=datetime.now().timetuple()[:6])
+        info.compress_type = compress_type_for(name)
+        self.member_count += 1
+        return info
+
+    def add_bytes(self, name: str, data: bytes) -> str:
+        """加入一份已在記憶體中的文件，回傳實際使用的成員名稱"""
+        info = self._new_info(name)
+        self._zip.writestr(info, data)
+        return info.filename
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
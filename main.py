@@ -1,9 +1,8 @@
 import streamlit as st
 import os
-import sqlite3
 
 # --- 核心模組導入 (路徑已更新) ---
-from core.database import init_database, DB_PATH
+from core.database import init_database, get_db_connection
 from views.document_generator import show_document_generator
 from views.document_comparison import show_document_comparison_main
 from utils.storage_monitor import get_storage_stats
@@ -22,21 +21,16 @@ def get_system_stats():
     """從資料庫獲取系統統計數據"""
     try:
         # 嘗試使用雲端資料庫
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         
         if turso_db.is_cloud_mode():
             # 雲端模式：從 Turso 獲取統計
             try:
-                # 獲取範本群組數量
-                template_groups = turso_db.get_all_template_groups_cloud()
+                # 獲取範本群組與檔案數量（單次批次查詢）
+                template_groups = turso_db.get_template_groups_summary_cloud()
                 total_groups = len(template_groups)
-                
-                # 獲取範本檔案數量
-                total_files = 0
-                for group in template_groups:
-                    files = turso_db.get_template_files_cloud(group['id'])
-                    total_files += len(files)
+                total_files = sum(group['file_count'] for group in template_groups)
                 
                 # 獲取比對範本數量
                 comparison_templates = turso_db.get_comparison_templates()
@@ -56,10 +50,8 @@ def get_system_stats():
 def get_local_system_stats():
     """從本地 SQLite 資料庫獲取系統統計數據"""
     try:
-        if not os.path.exists(os.path.dirname(DB_PATH)):
-            os.makedirs(os.path.dirname(DB_PATH))
         init_database()
-        with sqlite3.connect(DB_PATH) as conn:
+        with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM template_groups")
             total_groups = cursor.fetchone()[0]
@@ -346,8 +338,8 @@ def main():
     
     # 檢查 Turso 狀態（靜默模式，不顯示訊息）
     try:
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         # 靜默檢查，不顯示狀態訊息
         turso_db.is_cloud_mode()  # 只檢查狀態，不顯示訊息
     except Exception as e:
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# 測試直接以 core.* 匯入，與 main.py 從專案根目錄執行時相同
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
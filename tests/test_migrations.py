@@ -0,0 +1,112 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from core.database import TEMPLATE_MIGRATIONS
+from core.fake_libsql import create_fake_client
+from core.migrations import (
+    AddColumn, LOCAL, TURSO, SCHEMA_VERSION_TABLE, latest_version, migrate_libsql, migrate_sqlite,
+    pending_migrations, reset_migration_state, run_once,
+)
+
+MIGRATIONS = [
+    {'version': 1, 'description': "建立表格", 'statements': ["CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT)"]},
+    {'version': 3, 'description': "新增欄位", 'statements': [AddColumn("items", "note", "TEXT")]},
+    {'version': 2, 'description': "只用於雲端", 'targets': (TURSO,), 'statements': ["CREATE TABLE cloud_only (id INTEGER)"]},
+]
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def test_pending_migrations_filters_by_version_and_target():
+    assert [m['version'] for m in pending_migrations(MIGRATIONS, 0, LOCAL)] == [1, 3]
+    assert [m['version'] for m in pending_migrations(MIGRATIONS, 0, TURSO)] == [1, 2, 3]
+    assert [m['version'] for m in pending_migrations(MIGRATIONS, 2, TURSO)] == [3]
+    assert latest_version(MIGRATIONS) == 3
+    assert latest_version([]) == 0
+
+
+def test_migrate_sqlite_records_user_version():
+    conn = sqlite3.connect(":memory:")
+    assert migrate_sqlite(conn, MIGRATIONS) == 3
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 3
+    assert columns(conn, "items") == {"id", "name", "note"}
+    assert "cloud_only" not in tables(conn)
+    # 再次執行不重複套用
+    assert migrate_sqlite(conn, MIGRATIONS) == 3
+
+
+def test_add_column_skips_existing_column():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, note TEXT)")
+    conn.commit()
+    assert migrate_sqlite(conn, MIGRATIONS) == 3
+    assert columns(conn, "items") == {"id", "name", "note"}
+
+
+def test_failed_migration_rolls_back_and_keeps_version():
+    conn = sqlite3.connect(":memory:")
+    broken = MIGRATIONS[:1] + [{
+        'version': 2,
+        'description': "中途失敗",
+        'statements': ["CREATE TABLE half_done (id INTEGER)", "INSERT INTO missing_table VALUES (1)"],
+    }]
+    with pytest.raises(sqlite3.OperationalError):
+        migrate_sqlite(conn, broken)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert "half_done" not in tables(conn)
+
+
+def test_template_migrations_local_schema(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "templates.db"))
+    version = migrate_sqlite(conn, TEMPLATE_MIGRATIONS)
+    local_versions = [m['version'] for m in pending_migrations(TEMPLATE_MIGRATIONS, 0, LOCAL)]
+    assert version == max(local_versions)
+    assert {"placeholders", "content_hash"} <= columns(conn, "template_files")
+    # 變更記錄只在雲端建立，且已由後續版本移除
+    assert "_sync_changes" not in tables(conn)
+
+
+def test_migrate_libsql_records_schema_version(tmp_path):
+    url = f"fake:///{tmp_path / 'cloud.db'}"
+
+    async def migrate():
+        client = create_fake_client(url)
+        try:
+            first = await migrate_libsql(client, MIGRATIONS)
+            second = await migrate_libsql(client, MIGRATIONS)
+            result = await client.execute(f"SELECT version FROM {SCHEMA_VERSION_TABLE} ORDER BY version")
+            return first, second, [row[0] for row in result.rows]
+        finally:
+            await client.close()
+
+    first, second, versions = asyncio.run(migrate())
+    assert first == second == 3
+    assert versions == [1, 2, 3]
+    conn = sqlite3.connect(str(tmp_path / "cloud.db"))
+    assert "cloud_only" in tables(conn)
+
+
+def test_run_once_retries_after_failure():
+    reset_migration_state()
+    calls = []
+
+    def failing():
+        calls.append("fail")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        run_once("db", failing)
+    assert run_once("db", lambda: calls.append("ok")) is True
+    assert run_once("db", lambda: calls.append("again")) is False
+    assert calls == ["fail", "ok"]
+    reset_migration_state()
+    assert run_once("db", lambda: calls.append("after reset")) is True
+    reset_migration_state()
@@ -0,0 +1,126 @@
+import sqlite3
+
+import pytest
+
+from core.page_cache import pixels_to_points, points_to_pixels
+from core.pdf_annotation_system import ANNOTATION_MIGRATIONS, PDFAnnotationSystem
+from core.migrations import migrate_sqlite
+
+DPI = 200
+SCALE = 72.0 / DPI
+
+
+@pytest.fixture
+def system(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pas = PDFAnnotationSystem(str(tmp_path / "annotations.db"))
+    yield pas
+    pas.close()
+
+
+def add_template(pas, name="範本"):
+    with pas._connection() as conn:
+        return conn.execute("INSERT INTO templates (name, total_pages) VALUES (?, 2)", (name,)).lastrowid
+
+
+def annotation(name, coordinates, page_number=1):
+    return {'page_number': page_number, 'variable_name': name, 'variable_type': 'text',
+            'coordinates': coordinates, 'sample_value': ''}
+
+
+def rtree_rows(pas):
+    with pas._connection() as conn:
+        return {row[0]: tuple(row[1:]) for row in conn.execute("SELECT * FROM annotations_rtree")}
+
+
+def test_pixels_points_round_trip():
+    assert pixels_to_points((200, 400), DPI) == pytest.approx((72, 144))
+    assert points_to_pixels((72, 144), 100) == pytest.approx((100, 200))
+    assert points_to_pixels(pixels_to_points((13, 27, 310, 95), DPI), DPI) == pytest.approx((13, 27, 310, 95))
+
+
+def test_annotations_stored_in_points(system):
+    template_id = add_template(system)
+    [ann_id] = system.save_annotations(template_id, [annotation("name", (100, 200, 300, 400))], dpi=DPI)
+    [ann] = system.get_template_annotations(template_id, dpi=DPI)
+    assert ann['pdf_coordinates'] == pytest.approx((100 * SCALE, 200 * SCALE, 300 * SCALE, 400 * SCALE))
+    assert ann['coordinates'] == pytest.approx((100, 200, 300, 400))
+    # 以其他解析度顯示時換算為該解析度的像素
+    [ann_72] = system.get_template_annotations(template_id, dpi=72)
+    assert ann_72['coordinates'] == pytest.approx(ann['pdf_coordinates'])
+
+
+def test_rtree_follows_annotation_changes(system):
+    template_id = add_template(system)
+    # 由右下往左上拖曳的框，索引仍以左上、右下保存
+    [ann_id] = system.save_annotations(template_id, [annotation("a", (300, 400, 100, 200))], dpi=DPI)
+    row = rtree_rows(system)[ann_id]
+    assert row[:4] == (template_id, template_id, 1, 1)
+    assert row[4:] == pytest.approx((100 * SCALE, 300 * SCALE, 200 * SCALE, 400 * SCALE), rel=1e-6)
+
+    system.update_annotations([dict(annotation("a", (0, 0, 50, 50)), id=ann_id)], dpi=DPI)
+    assert rtree_rows(system)[ann_id][4:] == pytest.approx((0, 50 * SCALE, 0, 50 * SCALE), rel=1e-6)
+
+    system.delete_annotation(ann_id)
+    assert rtree_rows(system) == {}
+
+
+def test_hit_test_and_query_region(system):
+    template_id = add_template(system)
+    other_id = add_template(system, "其他範本")
+    outer, inner, elsewhere = system.save_annotations(template_id, [
+        annotation("outer", (0, 0, 400, 400)),
+        annotation("inner", (100, 100, 200, 200)),
+        annotation("elsewhere", (500, 500, 600, 600)),
+    ], dpi=DPI)
+    system.save_annotations(other_id, [annotation("other", (0, 0, 400, 400))], dpi=DPI)
+    system.save_annotations(template_id, [annotation("page2", (0, 0, 400, 400), page_number=2)], dpi=DPI)
+
+    # 最內層的標記在前；只回傳同一範本同一頁
+    assert [ann['id'] for ann in system.hit_test(template_id, 1, 150, 150, dpi=DPI)] == [inner, outer]
+    assert [ann['id'] for ann in system.hit_test(template_id, 1, 300, 300, dpi=DPI)] == [outer]
+    assert system.hit_test(template_id, 1, 450, 450, dpi=DPI) == []
+    # 以 72 dpi 的像素（即 point）查詢得到相同結果
+    assert [ann['id'] for ann in system.hit_test(template_id, 1, 150 * SCALE, 150 * SCALE, dpi=72)] == [inner, outer]
+
+    region = system.query_region(template_id, 1, (550, 550, 350, 350), dpi=DPI)
+    assert sorted(ann['id'] for ann in region) == [outer, elsewhere]
+
+
+def test_find_overlapping_annotations(system):
+    first = add_template(system)
+    second = add_template(system, "第二個範本")
+    a, b, _ = system.save_annotations(first, [
+        annotation("a", (0, 0, 100, 100)),
+        annotation("b", (50, 0, 150, 100)),
+        annotation("c", (300, 300, 400, 400)),
+    ], dpi=DPI)
+    [d] = system.save_annotations(second, [annotation("d", (0, 0, 100, 100))], dpi=DPI)
+
+    [overlap] = system.find_overlapping_annotations(first, dpi=DPI)
+    assert {overlap['first']['id'], overlap['second']['id']} == {a, b}
+    assert overlap['iou'] == pytest.approx(1 / 3)
+
+    across = system.find_overlapping_annotations(first, across_templates=True, min_iou=0.9, dpi=DPI)
+    assert [(o['first']['id'], o['second']['id']) for o in across] == [(a, d)]
+
+
+def test_pixel_annotations_migrated_to_points(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db_path)
+    migrate_sqlite(conn, [m for m in ANNOTATION_MIGRATIONS if m['version'] <= 3])
+    conn.execute("INSERT INTO templates (id, name, total_pages) VALUES (1, '舊範本', 1)")
+    conn.execute("INSERT INTO annotations (template_id, page_number, variable_name, x_start, y_start, x_end, y_end) "
+                 "VALUES (1, 1, 'old', 200, 400, 600, 800)")
+    conn.commit()
+    conn.close()
+
+    pas = PDFAnnotationSystem(str(db_path))
+    try:
+        [ann] = pas.get_template_annotations(1, dpi=DPI)
+        assert ann['pdf_coordinates'] == pytest.approx((72, 144, 216, 288))
+        assert ann['coordinates'] == pytest.approx((200, 400, 600, 800))
+        assert [hit['id'] for hit in pas.hit_test(1, 1, 300, 500, dpi=DPI)] == [ann['id']]
+    finally:
+        pas.close()
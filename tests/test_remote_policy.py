@@ -0,0 +1,156 @@
+import pytest
+from libsql_client import LibsqlError
+
+from core.remote_policy import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, RemotePolicy, is_read_only,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+
+def make_policy(breaker, retries=0):
+    policies = {'read': {'deadline': 5.0, 'retries': retries}, 'write': {'deadline': 5.0, 'retries': 0}}
+    return RemotePolicy(breaker, policies, sleep=lambda delay: None)
+
+
+def failing(error):
+    def attempt(timeout):
+        raise error
+    return attempt
+
+
+def test_breaker_opens_after_threshold(breaker):
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count(breaker):
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_single_probe(breaker, clock):
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # 試探進行中，其他呼叫仍被擋下
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(breaker, clock):
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now = 19
+    assert not breaker.allow()
+    clock.now = 20
+    assert breaker.state == HALF_OPEN
+
+
+def test_open_circuit_short_circuits(breaker):
+    policy = make_policy(breaker)
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            policy.call("query", failing(TimeoutError()))
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        policy.call("query", lambda timeout: calls.append(timeout))
+    assert calls == []
+    stats = policy.stats()
+    assert stats['state'] == OPEN
+    assert stats['operations']['query']['short_circuits'] == 1
+
+
+def test_read_retries_connection_errors(breaker):
+    breaker.failure_threshold = 5
+    policy = make_policy(breaker, retries=2)
+    attempts = []
+
+    def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise LibsqlError("503", "SERVER_ERROR")
+        return "ok"
+
+    assert policy.call("query", flaky) == "ok"
+    assert len(attempts) == 3
+    assert policy.stats()['operations']['query']['retries'] == 2
+    assert breaker.state == CLOSED
+
+
+def test_write_is_not_retried(breaker):
+    policy = make_policy(breaker, retries=2)
+    attempts = []
+
+    def attempt(timeout):
+        attempts.append(timeout)
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        policy.call("insert", attempt, kind='write')
+    assert len(attempts) == 1
+
+
+def test_sql_errors_do_not_trip_breaker(breaker):
+    policy = make_policy(breaker, retries=2)
+    attempts = []
+
+    def attempt(timeout):
+        attempts.append(timeout)
+        raise LibsqlError("UNIQUE constraint failed", "SQLITE_CONSTRAINT_UNIQUE")
+
+    for _ in range(3):
+        with pytest.raises(LibsqlError):
+            policy.call("insert", attempt)
+    # SQL 錯誤代表連線正常：不重試、不斷路
+    assert len(attempts) == 3
+    assert breaker.state == CLOSED
+
+
+def test_interrupted_probe_reopens(breaker, clock):
+    policy = make_policy(breaker)
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now = 10
+    with pytest.raises(KeyboardInterrupt):
+        policy.call("query", failing(KeyboardInterrupt()))
+    # 試探被中斷視為失敗，斷路器重新計時而不是卡在試探中
+    assert breaker.state == OPEN
+    clock.now = 20
+    assert breaker.allow()
+
+
+def test_is_read_only():
+    assert is_read_only("SELECT 1")
+    assert is_read_only(("  with t as (select 1) select * from t", []))
+    assert not is_read_only(("INSERT INTO t VALUES (?)", [1]))
+    assert not is_read_only("")
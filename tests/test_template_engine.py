@@ -0,0 +1,138 @@
+import io
+import zipfile
+
+import pytest
+
+from core import template_engine
+from core.template_engine import (
+    compile_template, get_template_index, render_text, render_to_bytes, substitute_text_nodes,
+)
+
+W_NS = template_engine.W_NS
+S_NS = template_engine.S_NS
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    """索引寫到暫存目錄，不污染 data/template_index"""
+    monkeypatch.setattr(template_engine, "INDEX_DIR", tmp_path / "template_index")
+    template_engine._index_cache.clear()
+    template_engine._hash_cache.clear()
+
+
+def write_zip(path, parts):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in parts.items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+def docx_document(paragraphs):
+    """paragraphs 為段落列表，每個段落是各個 run 的文字"""
+    body = "".join(
+        "<w:p>" + "".join(f'<w:r><w:rPr><w:b/></w:rPr><w:t>{text}</w:t></w:r>' for text in runs) + "</w:p>"
+        for runs in paragraphs
+    )
+    return f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document xmlns:w="{W_NS}"><w:body>{body}</w:body></w:document>'
+
+
+def make_docx(path, paragraphs, image=b"\x89PNG fake image"):
+    return write_zip(path, {
+        "[Content_Types].xml": "<Types/>",
+        "word/document.xml": docx_document(paragraphs),
+        "word/media/image1.png": image,
+    })
+
+
+def make_xlsx(path, shared_strings, inline_text=None):
+    items = "".join(
+        "<si>" + "".join(f"<r><t>{text}</t></r>" for text in runs) + "</si>" if isinstance(runs, list)
+        else f"<si><t>{runs}</t></si>"
+        for runs in shared_strings
+    )
+    inline = f'<c r="B1" t="inlineStr"><is><t>{inline_text}</t></is></c>' if inline_text else ""
+    sheet = (f'<worksheet xmlns="{S_NS}"><sheetData><row r="1">'
+             f'<c r="A1" t="s"><v>0</v></c>{inline}</row></sheetData></worksheet>')
+    return write_zip(path, {
+        "[Content_Types].xml": "<Types/>",
+        "xl/sharedStrings.xml": f'<sst xmlns="{S_NS}">{items}</sst>',
+        "xl/worksheets/sheet1.xml": sheet,
+        "xl/styles.xml": "<styleSheet/>",
+    })
+
+
+def read_texts(data: bytes, part: str, tag: str):
+    from lxml import etree
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        root = etree.fromstring(zf.read(part))
+    return [t.text or "" for t in root.iter(tag)]
+
+
+def test_render_text_single_pass():
+    values = {"name": "{{date}}", "date": "2024"}
+    # 替換值中的佔位符不會再被替換，未提供值的佔位符保持原樣
+    assert render_text("{{name}}-{{date}}-{{other}}", values) == "{{date}}-2024-{{other}}"
+
+
+def test_substitute_text_nodes_across_runs():
+    class Node:
+        def __init__(self, text):
+            self.text = text
+
+    nodes = [Node("甲方：{{"), Node("cli"), Node("ent}} 與 {{date}}"), Node("。")]
+    changed = substitute_text_nodes(nodes, {"client": "王小明", "date": "2024-01-01"})
+    assert [n.text for n in nodes] == ["甲方：王小明", "", " 與 2024-01-01", "。"]
+    assert changed == nodes[:3]
+
+
+def test_docx_placeholder_split_across_runs(tmp_path):
+    path = make_docx(tmp_path / "t.docx", [["甲方：{{cli", "ent}}"], ["無佔位符"], ["{{date}}"]])
+    index = compile_template(path)
+    assert index["file_type"] == "docx"
+    assert index["fields"] == ["client", "date"]
+    assert index["locations"] == {"word/document.xml": {"0": ["client"], "2": ["date"]}}
+
+    data = render_to_bytes(path, index, {"client": "王小明", "date": "2024-01-01"})
+    texts = read_texts(data, "word/document.xml", template_engine.W_T)
+    assert texts == ["甲方：王小明", "", "無佔位符", "2024-01-01"]
+    # run 的格式保留，其他成員原樣複製
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.read("word/document.xml").count(b"<w:b/>") == 4
+        assert zf.read("word/media/image1.png") == b"\x89PNG fake image"
+
+
+def test_docx_missing_value_keeps_placeholder(tmp_path):
+    path = make_docx(tmp_path / "t.docx", [["{{a}}", " / ", "{{b}}"]])
+    index = compile_template(path)
+    data = render_to_bytes(path, index, {"a": "1"})
+    assert "".join(read_texts(data, "word/document.xml", template_engine.W_T)) == "1 / {{b}}"
+
+
+def test_xlsx_shared_and_inline_strings(tmp_path):
+    path = make_xlsx(tmp_path / "t.xlsx", [["{{na", "me}} 先生"], "固定文字", "{{amount}} 元"],
+                     inline_text="{{date}}")
+    index = compile_template(path)
+    assert index["file_type"] == "xlsx"
+    assert set(index["fields"]) == {"name", "amount", "date"}
+    assert index["locations"]["xl/sharedStrings.xml"] == {"0": ["name"], "2": ["amount"]}
+    assert index["locations"]["xl/worksheets/sheet1.xml"] == {"0": ["date"]}
+
+    data = render_to_bytes(path, index, {"name": "陳", "amount": "100", "date": "2024-01-01"})
+    assert read_texts(data, "xl/sharedStrings.xml", template_engine.S_T) == ["陳", " 先生", "固定文字", "100 元"]
+    assert read_texts(data, "xl/worksheets/sheet1.xml", template_engine.S_T) == ["2024-01-01"]
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.read("xl/styles.xml") == b"<styleSheet/>"
+
+
+def test_get_template_index_cached_on_disk(tmp_path):
+    path = make_docx(tmp_path / "t.docx", [["{{x}}"]])
+    index = get_template_index(path)
+    assert (template_engine.INDEX_DIR / f"{index['hash']}.json").exists()
+    template_engine._index_cache.clear()
+    assert get_template_index(path) == index
+
+
+def test_unsupported_file_type(tmp_path):
+    path = write_zip(tmp_path / "t.pptx", {"a.xml": "<a/>"})
+    with pytest.raises(ValueError):
+        compile_template(path)
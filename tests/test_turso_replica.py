@@ -0,0 +1,161 @@
+import pytest
+from libsql_client import LibsqlError
+
+from core.turso_client import TursoClientManager
+from core.turso_replica import LOCAL_ID_OFFSET, TursoReplica
+
+GROUP_SQL = "INSERT INTO template_groups (name, source_excel_path) VALUES (?, 'source.xlsx')"
+FIELD_SQL = "INSERT INTO field_definitions (group_id, name, sort_order) VALUES (?, ?, 0)"
+
+
+@pytest.fixture
+def remote(tmp_path):
+    manager = TursoClientManager(f"fake:///{tmp_path / 'remote.db'}", None)
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def make_replica(tmp_path):
+    replicas = []
+
+    def make(remote, name):
+        replica = TursoReplica(remote, tmp_path / f"{name}.db")
+        replicas.append(replica)
+        return replica
+
+    yield make
+    for replica in replicas:
+        replica.close()
+
+
+def remote_rows(remote, sql, args=None):
+    return [tuple(row) for row in remote.run(lambda client: client.execute(sql, args or [])).rows]
+
+
+def create_group(replica, name, fields=("f1", "f2")):
+    group_id = replica.execute_batch([(GROUP_SQL, [name])])[0].last_insert_rowid
+    replica.execute_batch([(FIELD_SQL, [group_id, field]) for field in fields])
+    return group_id
+
+
+class Unavailable:
+    """模擬雲端無法連線的 remote"""
+
+    def __init__(self, error=None):
+        self.error = error or ConnectionError("offline")
+
+    def run(self, func, timeout=None):
+        raise self.error
+
+
+def test_push_remaps_local_ids(remote, make_replica):
+    a, b = make_replica(remote, "a"), make_replica(remote, "b")
+    a.sync_once()
+    b.sync_once()
+
+    local_id = create_group(a, "報價單")
+    assert local_id >= LOCAL_ID_OFFSET
+    assert a.is_pending_id("template_groups", local_id)
+    assert a.status()['pending'] == 2  # 每個本地交易一筆待推送紀錄
+
+    assert a.sync_once()['pushed'] == 2
+    assert a.status()['pending'] == 0
+    remote_id = a.resolve_id("template_groups", local_id)
+    assert remote_id < LOCAL_ID_OFFSET
+    assert not a.is_pending_id("template_groups", local_id)
+    assert remote_rows(remote, "SELECT id, name FROM template_groups") == [(remote_id, "報價單")]
+    assert remote_rows(remote, "SELECT group_id, name FROM field_definitions ORDER BY id") == [
+        (remote_id, "f1"), (remote_id, "f2")]
+    # 本地資料列與子表外鍵都已改為雲端 ID；仍持有暫時 ID 的呼叫端可透過 id_args 查詢
+    assert a.query("SELECT id FROM template_groups") == [(remote_id,)]
+    assert a.query("SELECT DISTINCT group_id FROM field_definitions") == [(remote_id,)]
+    assert a.query("SELECT name FROM template_groups WHERE id = ?", [local_id], {0: "template_groups"}) == [("報價單",)]
+
+    b.sync_once()
+    assert b.query("SELECT id, name FROM template_groups") == [(remote_id, "報價單")]
+
+
+def test_journal_entries_referencing_local_ids(remote, make_replica):
+    a = make_replica(remote, "a")
+    a.sync_once()
+    group_id = a.execute_batch([(GROUP_SQL, ["g"])])[0].last_insert_rowid
+    a.execute_batch([("INSERT INTO template_files (group_id, filename, filepath, file_type) VALUES (?, 'a.docx', 'a', 'docx')",
+                      [group_id])])
+    a.execute_batch([("UPDATE template_groups SET source_excel_path = 'new.xlsx' WHERE id = ?", [group_id])])
+    a.sync_once()
+    assert remote_rows(remote, "SELECT g.source_excel_path, f.filename FROM template_files f "
+                               "JOIN template_groups g ON g.id = f.group_id") == [("new.xlsx", "a.docx")]
+
+
+def test_transport_error_keeps_journal(remote, make_replica):
+    a = make_replica(remote, "a")
+    a.sync_once()
+    create_group(a, "g")
+    a.remote = Unavailable(LibsqlError("Server returned HTTP status 503", "SERVER_ERROR"))
+    with pytest.raises(LibsqlError):
+        a.push()
+    assert a.status()['pending'] == 2  # 每個本地交易一筆待推送紀錄
+    assert a.status()['conflicts'] == 0
+
+    a.remote = remote
+    a.sync_once()
+    assert a.status()['pending'] == 0
+    assert remote_rows(remote, "SELECT name FROM template_groups") == [("g",)]
+
+
+def test_offline_writes_pushed_before_first_snapshot(remote, make_replica, tmp_path):
+    c = TursoReplica(Unavailable(), tmp_path / "c.db")
+    try:
+        with pytest.raises(ConnectionError):
+            c.sync_once()
+        create_group(c, "離線建立")
+        c.remote = remote
+        c.sync_once()
+        assert c.status()['pending'] == 0
+        assert c.query("SELECT name FROM template_groups") == [("離線建立",)]
+        assert remote_rows(remote, "SELECT COUNT(*) FROM field_definitions") == [(2,)]
+    finally:
+        c.close()
+
+
+def test_name_conflict_keeps_remote_version(remote, make_replica):
+    a, b = make_replica(remote, "a"), make_replica(remote, "b")
+    a.sync_once()
+    b.sync_once()
+    create_group(a, "重複")
+    local_b = create_group(b, "重複", fields=("other",))
+    a.sync_once()
+    b.sync_once()
+
+    status = b.status()
+    assert status['pending'] == 0
+    assert status['conflicts'] == 1
+    conflict = b.conflicts()[0]
+    assert conflict['reason']
+    # 以雲端為準：B 的本地資料列被雲端版本取代
+    assert b.query("SELECT f.name FROM template_groups g JOIN field_definitions f ON f.group_id = g.id "
+                   "WHERE g.name = '重複' ORDER BY f.id") == [("f1",), ("f2",)]
+    assert b.is_pending_id("template_groups", local_b)
+    assert remote_rows(remote, "SELECT COUNT(*) FROM template_groups") == [(1,)]
+
+    b.clear_conflicts()
+    assert b.status()['conflicts'] == 0
+
+
+def test_remote_update_overrides_pending_local_update(remote, make_replica):
+    a, b = make_replica(remote, "a"), make_replica(remote, "b")
+    a.sync_once()
+    local_id = create_group(a, "g")
+    a.sync_once()
+    group_id = a.resolve_id("template_groups", local_id)
+    b.sync_once()
+
+    a.execute_batch([("UPDATE template_groups SET source_excel_path = 'from_a.xlsx' WHERE id = ?", [group_id])])
+    a.sync_once()
+    b.execute_batch([("UPDATE template_groups SET source_excel_path = 'from_b.xlsx' WHERE id = ?", [group_id])])
+    b.sync_once()
+
+    assert b.status()['conflicts'] == 1
+    assert b.query("SELECT source_excel_path FROM template_groups") == [("from_a.xlsx",)]
+    assert remote_rows(remote, "SELECT source_excel_path FROM template_groups") == [("from_a.xlsx",)]
@@ -0,0 +1,74 @@
+import sys
+
+import pytest
+
+from core.pdf_annotation_system import PDFAnnotationSystem, _prefix_upper_bound
+
+
+@pytest.fixture
+def system(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pas = PDFAnnotationSystem(str(tmp_path / "annotations.db"))
+    with pas._connection() as conn:
+        pas.template_id = conn.execute("INSERT INTO templates (name, total_pages) VALUES ('範本', 1)").lastrowid
+    yield pas
+    pas.close()
+
+
+def annotation(name, sample_value=""):
+    return {'page_number': 1, 'variable_name': name, 'variable_type': 'text',
+            'coordinates': (0, 0, 10, 10), 'sample_value': sample_value}
+
+
+def usage(pas):
+    return {item['variable_name']: (item['usage_count'], item['sample_values']) for item in pas.get_variable_database()}
+
+
+def test_usage_and_sample_counts(system):
+    system.save_annotations(system.template_id, [
+        annotation("客戶名稱", "王小明"), annotation("客戶名稱", "王小明"), annotation("客戶名稱", "陳大文"),
+        annotation("日期"),
+    ])
+    assert usage(system) == {"客戶名稱": (3, ["王小明", "陳大文"]), "日期": (1, [])}
+    samples = system.suggest_sample_values("王", "客戶名稱")
+    assert [(s['value'], s['count']) for s in samples] == [("王小明", 2)]
+
+
+def test_update_moves_counts_only_when_changed(system):
+    first, second = system.save_annotations(system.template_id, [
+        annotation("客戶名稱", "王小明"), annotation("日期", "2024"),
+    ])
+    # 只移動座標：計數不變
+    system.update_annotations([dict(annotation("客戶名稱", "王小明"), id=first, coordinates=(5, 5, 20, 20))])
+    assert usage(system)["客戶名稱"] == (1, ["王小明"])
+
+    system.update_annotations([dict(annotation("負責人", "陳大文"), id=first)])
+    assert usage(system) == {"日期": (1, ["2024"]), "負責人": (1, ["陳大文"]), "客戶名稱": (0, [])}
+
+
+def test_delete_releases_counts(system):
+    first, _ = system.save_annotations(system.template_id, [
+        annotation("客戶名稱", "王小明"), annotation("客戶名稱", "王小明"),
+    ])
+    system.delete_annotation(first)
+    assert usage(system)["客戶名稱"] == (1, ["王小明"])
+
+    system.delete_template(system.template_id, 1)
+    assert usage(system)["客戶名稱"] == (0, [])
+
+
+def test_suggest_variable_names_by_prefix(system):
+    system.save_annotations(system.template_id, [
+        annotation("客戶地址"), annotation("客戶名稱"), annotation("客戶名稱"), annotation("日期"),
+    ])
+    assert [s['variable_name'] for s in system.suggest_variable_names("客戶")] == ["客戶名稱", "客戶地址"]
+    assert [s['variable_name'] for s in system.suggest_variable_names("")][:1] == ["客戶名稱"]
+    assert system.suggest_variable_names("不存在") == []
+
+
+def test_prefix_upper_bound():
+    assert _prefix_upper_bound("ab") == "ac"
+    assert _prefix_upper_bound("a" + chr(sys.maxunicode)) == "b"
+    assert _prefix_upper_bound(chr(sys.maxunicode)) is None
+    # 代理字元無法編碼，跳到代理區之後
+    assert _prefix_upper_bound("\ud7ff") == "\ue000"
@@ -112,8 +112,8 @@ def get_storage_stats():
     """
     try:
         # 嘗試獲取雲端資料庫統計
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         
         if turso_db.is_cloud_mode():
             # 雲端模式：顯示 Turso 資料庫統計
@@ -135,14 +135,10 @@ def get_cloud_storage_stats(turso_db):
         comparison_size = sum(template.get('file_size', 0) for template in comparison_templates)
         comparison_size_mb = round(comparison_size / (1024 * 1024), 2)
         
-        # 獲取智能生成範本統計
-        template_groups = turso_db.get_all_template_groups_cloud()
-        template_files = []
-        for group in template_groups:
-            files = turso_db.get_template_files_cloud(group['id'])
-            template_files.extend(files)
-        
-        generation_size = sum(file.get('file_size', 0) for file in template_files)
+        # 獲取智能生成範本統計（群組、檔案數量與大小以單次批次查詢）
+        template_groups = turso_db.get_template_groups_summary_cloud()
+        generation_file_count = sum(group['file_count'] for group in template_groups)
+        generation_size = sum(group['total_size'] or 0 for group in template_groups)
         generation_size_mb = round(generation_size / (1024 * 1024), 2)
         
         # 計算總容量
@@ -179,7 +175,7 @@ def get_cloud_storage_stats(turso_db):
             'template_usage': {
                 "智能生成範本": {
                     'size_mb': generation_size_mb,
-                    'file_count': len(template_files)
+                    'file_count': generation_file_count
                 },
                 "比對範本": {
                     'size_mb': comparison_size_mb,
@@ -62,12 +62,21 @@ def show_turso_status_card():
     """
     顯示整合的 Turso 狀態卡片，包含所有相關狀態
     """
-    from core.turso_database import TursoDatabase
+    from core.resources import get_turso_database
     
     try:
-        turso_db = TursoDatabase()
+        turso_db = get_turso_database()
         # 靜默檢查狀態，不觸發任何訊息顯示
-        if turso_db.is_configured():
+        if turso_db.is_configured() and turso_db.remote_stats()['state'] == "open":
+            st.markdown(f"""
+            <div class="status-card warning-dark">
+                <div class="content">
+                    <span>⚠️</span>
+                    <span>雲端暫時無法連線 | 顯示本地資料庫內容，變更暫時無法儲存，稍後自動重試</span>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+        elif turso_db.is_configured():
             # 整合所有成功狀態
             status_messages = [
                 "✅ Turso 配置正確，已準備連接雲端資料庫",
@@ -97,6 +106,8 @@ def show_turso_status_card():
                 </div>
             </div>
             """, unsafe_allow_html=True)
+        if turso_db.is_configured():
+            show_replica_conflicts(turso_db)
     except Exception:
         st.markdown(f"""
         <div class="status-card warning-dark">
@@ -105,4 +116,20 @@ def show_turso_status_card():
                 <span>雲端連接狀態未知</span>
             </div>
         </div>
-        """, unsafe_allow_html=True)
\ No newline at end of file
+        """, unsafe_allow_html=True)
+
+def show_replica_conflicts(turso_db):
+    """
+    顯示本地副本的同步衝突：本地已儲存、但因與雲端資料衝突而被雲端版本取代的變更
+    """
+    status = turso_db.replica_status()
+    if not status or not status['conflicts']:
+        return
+    st.warning(f"⚠️ 有 {status['conflicts']} 筆本地變更與雲端資料衝突，已改用雲端版本，請確認資料後重新儲存")
+    with st.expander("衝突明細"):
+        for conflict in turso_db.replica_conflicts():
+            tables = sorted({change[0] for change in conflict['changes']})
+            st.write(f"{conflict['resolved_at']}｜{', '.join(tables)}｜{conflict['reason']}")
+        if st.button("我知道了", key="clear_replica_conflicts"):
+            turso_db.clear_replica_conflicts()
+            st.rerun()
\ No newline at end of file
@@ -92,8 +92,8 @@ def save_comparison_template(name: str, description: str, uploaded_file, file_ty
             conn.commit()
         
         # 檢查是否為雲端模式
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         
         if turso_db.is_cloud_mode():
             st.success("✅ 範本已成功保存到雲端資料庫")
@@ -132,8 +132,8 @@ def get_comparison_templates() -> list:
                 templates.append(template)
             
             # 檢查是否為雲端模式
-            from core.turso_database import TursoDatabase
-            turso_db = TursoDatabase()
+            from core.resources import get_turso_database
+            turso_db = get_turso_database()
             
             if turso_db.is_cloud_mode():
                 st.info(f"☁️ 雲端範本數量: {len(templates)}")
@@ -174,11 +174,10 @@ def delete_comparison_template(template_id: int) -> bool:
 def get_comparison_templates_cloud():
     """從雲端獲取比對範本"""
     try:
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         
         if turso_db.is_cloud_mode():
-            turso_db.create_tables()
             return turso_db.get_comparison_templates()
         else:
             return get_comparison_templates()
@@ -189,11 +188,10 @@ def get_comparison_templates_cloud():
 def save_comparison_template_cloud(name: str, filename: str, filepath: str, file_type: str, file_size: int) -> int:
     """保存比對範本到雲端"""
     try:
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         
         if turso_db.is_cloud_mode():
-            turso_db.create_tables()
             return turso_db.save_comparison_template(name, filename, filepath, file_type, file_size)
         else:
             return save_comparison_template(name, filename, filepath, file_type, file_size)
@@ -204,11 +202,10 @@ def save_comparison_template_cloud(name: str, filename: str, filepath: str, file
 def delete_comparison_template_cloud(template_id: int) -> bool:
     """從雲端刪除比對範本"""
     try:
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         
         if turso_db.is_cloud_mode():
-            turso_db.create_tables()
             return turso_db.delete_comparison_template(template_id)
         else:
             return delete_comparison_template(template_id)
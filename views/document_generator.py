@@ -7,11 +7,14 @@ from datetime import datetime
 from core.database import (
     create_template_group, get_all_template_groups, get_template_files,
     get_field_definitions, update_field_definitions, delete_template_group,
-    delete_template_file
+    delete_template_file, add_template_file, get_template_groups_summary
 )
 from core.file_handler import (
-    parse_excel_fields, save_uploaded_file, get_file_type, generate_document
+    parse_excel_fields, save_uploaded_file, get_file_type, render_document
 )
+from core.template_inventory import extract_inventory, build_coverage_matrix, templates_using_fields
+from core.batch_generator import load_batch_rows, generate_batch
+from core.render_cache import get_render_cache
 from utils.ui_components import show_turso_status_card
 
 # --- 常數設定 ---
@@ -30,6 +33,16 @@ def initialize_app():
     if 'confirmation_data' not in st.session_state:
         st.session_state.confirmation_data = None
 
+def compile_uploaded_template(file_path):
+    """上傳時預先編譯範本的佔位符索引，並回傳要存入資料庫的佔位符清單"""
+    try:
+        inventory = extract_inventory(file_path)
+        st.info(f"🧩 已建立範本索引：{os.path.basename(file_path)}（{len(inventory['placeholders'])} 個佔位符）")
+        return inventory
+    except Exception as e:
+        st.warning(f"⚠️ 範本索引建立失敗，將於生成時重新編譯：{str(e)}")
+        return {}
+
 # --- UI 渲染函式 ---
 
 def render_creation_tab():
@@ -87,11 +100,13 @@ def render_creation_tab():
                             try:
                                 st.info(f"正在處理第 {i+1} 個檔案：{template_file.name}")
                                 file_path = save_uploaded_file(template_file, UPLOAD_DIR)
+                                inventory = compile_uploaded_template(file_path)
                                 saved_files.append({
                                     'filename': template_file.name,
                                     'filepath': file_path,
                                     'file_type': get_file_type(file_path),
-                                    'file_size': os.path.getsize(file_path)
+                                    'file_size': os.path.getsize(file_path),
+                                    **inventory
                                 })
                                 st.success(f"✅ 範本檔案已成功保存：{template_file.name}")
                             except Exception as e:
@@ -112,12 +127,10 @@ def render_creation_tab():
                             
                             st.info("☁️ 正在嘗試預上傳到雲端資料庫...")
                             try:
-                                from core.turso_database import TursoDatabase
-                                turso_db = TursoDatabase()
+                                from core.resources import get_turso_database
+                                turso_db = get_turso_database()
                                 
                                 if turso_db.is_cloud_mode():
-                                    st.info("🔧 正在創建雲端表格...")
-                                    turso_db.create_tables()
                                     st.info("🔧 正在預上傳範本群組到雲端...")
                                     
                                     # 詳細顯示上傳過程
@@ -140,16 +153,19 @@ def render_creation_tab():
                                         cloud_group_id = group_id
                                         st.success(f"✅ 雲端預上傳成功！群組ID：{group_id}")
                                         
-                                        # 驗證範本檔案是否真的上傳成功
-                                        st.info("🔍 正在驗證範本檔案上傳狀態...")
-                                        uploaded_files = turso_db.get_template_files_cloud(group_id)
-                                        if uploaded_files:
-                                            st.success(f"✅ 驗證成功！雲端共有 {len(uploaded_files)} 個範本檔案")
-                                            for file_info in uploaded_files:
-                                                st.info(f"  📎 {file_info['filename']}")
+                                        # 驗證範本檔案是否真的上傳成功；使用本地副本且尚未推送時，雲端還沒有這個群組，不做驗證
+                                        if turso_db.is_pending_id("template_groups", group_id):
+                                            st.info("☁️ 已儲存於本地副本，將在背景同步到雲端")
                                         else:
-                                            st.warning("⚠️ 警告：雲端沒有找到範本檔案，可能上傳失敗")
-                                            upload_errors.append("範本檔案上傳失敗")
+                                            st.info("🔍 正在驗證範本檔案上傳狀態...")
+                                            uploaded_files = turso_db.get_template_files_cloud(group_id)
+                                            if uploaded_files:
+                                                st.success(f"✅ 驗證成功！雲端共有 {len(uploaded_files)} 個範本檔案")
+                                                for file_info in uploaded_files:
+                                                    st.info(f"  📎 {file_info['filename']}")
+                                            else:
+                                                st.warning("⚠️ 警告：雲端沒有找到範本檔案，可能上傳失敗")
+                                                upload_errors.append("範本檔案上傳失敗")
                                     else:
                                         st.error(f"❌ 雲端預上傳失敗，返回的群組ID為：{group_id}")
                                         upload_errors.append(f"群組創建失敗，返回ID：{group_id}")
@@ -252,11 +268,10 @@ def render_generation_tab():
     
     # 優先使用雲端資料庫
     try:
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         
         if turso_db.is_cloud_mode():
-            turso_db.create_tables()
             template_groups = turso_db.get_all_template_groups_cloud()
         else:
             template_groups = get_all_template_groups()
@@ -327,7 +342,33 @@ def render_generation_tab():
                             value=default_value
                         )
 
-                submitted = st.form_submit_button("🚀 生成文件", type="primary")
+                col_single, col_group = st.columns(2)
+                with col_single:
+                    submitted = st.form_submit_button("🚀 生成文件", type="primary")
+                with col_group:
+                    group_submitted = st.form_submit_button("📦 生成整組文件 (ZIP)")
+
+                if group_submitted:
+                    available_files = [f for f in template_files if os.path.exists(f['filepath'])]
+                    # 依上傳時記錄的佔位符清單，略過沒有使用任何已填欄位的範本
+                    submitted_fields = [name for name, value in field_values.items() if str(value).strip()]
+                    used_files = templates_using_fields(available_files, submitted_fields)
+                    skipped = [f['filename'] for f in available_files if f not in used_files]
+                    if skipped:
+                        st.info(f"ℹ️ 以下範本未使用任何已填寫的欄位，已略過：{', '.join(skipped)}")
+                    template_paths = [f['filepath'] for f in used_files]
+                    if not template_paths:
+                        st.error("此群組沒有可用的範本檔案。")
+                    else:
+                        try:
+                            result = generate_batch(template_paths, [field_values], field_definitions, max_workers=1)
+                            if result['files']:
+                                st.session_state.generated_archive_path = result['archive_path']
+                                st.success(f"✅ 已生成 {len(result['files'])} 份文件並打包為 ZIP")
+                            for error in result['errors']:
+                                st.error(f"❌ {error['template']}：{error['error']}")
+                        except Exception as e:
+                            st.error(f"生成文件時發生錯誤：{str(e)}")
 
                 if submitted:
                     try:
@@ -342,14 +383,15 @@ def render_generation_tab():
                             st.error(f"範本檔案不存在：{file_path}")
                             return
 
-                        # 生成文件
-                        generated_path = generate_document(file_path, field_values)
+                        # 在記憶體中生成文件，直接交給下載按鈕
+                        generated = render_document(file_path, field_values)
                         
-                        if generated_path:
-                            # 保存生成的文件路徑到session_state
-                            st.session_state.generated_file_path = generated_path
-                            st.session_state.generated_file_name = os.path.basename(generated_path)
-                            st.success(f"✅ 文件已成功生成！檔案名稱：{os.path.basename(generated_path)}")
+                        if generated:
+                            base_name, ext = os.path.splitext(selected_file['filename'])
+                            generated_name = f"{base_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+                            st.session_state.generated_file_data = generated.getvalue()
+                            st.session_state.generated_file_name = generated_name
+                            st.success(f"✅ 文件已成功生成！檔案名稱：{generated_name}")
                         else:
                             st.error("❌ 文件生成失敗")
 
@@ -357,60 +399,169 @@ def render_generation_tab():
                         st.error(f"生成文件時發生錯誤：{str(e)}")
             
             # 表單外部的下載按鈕
-            if 'generated_file_path' in st.session_state and os.path.exists(st.session_state.generated_file_path):
+            if 'generated_file_data' in st.session_state:
                 st.markdown("---")
                 st.subheader("📥 下載生成的文件")
                 
-                with open(st.session_state.generated_file_path, "rb") as file:
-                    st.download_button(
-                        label="📥 下載生成的文件",
-                        data=file.read(),
-                        file_name=st.session_state.generated_file_name,
-                        mime="application/octet-stream",
-                        key="download_generated_file"
-                    )
+                st.download_button(
+                    label="📥 下載生成的文件",
+                    data=st.session_state.generated_file_data,
+                    file_name=st.session_state.generated_file_name,
+                    mime="application/octet-stream",
+                    key="download_generated_file"
+                )
+
+                cache_stats = get_render_cache().stats()
+                st.caption(
+                    f"渲染快取：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次，"
+                    f"已使用 {cache_stats['bytes'] / 1024 / 1024:.1f} MB / {cache_stats['max_bytes'] / 1024 / 1024:.0f} MB"
+                )
                 
                 # 清除session_state
                 if st.button("🗑️ 清除生成記錄", key="clear_generated"):
-                    del st.session_state.generated_file_path
+                    del st.session_state.generated_file_data
                     del st.session_state.generated_file_name
                     st.rerun()
 
+            if 'generated_archive_path' in st.session_state and os.path.exists(st.session_state.generated_archive_path):
+                st.markdown("---")
+                st.subheader("📦 下載整組文件")
+                render_archive_download(st.session_state.generated_archive_path, "download_group_archive")
+
+            # 批次生成（合併列印）
+            render_batch_generation(selected_group_id, template_files, field_definitions)
+
+def render_archive_download(archive_path, key):
+    """提供單一 ZIP 壓縮檔下載（直接傳入檔案物件，不另外複製內容）"""
+    with open(archive_path, "rb") as archive:
+        st.download_button(
+            label="📥 下載 ZIP 壓縮檔",
+            data=archive,
+            file_name=os.path.basename(archive_path),
+            mime="application/zip",
+            key=key
+        )
+
+def render_batch_generation(group_id, template_files, field_definitions):
+    """渲染批次生成（合併列印）介面：資料表的每一列 × 群組內每個範本各生成一份文件"""
+    st.markdown("---")
+    st.subheader("4. 批次生成（合併列印）")
+
+    with st.expander("📦 上傳資料表，一次生成多份文件"):
+        field_names = [field['name'] for field in field_definitions]
+        st.info("資料表第一列為欄位名稱（需與範本欄位相同），其後每一列會生成一組文件；空白儲存格使用預設值。")
+
+        data_file = st.file_uploader("上傳批次資料表 (Excel/CSV)", type=['xlsx', 'csv'], key=f"batch_data_{group_id}")
+        default_pattern = f"{{{{{field_names[0]}}}}}" if field_names else ""
+        filename_pattern = st.text_input(
+            "輸出檔名格式",
+            value=default_pattern,
+            key=f"batch_pattern_{group_id}",
+            help="可使用 {{欄位名稱}}，例如 {{客戶名稱}}_{{日期}}；群組內有多個範本時會自動加上範本名稱"
+        )
+
+        if data_file and st.button("📦 開始批次生成", key=f"batch_generate_{group_id}", type="primary"):
+            try:
+                rows = load_batch_rows(data_file)
+            except Exception as e:
+                st.error(f"無法讀取資料表：{str(e)}")
+                return
+
+            if not rows:
+                st.warning("資料表中沒有任何資料列。")
+                return
+
+            unknown_columns = [column for column in rows[0] if column not in field_names]
+            if unknown_columns:
+                st.warning(f"⚠️ 以下欄位不在範本定義中，將被忽略：{', '.join(unknown_columns)}")
+
+            template_paths = [f['filepath'] for f in template_files if os.path.exists(f['filepath'])]
+            missing = [f['filename'] for f in template_files if not os.path.exists(f['filepath'])]
+            if missing:
+                st.warning(f"⚠️ 找不到以下範本檔案，將略過：{', '.join(missing)}")
+            if not template_paths:
+                st.error("沒有可用的範本檔案。")
+                return
+
+            progress = st.progress(0, text=f"準備生成 {len(rows) * len(template_paths)} 份文件...")
+
+            def update_progress(done, total, filename):
+                progress.progress(done / total, text=f"已完成 {done}/{total}：{filename}")
+
+            try:
+                result = generate_batch(
+                    template_paths, rows, field_definitions,
+                    filename_pattern=filename_pattern,
+                    progress_callback=update_progress
+                )
+            except Exception as e:
+                st.error(f"批次生成時發生錯誤：{str(e)}")
+                return
+
+            st.session_state.batch_result = dict(result, group_id=group_id)
+
+        result = st.session_state.get('batch_result')
+        if result and result.get('group_id') == group_id:
+            st.success(f"✅ 批次生成完成：成功 {len(result['files'])} 份，共 {result['total']} 份")
+            if result['files'] and os.path.exists(result['archive_path']):
+                render_archive_download(result['archive_path'], f"download_batch_archive_{group_id}")
+            if result['errors']:
+                st.error(f"❌ {len(result['errors'])} 份生成失敗：")
+                for error in result['errors']:
+                    st.error(f"  • 第 {error['row']} 列 / {error['template']}：{error['error']}")
+
+def render_coverage_matrix(group_id, template_files, turso_db):
+    """顯示「欄位 × 範本」對照表，並標示範本中未定義的佔位符"""
+    st.markdown("### 🧩 欄位使用對照")
+    try:
+        if turso_db.is_cloud_mode():
+            field_definitions = turso_db.get_field_definitions_cloud(group_id)
+        else:
+            field_definitions = get_field_definitions(group_id)
+        coverage = build_coverage_matrix(field_definitions, template_files)
+    except Exception as e:
+        st.warning(f"無法建立欄位對照表：{str(e)}")
+        return
+
+    if coverage['fields'] and coverage['templates']:
+        matrix_df = pd.DataFrame(
+            [["✅" if coverage['matrix'][name][template] else "" for template in coverage['templates']]
+             for name in coverage['fields']],
+            index=coverage['fields'],
+            columns=coverage['templates']
+        )
+        st.dataframe(matrix_df, use_container_width=True)
+
+    for template, names in coverage['undefined'].items():
+        st.warning(f"⚠️ {template} 含有未定義的佔位符：{', '.join('{{' + name + '}}' for name in names)}")
+    if coverage['unused']:
+        st.info(f"ℹ️ 沒有任何範本使用的欄位：{', '.join(coverage['unused'])}")
+    if coverage['unknown']:
+        st.info(f"ℹ️ 無法讀取佔位符清單的範本：{', '.join(coverage['unknown'])}")
+
 def render_management_tab():
     """渲染範本管理介面"""
     st.subheader("📋 範本管理")
     
     # 獲取範本群組
     try:
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         
         if turso_db.is_cloud_mode():
-            turso_db.create_tables()
-            template_groups = turso_db.get_all_template_groups_cloud()
+            template_groups = turso_db.get_template_groups_summary_cloud()
         else:
-            template_groups = get_all_template_groups()
+            template_groups = get_template_groups_summary()
     except Exception as e:
         st.warning(f"雲端連接失敗，使用本地資料庫：{str(e)}")
-        template_groups = get_all_template_groups()
+        template_groups = get_template_groups_summary()
     
     if not template_groups:
         st.info("尚未建立任何範本群組。")
         return
 
-    # 創建群組選項
-    group_options = {}
-    for group in template_groups:
-        try:
-            if turso_db.is_cloud_mode():
-                files = turso_db.get_template_files_cloud(group['id'])
-            else:
-                files = get_template_files(group['id'])
-            file_count = len(files) if files else 0
-        except Exception as e:
-            file_count = 0
-        
-        group_options[group['id']] = f"{group['name']} ({file_count} 個檔案)"
+    # 創建群組選項（檔案數量已隨群組一併查詢）
+    group_options = {group['id']: f"{group['name']} ({group['file_count']} 個檔案)" for group in template_groups}
     
     # 群組選擇下拉式選單
     selected_group_id = st.selectbox(
@@ -520,6 +671,8 @@ def render_management_tab():
                                 except Exception as e:
                                     st.error(f"下載檔案時發生錯誤：{str(e)}")
                     
+                    render_coverage_matrix(selected_group_id, template_files, turso_db)
+                    
                     st.markdown("---")
                     
                     # 新增範本檔案
@@ -538,13 +691,15 @@ def render_management_tab():
                                 for uploaded_file in uploaded_files:
                                     # 保存檔案
                                     file_path = save_uploaded_file(uploaded_file, UPLOAD_DIR)
+                                    inventory = compile_uploaded_template(file_path)
                                     
                                     # 添加到資料庫
                                     file_info = {
                                         'filename': uploaded_file.name,
                                         'filepath': file_path,
                                         'file_type': get_file_type(file_path),
-                                        'file_size': os.path.getsize(file_path)
+                                        'file_size': os.path.getsize(file_path),
+                                        **inventory
                                     }
                                     
                                     if turso_db.is_cloud_mode():
@@ -583,13 +738,15 @@ def render_management_tab():
                                 for uploaded_file in uploaded_files:
                                     # 保存檔案
                                     file_path = save_uploaded_file(uploaded_file, UPLOAD_DIR)
+                                    inventory = compile_uploaded_template(file_path)
                                     
                                     # 添加到資料庫
                                     file_info = {
                                         'filename': uploaded_file.name,
                                         'filepath': file_path,
                                         'file_type': get_file_type(file_path),
-                                        'file_size': os.path.getsize(file_path)
+                                        'file_size': os.path.getsize(file_path),
+                                        **inventory
                                     }
                                     
                                     if turso_db.is_cloud_mode():
@@ -732,8 +889,8 @@ def handle_final_creation(data, final_fields):
     try:
         # 只使用雲端資料庫
         try:
-            from core.turso_database import TursoDatabase
-            turso_db = TursoDatabase()
+            from core.resources import get_turso_database
+            turso_db = get_turso_database()
             
             if not turso_db.is_cloud_mode():
                 st.error("❌ 雲端資料庫未配置，無法保存範本")
@@ -751,8 +908,6 @@ def handle_final_creation(data, final_fields):
             
             # 創建到雲端
             try:
-                st.info("🔧 正在創建雲端表格...")
-                turso_db.create_tables()
                 st.info("🔧 正在創建範本群組到雲端...")
                 group_id = turso_db.create_template_group_cloud(
                     name=data['group_name'],
@@ -791,7 +946,13 @@ def handle_final_creation(data, final_fields):
 def handle_final_update(data, final_fields):
     """處理最終的欄位更新邏輯"""
     try:
-        if update_field_definitions(data['group_id'], final_fields):
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
+        if turso_db.is_cloud_mode():
+            success = turso_db.update_field_definitions_cloud(data['group_id'], final_fields)
+        else:
+            success = update_field_definitions(data['group_id'], final_fields)
+        if success:
             st.success(f"範本群組 '{data['group_name']}' 的欄位已成功更新！")
         else:
             st.error("更新欄位時發生錯誤。")
@@ -5,7 +5,7 @@ from datetime import datetime
 
 # --- 核心模組導入 ---
 from core.database import (
-    get_all_template_groups, get_template_files, get_field_definitions,
+    get_template_groups_summary, get_template_files, get_field_definitions,
     delete_template_group, delete_template_file, add_template_file
 )
 from utils.ui_components import show_turso_status_card
@@ -32,17 +32,16 @@ def show_template_manager():
     
     # 獲取範本群組
     try:
-        from core.turso_database import TursoDatabase
-        turso_db = TursoDatabase()
+        from core.resources import get_turso_database
+        turso_db = get_turso_database()
         
         if turso_db.is_cloud_mode():
-            turso_db.create_tables()
-            template_groups = turso_db.get_all_template_groups_cloud()
+            template_groups = turso_db.get_template_groups_summary_cloud()
         else:
-            template_groups = get_all_template_groups()
+            template_groups = get_template_groups_summary()
     except Exception as e:
         st.warning(f"雲端連接失敗，使用本地資料庫：{str(e)}")
-        template_groups = get_all_template_groups()
+        template_groups = get_template_groups_summary()
     
     if not template_groups:
         st.info("尚未建立任何範本群組。")
@@ -59,18 +58,9 @@ def show_template_manager():
                 st.write(f"**建立時間**：{group.get('created_at', '未知')}")
                 st.write(f"**來源檔案**：{group.get('source_excel_path', '未知')}")
                 
-                # 計算群組容量
-                try:
-                    if turso_db.is_cloud_mode():
-                        template_files = turso_db.get_template_files_cloud(group['id'])
-                    else:
-                        template_files = get_template_files(group['id'])
-                    
-                    total_size = sum(f.get('file_size', 0) for f in template_files)
-                    total_size_mb = total_size / (1024 * 1024)
-                    st.write(f"**群組容量**：{total_size_mb:.2f} MB ({len(template_files)} 個檔案)")
-                except Exception as e:
-                    st.warning(f"無法獲取檔案資訊：{str(e)}")
+                # 群組容量（已隨群組一併查詢）
+                total_size_mb = (group['total_size'] or 0) / (1024 * 1024)
+                st.write(f"**群組容量**：{total_size_mb:.2f} MB ({group['file_count']} 個檔案)")
             
             with col2:
                 if st.button("🗑️ 刪除群組", key=f"delete_group_{group['id']}"):